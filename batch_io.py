@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+离线批量推理的请求/结果文件（OpenAI 兼容 Batch 格式，百炼 Batch 接口同样接受）
+- 请求行：{"custom_id", "method": "POST", "url": "/v1/chat/completions", "body": {model, messages, temperature}}
+- 结果行：{"custom_id", "response": {"status_code", "body": {"choices": [{"message": {"content"}}]}}, "error"}
+- custom_id = block_id + 原文哈希前 16 位：原文变化后旧结果自动失配，不会写到新原文上；
+  请求行的 custom_id 末尾再带上写请求时选的模型（“@qwen-plus”），结果行原样带回，
+  导入时按它记录审核点的模型，不在导入时重新路由（路由历史在写请求之后可能已变）
+- fulfil_batch_file：本地替身，用 mock 模型逐行生成结果文件，离线即可走通完整流程
+用法：python batch_io.py fulfil batch_requests.jsonl batch_results.jsonl
+"""
+import json
+import re
+import sys
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+BATCH_URL = "/v1/chat/completions"
+CUSTOM_ID_SEP = "#"
+CUSTOM_ID_HASH_CHARS = 16
+CUSTOM_ID_MODEL_SEP = "@"
+
+
+def make_custom_id(block_id: str, block_hash: str) -> str:
+    return f"{block_id}{CUSTOM_ID_SEP}{block_hash[:CUSTOM_ID_HASH_CHARS]}"
+
+
+def parse_custom_id(custom_id: str) -> Tuple[str, str]:
+    block_id, _, hash_prefix = custom_id.rpartition(CUSTOM_ID_SEP)
+    return block_id, hash_prefix
+
+
+def build_batch_request(custom_id: str, model: str, system_prompt: str, user_text: str,
+                        temperature: float) -> Dict:
+    return {
+        "custom_id": f"{custom_id}{CUSTOM_ID_MODEL_SEP}{model}",
+        "method": "POST",
+        "url": BATCH_URL,
+        "body": {
+            "model": model,
+            "temperature": temperature,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_text},
+            ],
+        },
+    }
+
+
+def write_batch_requests(path: Path, requests: List[Dict]):
+    with open(path, "w", encoding="utf-8") as f:
+        for request in requests:
+            f.write(json.dumps(request, ensure_ascii=False) + "\n")
+
+
+def iter_jsonl(path: Path) -> Iterator[Dict]:
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def split_model(tagged_id: str) -> Tuple[str, Optional[str]]:
+    """“block#hash@qwen-plus” → (“block#hash”, “qwen-plus”)；旧格式（不带模型）的 custom_id 模型为 None"""
+    custom_id, sep, model = tagged_id.rpartition(CUSTOM_ID_MODEL_SEP)
+    if not sep or CUSTOM_ID_SEP in model:
+        return tagged_id, None
+    return custom_id, model
+
+
+def read_batch_results(path: Path) -> Dict[str, Tuple[Optional[str], Optional[str]]]:
+    """{custom_id: (写请求时选的模型, 回复文本)}；失败的请求回复文本为 None"""
+    results: Dict[str, Tuple[Optional[str], Optional[str]]] = {}
+    for record in iter_jsonl(path):
+        custom_id, model = split_model(record["custom_id"])
+        response = record.get("response") or {}
+        if record.get("error") or response.get("status_code") != 200:
+            results[custom_id] = (model, None)
+            continue
+        choices = (response.get("body") or {}).get("choices") or []
+        results[custom_id] = (model, choices[0]["message"]["content"] if choices else None)
+    return results
+
+
+# ================== 本地替身 ==================
+PACK_MARKER_RE = re.compile(r"【block_id=(.+?) \| section_id=.*?】")
+
+
+def mock_points(text: str) -> List[Dict]:
+    sentences = [s.strip() for s in re.split(r"[。；\n]", text) if len(s.strip()) >= 5]
+    return [{
+        "type": "required" if i == 0 else "recommended",
+        "question": f"是否{sentence[:30]}？",
+        "evidence": sentence[:60],
+    } for i, sentence in enumerate(sentences[:2])]
+
+
+def mock_review_model(model: str, messages: List[Dict]) -> str:
+    """确定性的 mock 模型：从用户输入的原文里取前两句，生成格式合法的审核点；
+    打包输入（带【block_id=… | section_id=…】标记）按块分别生成并带 source_block_id"""
+    text = messages[-1]["content"].split("\n", 1)[-1]
+    parts = PACK_MARKER_RE.split(text)
+    if len(parts) == 1:
+        return json.dumps({"review_points": mock_points(text)}, ensure_ascii=False)
+    points = [dict(point, source_block_id=block_id)
+              for block_id, block_text in zip(parts[1::2], parts[2::2]) for point in mock_points(block_text)]
+    return json.dumps({"review_points": points}, ensure_ascii=False)
+
+
+def fulfil_batch_file(request_path: Path, result_path: Path,
+                      responder: Callable[[str, List[Dict]], str] = mock_review_model) -> int:
+    """逐行“执行”请求文件并写出结果文件，返回处理的请求数"""
+    count = 0
+    with open(result_path, "w", encoding="utf-8") as out:
+        for request in iter_jsonl(request_path):
+            body = request["body"]
+            content = responder(body["model"], body["messages"])
+            out.write(json.dumps({
+                "id": f"batch_req_{count}",
+                "custom_id": request["custom_id"],
+                "response": {"status_code": 200, "body": {
+                    "model": body["model"],
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": content}}],
+                }},
+                "error": None,
+            }, ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] != "fulfil":
+        raise SystemExit("用法：python batch_io.py fulfil <请求文件> <结果文件>")
+    n = fulfil_batch_file(Path(sys.argv[2]), Path(sys.argv[3]))
+    print(f"✅ mock 模型已处理 {n} 条批量请求 → {sys.argv[3]}")
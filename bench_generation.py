@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+生成流水线吞吐基准（本地 mock LLM 服务，不访问 DashScope、不写 Neo4j）
+- 输入为 structured_lines.json 的 block，走与 main 相同的 规则分层 → 重复 block 合并 → 打包 → run_ordered 路径，
+  解析、清洗、路由升档、重试、对冲都是真实代码，只有模型换成 mock_llm_server
+- 每个并发档位重新启动一次 mock 服务（相同 seed，注入的延迟和错误序列一致），缓存写到临时文件且不读取
+- 报告每档的 block/s、请求延迟 p50/p95/p99、服务端请求数、注入错误数（即触发的重试）和失败 block 数
+用法：python bench_generation.py --concurrency 1 2 4 8 --latency-median 0.8 --latency-p95 3 --error-rate 0.05
+      python bench_generation.py --mode replay --cassette llm_cassette.jsonl
+"""
+import argparse
+import contextlib
+import io
+import json
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import generate_review_points as grp
+from block_packing import PACK_TOKEN_BUDGET, pack_blocks
+from llm_cache import LLMCache
+from llm_clients import configure_clients
+from llm_runtime import DEFAULT_RATE_LIMITS, Hedger, LatencyStats, ModelRateLimiter, run_ordered
+from mock_llm_server import DEFAULT_CASSETTE_PATH, LatencyProfile, MockLLMServer
+from model_routing import ModelRouter
+from review_point_parser import SalvageStats
+from run_planner import blocks_from_lines, load_structured_lines
+from telemetry import Telemetry
+
+UNLIMITED_RATE = {"rpm": 10 ** 9, "tpm": 10 ** 12}
+
+
+def reset_pipeline(workdir: Path, routing: bool, hedge: bool, rate_limited: bool):
+    """每个档位使用全新的缓存、路由统计、限流器、对冲器和遥测，档位之间互不影响"""
+    level = time.monotonic_ns()
+    grp.llm_cache = LLMCache(workdir / f"cache_{level}.sqlite3", bypass=True)
+    grp.telemetry = Telemetry(prefix=str(workdir / f"metrics_{level}"), script="bench_generation")
+    grp.model_router = ModelRouter(path=workdir / "routing_stats.json", enabled=routing)
+    grp.salvage_stats = SalvageStats()
+    grp.hedger = Hedger(siblings=grp.HEDGE_SIBLINGS, enabled=hedge)
+    grp.rate_limiter = ModelRateLimiter(None if rate_limited
+                                        else {model: UNLIMITED_RATE for model in DEFAULT_RATE_LIMITS})
+
+
+def run_level(jobs: List[List[Dict]], concurrency: int, server: MockLLMServer, verbose: bool) -> Dict:
+    failed: List[str] = []
+
+    def worker(job: List[Dict]) -> Dict[str, List[Dict]]:
+        try:
+            return grp.generate_review_points_for_pack(job)
+        except Exception as e:  # 重试耗尽；计入失败 block，不中断基准
+            failed.extend(block["block_id"] for block in job)
+            print(f"❌ {job[0]['block_id']}: {e!r}")
+            return {}
+
+    stats = LatencyStats()
+    output = io.StringIO()
+    points = 0
+    started = time.monotonic()
+    with contextlib.redirect_stdout(output):
+        for _, results in run_ordered(jobs, worker, concurrency=concurrency, stats=stats):
+            points += sum(len(block_points) for block_points in results.values())
+    wall = time.monotonic() - started
+    if verbose:
+        print(output.getvalue(), end="")
+    grp.telemetry.flush()
+    blocks = sum(len(job) for job in jobs)
+    summary = stats.summary()
+    return {
+        "concurrency": concurrency,
+        "jobs": len(jobs),
+        "blocks": blocks,
+        "points": points,
+        "wall_seconds": wall,
+        "blocks_per_second": blocks / wall if wall > 0 else 0.0,
+        "p50": summary["p50"],
+        "p95": summary["p95"],
+        "p99": summary["p99"],
+        "requests": server.stats["requests"],
+        "injected_errors": server.stats["injected_errors"],
+        "replay_misses": server.stats["replay_misses"],
+        "retries": sum(record["retries"] for record in grp.telemetry.records),
+        "hedges": grp.hedger.hedged,
+        "failed_blocks": len(failed),
+    }
+
+
+def print_results(results: List[Dict]):
+    print("📈 生成流水线基准（请求延迟为单个作业从开始到结果返回）：")
+    print(f"   {'并发':>4} {'block/s':>8} {'p50':>7} {'p95':>7} {'p99':>7} {'请求':>6} {'注入错误':>8} {'重试':>6} "
+          f"{'对冲':>6} {'失败':>6}")
+    for r in results:
+        print(f"   {r['concurrency']:>4} {r['blocks_per_second']:>8.2f} {r['p50']:>6.2f}s {r['p95']:>6.2f}s "
+              f"{r['p99']:>6.2f}s {r['requests']:>6} {r['injected_errors']:>8} {r['retries']:>6} {r['hedges']:>6} "
+              f"{r['failed_blocks']:>6}")
+    base = results[0]
+    for r in results[1:]:
+        speedup = r["blocks_per_second"] / base["blocks_per_second"] if base["blocks_per_second"] else 0.0
+        print(f"   - 并发 {r['concurrency']} 相对并发 {base['concurrency']}：{speedup:.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成流水线吞吐基准（本地 mock LLM 服务）")
+    parser.add_argument("--lines-json", default="structured_lines.json")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--mode", choices=["synthetic", "replay"], default="synthetic")
+    parser.add_argument("--cassette", default=str(DEFAULT_CASSETTE_PATH))
+    parser.add_argument("--latency-median", type=float, default=0.5)
+    parser.add_argument("--latency-p95", type=float, default=2.0)
+    parser.add_argument("--tokens-per-second", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--pack-budget", type=int, default=PACK_TOKEN_BUDGET)
+    parser.add_argument("--no-rules", action="store_true")
+    parser.add_argument("--no-block-dedup", action="store_true")
+    parser.add_argument("--no-routing", action="store_true")
+    parser.add_argument("--hedge", action="store_true", help="开启对冲请求（默认关闭，便于对比纯并发效果）")
+    parser.add_argument("--rate-limited", action="store_true", help="使用真实的 RPM/TPM 限额（默认不限流）")
+    parser.add_argument("--json", default=None, metavar="PATH", help="把结果写成 JSON")
+    parser.add_argument("--verbose", action="store_true", help="显示流水线的逐块输出")
+    args = parser.parse_args()
+
+    blocks = [b for b in blocks_from_lines(load_structured_lines(args.lines_json)) if b["content"].strip()]
+    with contextlib.redirect_stdout(io.StringIO()):
+        representatives = grp.select_llm_blocks(blocks, not args.no_rules, not args.no_block_dedup)
+    jobs = pack_blocks(representatives, budget=args.pack_budget)
+    print(f"🧪 {len(blocks)} 个 block → {len(representatives)} 个需 LLM 生成 → {len(jobs)} 个作业；"
+          f"mock 模式 {args.mode}，延迟中位数 {args.latency_median}s / p95 {args.latency_p95}s，错误率 {args.error_rate:.0%}")
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for concurrency in args.concurrency:
+            reset_pipeline(Path(workdir), not args.no_routing, args.hedge, args.rate_limited)
+            with MockLLMServer(mode=args.mode, cassette_path=Path(args.cassette),
+                               latency=LatencyProfile(args.latency_median, args.latency_p95, args.tokens_per_second),
+                               error_rate=args.error_rate, seed=args.seed) as server:
+                configure_clients(base_url=server.openai_base_url, api_key="mock")
+                result = run_level(jobs, concurrency, server, args.verbose)
+            print(f"   ✔ 并发 {concurrency}: {result['blocks_per_second']:.2f} block/s，用时 {result['wall_seconds']:.1f}s")
+            results.append(result)
+    print_results(results)
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
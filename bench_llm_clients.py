@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+对比每次调用的客户端开销（本地 mock 端点，不访问 DashScope）
+- before：每次调用新建 ChatOpenAI + create_react_agent(llm, tools=[])（旧实现）
+- after ：llm_clients.chat_completion（复用客户端 + 连接池 + 直接 chat completion）
+mock 端点立即返回，测得的耗时近似为纯客户端开销
+
+用法：python bench_llm_clients.py --calls 200
+"""
+import argparse
+import json
+import statistics
+import time
+
+from mock_llm_server import MockLLMServer
+
+MOCK_REPLY = json.dumps({"review_points": [{
+    "type": "required", "question": "是否提供原料药信息表？", "evidence": "列表说明单位剂量产品的处方组成",
+    "source_block_id": "table_2_3_P_1_1_1", "source_section_id": "2.3.P.1.1"
+}]}, ensure_ascii=False)
+
+
+def call_before(base_url: str, system_prompt: str, user_text: str) -> str:
+    from langchain_core.messages import SystemMessage
+    from langchain_openai import ChatOpenAI
+    from langgraph.prebuilt import create_react_agent
+
+    llm = ChatOpenAI(model="qwen-max", openai_api_key="mock", openai_api_base=base_url)
+    agent = create_react_agent(llm, tools=[], prompt=SystemMessage(content=system_prompt))
+    response = agent.invoke({"messages": [("user", user_text)]})
+    return response["messages"][-1].content
+
+
+def call_after(system_prompt: str, user_text: str) -> str:
+    from llm_clients import chat_completion
+    return chat_completion("qwen-max", system_prompt, user_text, temperature=0.7)
+
+
+def measure(label: str, fn, calls: int) -> dict:
+    fn()  # 预热（import、首个连接）
+    latencies = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    result = {
+        "label": label,
+        "mean_ms": statistics.mean(latencies),
+        "p50_ms": latencies[len(latencies) // 2],
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1],
+    }
+    print(f"⏱️  {label:<7} 平均 {result['mean_ms']:.2f} ms，p50 {result['p50_ms']:.2f} ms，p95 {result['p95_ms']:.2f} ms")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM 客户端单次调用开销基准")
+    parser.add_argument("--calls", type=int, default=200)
+    args = parser.parse_args()
+
+    server = MockLLMServer(responder=lambda model, messages: MOCK_REPLY).start()
+    base_url = server.openai_base_url
+    from llm_clients import configure_clients
+    configure_clients(base_url=base_url, api_key="mock")
+
+    system_prompt = "你是一名资深药品注册审评专家，请根据以下【关注点】内容，生成可验证的审核问题。"
+    user_text = "根据以下内容生成审核点：\n关注原料药的粒度分布对制剂溶出的影响。"
+    print(f"🔬 mock 端点 {base_url}，每组 {args.calls} 次调用")
+    before = measure("before", lambda: call_before(base_url, system_prompt, user_text), args.calls)
+    after = measure("after", lambda: call_after(system_prompt, user_text), args.calls)
+    print(f"✅ 每次调用节省 {before['mean_ms'] - after['mean_ms']:.2f} ms"
+          f"（{before['mean_ms'] / max(after['mean_ms'], 1e-6):.1f}x）")
+    server.stop()
+
+
+if __name__ == "__main__":
+    main()
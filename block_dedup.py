@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+重复 block 识别：相同或几乎相同的 block 只生成一次，审核点再分发给组内每个 block
+- 指纹：block_type + 归一化原文（NFKC、去空白和标点、××/……/编号等占位统一）的 sha256
+- 指纹不同的再用 near_dedup 的 MinHash 找几乎相同的 block（阈值远高于审核点去重）
+- 组内以首个 block（行号最小）为代表；分发时按成员的 block_id/section_id/原文哈希重算 review_id，
+  并记录 generated_from 指向代表 block
+- 几乎相同（非完全相同）的成员原文与代表有差异：分发前在成员自身原文中重新定位 evidence
+  （与 evidence_locator 相同的归一化），找不到的点不分发，避免成员带着只在代表 block 里出现的 evidence
+"""
+import hashlib
+import re
+import unicodedata
+from typing import Callable, Dict, List
+
+from evidence_locator import normalize_char, normalize_evidence
+from near_dedup import cluster_points
+from review_ids import content_hash, make_review_id
+
+BLOCK_NEAR_DUP_THRESHOLD = 0.9
+PLACEHOLDER_PATTERN = re.compile(r"(×+|…+|\.{3,}|x{2,}|X{2,})")
+NOISE_PATTERN = re.compile(r"[\s\W_]+", re.UNICODE)
+
+
+def normalize_block_content(content: str) -> str:
+    text = unicodedata.normalize("NFKC", content or "")
+    text = PLACEHOLDER_PATTERN.sub("×", text)
+    return NOISE_PATTERN.sub("", text)
+
+
+def block_fingerprint(block: Dict) -> str:
+    key = f"{block['block_type']}\n{normalize_block_content(block['content'])}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def group_duplicate_blocks(blocks: List[Dict], threshold: float = BLOCK_NEAR_DUP_THRESHOLD) -> Dict[str, List[Dict]]:
+    """返回 {代表 block_id: [组内所有 block（含代表）]}，按代表在输入中的顺序排列"""
+    exact: Dict[str, List[Dict]] = {}
+    for block in blocks:
+        exact.setdefault(block_fingerprint(block), []).append(block)
+    groups = list(exact.values())
+    # 指纹不同但几乎相同（如个别字词差异）的组再合并；以各组代表的归一化原文做 MinHash
+    keys = [{"question": normalize_block_content(g[0]["content"]), "block_type": g[0]["block_type"]}
+            for g in groups]
+    order = {block["block_id"]: i for i, block in enumerate(blocks)}
+    merged = []
+    for cluster in cluster_points(keys, threshold, scope=lambda k: k["block_type"]):
+        members = [block for i in cluster for block in groups[i]]
+        merged.append(sorted(members, key=lambda b: order[b["block_id"]]))
+    merged.sort(key=lambda g: order[g[0]["block_id"]])
+    return {group[0]["block_id"]: group for group in merged}
+
+
+def fan_out_points(points: List[Dict], member: Dict, representative_id: str, prompt_version: str) -> List[Dict]:
+    """把代表 block 的审核点复制给组内成员，来源字段改为成员自身；evidence 在成员原文中找不到的点丢弃"""
+    if member["block_id"] == representative_id:
+        return points
+    member_hash = content_hash(member["content"])
+    member_text = normalize_char(member["content"])
+    fanned = []
+    for p in points:
+        evidence = normalize_evidence(p.get("evidence") or "")
+        if not evidence or evidence not in member_text:
+            continue
+        copy = dict(p)
+        copy.update({
+            "review_id": make_review_id(member["block_id"], member_hash, prompt_version, p["question"]),
+            "content_hash": member_hash,
+            "block_id": member["block_id"],
+            "section_id": member["section_id"],
+            "generated_from": representative_id,
+        })
+        fanned.append(copy)
+    return fanned
+
+
+def dedup_report(blocks: List[Dict], groups: Dict[str, List[Dict]],
+                 calls_for: Callable[[List[Dict]], int] = len):
+    """calls_for：给定 block 列表估算所需 LLM 调用数（打包时传入打包函数）"""
+    duplicated = [g for g in groups.values() if len(g) > 1]
+    if not duplicated:
+        print(f"🪞 重复 block 检测：{len(blocks)} 个 block 无重复")
+        return
+    saved = calls_for(blocks) - calls_for([g[0] for g in groups.values()])
+    print(f"🪞 重复 block 检测：{len(blocks)} 个 block → {len(groups)} 组，"
+          f"{sum(len(g) - 1 for g in duplicated)} 个重复 block 复用代表结果，避免 {saved} 次 LLM 调用")
+    for group in duplicated:
+        print(f"   - {group[0]['block_id']} ← {', '.join(b['block_id'] for b in group[1:])}")
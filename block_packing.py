@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+小 block 打包：同类型的短 block 合并成一次 LLM 请求，system prompt 只发送一次
+- pack_blocks：按 block_type 在 token 预算内装箱，返回按首块文档顺序排列的作业
+- format_pack_input：每块带【block_id | section_id】标记拼成一个输入
+- split_pack_output：按 source_block_id 把回复拆回各块；格式异常返回 None（调用方回退逐块调用）
+"""
+from typing import Dict, List, Optional
+
+from llm_runtime import estimate_tokens
+
+PACK_TOKEN_BUDGET = 1500      # 单个打包请求的原文 token 上限；0 表示不打包
+PACK_MAX_BLOCK_TOKENS = 400   # 超过该长度的 block 单独请求
+PACK_MAX_BLOCKS = 8           # 单个打包请求最多包含的 block 数
+
+PACK_MARKER = "【block_id={block_id} | section_id={section_id}】"
+
+
+def pack_blocks(blocks: List[Dict], budget: int = PACK_TOKEN_BUDGET,
+                max_block_tokens: int = PACK_MAX_BLOCK_TOKENS, max_blocks: int = PACK_MAX_BLOCKS) -> List[List[Dict]]:
+    """blocks 需含 block_id / section_id / block_type / content；单块作业为长度 1 的列表"""
+    jobs = []
+    open_packs = {}  # block_type -> [当前打包作业, 已用 token]
+    for block in blocks:
+        tokens = estimate_tokens(block["content"])
+        if budget <= 0 or tokens > max_block_tokens:
+            jobs.append([block])
+            continue
+        current = open_packs.get(block["block_type"])
+        if current is None or current[1] + tokens > budget or len(current[0]) >= max_blocks:
+            current = [[block], tokens]
+            open_packs[block["block_type"]] = current
+            jobs.append(current[0])
+        else:
+            current[0].append(block)
+            current[1] += tokens
+    return jobs
+
+
+def format_pack_input(pack: List[Dict]) -> str:
+    parts = ["根据以下内容块分别生成审核点："]
+    for block in pack:
+        parts.append(PACK_MARKER.format(block_id=block["block_id"], section_id=block["section_id"]))
+        parts.append(block["content"])
+    return "\n".join(parts)
+
+
+def split_pack_output(salvaged: Dict, pack: List[Dict]) -> Optional[Dict[str, List[Dict]]]:
+    """salvaged 为 review_point_parser.salvage_review_points 的结果，返回 {block_id: [item, ...]}。
+    完全无法解析或出现未知 source_block_id 时返回 None；输出被截断时丢弃最后一个 block 的结果（可能不完整），
+    由调用方对缺失的 block 逐块重试"""
+    if salvaged["status"] == "failed":
+        return None
+    block_ids = {block["block_id"] for block in pack}
+    grouped: Dict[str, List[Dict]] = {}
+    for item in salvaged["items"]:
+        block_id = item.get("source_block_id")
+        if block_id not in block_ids:
+            return None
+        grouped.setdefault(block_id, []).append(item)
+    if not salvaged["complete"] and salvaged["items"]:
+        grouped.pop(salvaged["items"][-1]["source_block_id"], None)
+    return grouped
+
+
+def packing_report(blocks: List[Dict], jobs: List[List[Dict]], system_prompt_tokens: int):
+    """对比逐块调用与打包调用的请求数和 prompt token 估算"""
+    content_tokens = sum(estimate_tokens(block["content"]) for block in blocks)
+    marker_tokens = sum(estimate_tokens(PACK_MARKER.format(**block)) for job in jobs if len(job) > 1 for block in job)
+    unpacked = len(blocks) * system_prompt_tokens + content_tokens
+    packed = len(jobs) * system_prompt_tokens + content_tokens + marker_tokens
+    print(f"📦 打包：{len(blocks)} 个 block → {len(jobs)} 次请求，"
+          f"prompt token 估算 {unpacked} → {packed}（{unpacked / max(packed, 1):.1f}x）")
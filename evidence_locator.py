@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+evidence 原文定位
+- DocumentIndex：把全文行拼成一条归一化文本（NFKC、去空白，PDF 换行断开的句子可以跨行匹配），
+  并保留每个归一化字符 → (行号, 行内字符偏移) 的映射
+- AhoCorasick：所有 evidence 构建一个多模式自动机，一次扫描全文即可得到全部匹配
+- 作用域：同一句话常在目录、正文多处出现，调用方可为每条 evidence 给出所属 block / 章节的行号集合，
+  优先取落在其中的匹配，找不到再退回全文首个匹配（evidence_scope = local / document）
+- 未匹配到的 evidence 视为疑似编造，由调用方标记或剔除
+匹配结果为行号 + 字符偏移，前端点击定位可直接按行号取行，无需再扫描全文。
+"""
+import unicodedata
+from collections import deque
+from typing import Dict, List, Optional, Set, Tuple
+
+EVIDENCE_STRIP_CHARS = "“”\"'‘’「」『』《》…. 　"
+
+
+def normalize_char(c: str) -> str:
+    return "".join(ch for ch in unicodedata.normalize("NFKC", c) if not ch.isspace())
+
+
+def normalize_evidence(evidence: str) -> str:
+    return normalize_char((evidence or "").strip(EVIDENCE_STRIP_CHARS))
+
+
+class AhoCorasick:
+    def __init__(self, patterns: List[str]):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[List[int]] = [[]]
+        self.lengths = [len(p) for p in patterns]
+        for index, pattern in enumerate(patterns):
+            if pattern:
+                self._add(pattern, index)
+        self._build_fail_links()
+
+    def _add(self, pattern: str, index: int):
+        node = 0
+        for c in pattern:
+            nxt = self.goto[node].get(c)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[node][c] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+            node = nxt
+        self.output[node].append(index)
+
+    def _build_fail_links(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for c, child in self.goto[node].items():
+                queue.append(child)
+                f = self.fail[node]
+                while f and c not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[child] = self.goto[f].get(c, 0) if self.goto[f].get(c, 0) != child else 0
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+    def find_all(self, text: str) -> Dict[int, List[int]]:
+        """{pattern 下标: 全部匹配的起始位置（升序）}"""
+        found: Dict[int, List[int]] = {}
+        node = 0
+        for pos, c in enumerate(text):
+            while node and c not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(c, 0)
+            for index in self.output[node]:
+                found.setdefault(index, []).append(pos - self.lengths[index] + 1)
+        return found
+
+
+class DocumentIndex:
+    def __init__(self, lines: List[Dict]):
+        """lines: [{"line_number": int, "text": str}]，按行号排序"""
+        chars: List[str] = []
+        self.positions: List[Tuple[int, int]] = []
+        for line in lines:
+            for offset, c in enumerate(line["text"] or ""):
+                for ch in normalize_char(c):
+                    chars.append(ch)
+                    self.positions.append((line["line_number"], offset))
+        self.text = "".join(chars)
+
+    def locate_many(self, evidences: List[str],
+                    scopes: Optional[List[Optional[Set[int]]]] = None) -> List[Optional[Dict]]:
+        """一次扫描定位所有 evidence；scopes 与 evidences 对齐，为各自优先匹配的行号集合（None 表示全文）。
+        返回与输入对齐的 span（未找到为 None）"""
+        patterns = [normalize_evidence(e) for e in evidences]
+        matches = AhoCorasick(patterns).find_all(self.text)
+        spans: List[Optional[Dict]] = []
+        for index, pattern in enumerate(patterns):
+            starts = matches.get(index)
+            if not pattern or not starts:
+                spans.append(None)
+                continue
+            scope = scopes[index] if scopes else None
+            local = [s for s in starts if self.positions[s][0] in scope] if scope else []
+            start = local[0] if local else starts[0]
+            start_line, start_offset = self.positions[start]
+            end_line, end_offset = self.positions[start + len(pattern) - 1]
+            spans.append({
+                "evidence_start_line": start_line,
+                "evidence_start_offset": start_offset,
+                "evidence_end_line": end_line,
+                "evidence_end_offset": end_offset + 1,  # 不含
+                "evidence_scope": "local" if local else "document",
+            })
+        return spans
@@ -1,12 +1,36 @@
 # -*- coding: utf-8 -*-
+import threading
+import time
+import argparse
 import json
-import re
-from typing import List, Dict, Any
-from langgraph.prebuilt import create_react_agent
-from langchain_core.messages import SystemMessage
-from langchain_openai import ChatOpenAI
+import socket
+from pathlib import Path
+from typing import List, Dict, Any, Callable, Iterator, Optional, Set, Tuple
 from neo4j import GraphDatabase
 import os
+from block_dedup import dedup_report, fan_out_points, group_duplicate_blocks
+from batch_io import build_batch_request, make_custom_id, read_batch_results, write_batch_requests
+from block_packing import PACK_TOKEN_BUDGET, format_pack_input, pack_blocks, packing_report, split_pack_output
+from evidence_locator import DocumentIndex, normalize_evidence
+from generation_runs import complete_generation_run, fail_generation_run, start_generation_run, touch_generation_run
+from llm_cache import LLMCache
+from model_routing import MODEL_TIERS, ModelRouter, is_acceptable
+from near_dedup import NEAR_DUP_THRESHOLD, merge_near_duplicates
+from section_hierarchy import bottom_up_levels, build_parent_input, build_section_tree
+from section_chunking import SECTION_CHUNK_TOKENS, chunk_section_lines, reduce_points
+from llm_clients import chat_completion, stream_chat_completion
+from review_ids import content_hash, make_review_id, normalize_question
+from run_planner import (PLAN_COMPLETION_TOKENS, POINT_SUMMARY_TOKENS, POINTS_PER_CHILD, blocks_from_lines,
+                         load_structured_lines, plan_report, planned_call)
+from run_journal import RunJournal, find_resumable_run, has_unfinished_journal
+from prompt_compaction import compact_block_content, compaction_report
+from review_point_parser import (MAX_CONTINUATIONS, REVIEW_POINT_FIELDS, ReviewPointStreamParser, SalvageStats,
+                                 build_continuation_input, salvage_review_points, validate_review_item)
+from rule_tiering import RULES_VERSION, tier_blocks
+from telemetry import DEFAULT_METRICS_PREFIX, Telemetry
+from llm_runtime import (Hedger, ModelRateLimiter, LatencyStats, call_with_retry, estimate_tokens, run_ordered,
+                         scaled_rate_limits)
+from work_queue import DEFAULT_QUEUE_PATH, LeaseKeeper, SQLiteWorkQueue, WorkQueue
 
 # ================== 配置 ==================
 NEO4J_URI = "bolt://localhost:7687"
@@ -16,63 +40,204 @@ os.environ['DASHSCOPE_API_KEY'] = 'sk-57056cdaa1ec49c883e585d7ce1ea3d5'
 
 DASHSCOPE_API_KEY = os.getenv("DASHSCOPE_API_KEY")
 
+LLM_MODEL = "qwen-max"          # section 级生成固定使用；block 级由 ModelRouter 按类型/长度选择
+ROUTED_MODEL = "routed"         # 开启路由时 GenerationRun.model 的取值，每条审核点的实际模型记在 ReviewPoint.model
+LLM_TEMPERATURE = 0.7
+PROMPT_VERSION = "v4"          # 修改 get_system_prompt 后请递增
+GENERATION_VERSION = f"{PROMPT_VERSION}+{RULES_VERSION}"  # 增量复用 block 结果的版本键（Prompt 与规则模板）
+RUNS_TO_KEEP = 2               # 保留最近几个已完成批次（含当前）
+PRUNE_BATCH_SIZE = 1000        # 后台清理时每个事务删除的节点数
+MAX_CONCURRENCY = 4            # 同时进行的 LLM 调用数（可用 --concurrency 覆盖）
+EXPECTED_COMPLETION_TOKENS = 800  # TPM 限流时预留的输出 token 数
+HEDGE_SIBLINGS: Dict[str, str] = {}  # 对冲副本改发的模型，如 {"qwen-max": "qwen-plus"}；为空时发给同一模型
+REVIEW_TOOLS: List = []        # 为空时直接走 chat completion；配置工具后才走 ReAct agent
+
 if not DASHSCOPE_API_KEY:
     raise ValueError("请设置环境变量 DASHSCOPE_API_KEY")
 
 # ================== Neo4j 工具 ==================
 driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD))
 
-def clear_existing_review_points():
-    """删除 Neo4j 中所有已存在的 ReviewPoint 节点"""
-    print("🗑️  正在清理旧的 ReviewPoint 节点...")
+# ================== 生成批次（GenerationRun） ==================
+def ensure_review_schema():
+    """为批次和审核点创建索引/约束"""
     with driver.session() as session:
-        result = session.run("MATCH (r:ReviewPoint) DETACH DELETE r")
-        count = result.consume().counters.nodes_deleted
-        print(f"✅ 已删除 {count} 个旧的 ReviewPoint 节点")
+        session.run("CREATE CONSTRAINT generation_run_id IF NOT EXISTS FOR (g:GenerationRun) REQUIRE g.run_id IS UNIQUE")
+        session.run("CREATE INDEX review_point_run_idx IF NOT EXISTS FOR (r:ReviewPoint) ON (r.run_id)")
+        session.run("CREATE INDEX block_state_run_idx IF NOT EXISTS FOR (b:BlockState) ON (b.run_id, b.block_id)")
 
-def clean_review_points(points: List[Dict]) -> List[Dict]:
-    original_count = len(points)
+def start_run() -> str:
+    """路由开启时批次没有单一模型，model 记为 ROUTED_MODEL 并标记 routing"""
+    model = ROUTED_MODEL if model_router.enabled else LLM_MODEL
+    return start_generation_run(driver, model, PROMPT_VERSION, routing=model_router.enabled)
+
+def model_call_counts() -> Dict[str, int]:
+    """本进程各模型的实际调用次数（不含缓存命中）"""
+    return {model: int(stats["calls"]) for model, stats in model_router.calls.items()}
+
+def resume_generation_run(run_id: str) -> bool:
+    """把未完成（running/failed）的批次重新标记为 running；批次不存在或已完成时返回 False"""
+    query = """
+    MATCH (run:GenerationRun {run_id: $run_id})
+    WHERE run.status <> 'completed'
+    SET run.status = 'running', run.resumed_at = timestamp()
+    RETURN run.run_id AS run_id
+    """
+    with driver.session() as session:
+        return session.run(query, run_id=run_id).single() is not None
+
+def delete_partial_points(run_id: str, finished_block_ids: List[str]):
+    """续跑前删除该批次中未记入日志的审核点（崩溃时写了一半的 block 以及 section 级审核点）"""
+    query = """
+    MATCH (r:ReviewPoint {run_id: $run_id})
+    WHERE r.block_id IS NULL OR NOT r.block_id IN $finished
+    DETACH DELETE r
+    """
+    with driver.session() as session:
+        count = session.run(query, run_id=run_id, finished=finished_block_ids).consume().counters.nodes_deleted
+    if count:
+        print(f"🗑️  已删除 {count} 个未完成的 ReviewPoint 节点")
+
+def get_latest_run_id() -> Optional[str]:
+    with driver.session() as session:
+        record = session.run("MATCH (ptr:ReviewPointer {name: 'latest'}) RETURN ptr.run_id AS run_id").single()
+        return record["run_id"] if record else None
+
+def get_run_review_points(run_id: str) -> List[Dict]:
+    """读取指定批次（含进行中的批次）的审核点；流式模式下审核点生成后即可读到"""
+    query = """
+    MATCH (r:ReviewPoint {run_id: $run_id})
+    RETURN r {.*} AS point
+    ORDER BY r.created_at
+    """
+    with driver.session() as session:
+        return [record["point"] for record in session.run(query, run_id=run_id)]
+
+def get_latest_review_points(section_id: Optional[str] = None) -> List[Dict]:
+    """读端入口：只返回 latest 指针所指批次的审核点"""
+    query = """
+    MATCH (ptr:ReviewPointer {name: 'latest'})
+    MATCH (r:ReviewPoint {run_id: ptr.run_id})
+    WHERE $section_id IS NULL OR r.section_id STARTS WITH $section_id
+    RETURN r {.*} AS point
+    ORDER BY r.section_id, r.block_id
+    """
+    with driver.session() as session:
+        return [record["point"] for record in session.run(query, section_id=section_id)]
+
+def save_block_states(run_id: str, states: List[Dict]):
+    """记录每个 block 的原文哈希、生成版本和清洗后的原始审核点（0 条也记录）。
+    近似去重、evidence 剔除只删 ReviewPoint，不改这里，增量模式据此复用而不依赖幸存的审核点"""
+    if not states:
+        return
+    query = """
+    UNWIND $states AS s
+    MERGE (b:BlockState {run_id: $run_id, block_id: s.block_id})
+    SET b.content_hash = s.content_hash, b.generation_version = $version, b.points = s.points
+    """
+    states = [dict(state, points=json.dumps(state["points"], ensure_ascii=False)) for state in states]
+    with driver.session() as session:
+        session.run(query, run_id=run_id, version=GENERATION_VERSION, states=states).consume()
+    touch_generation_run(driver, run_id)
+
+def block_state(block: Dict, points: List[Dict]) -> Dict:
+    return {"block_id": block["block_id"], "content_hash": content_hash(block["content"]), "points": points}
+
+def get_latest_block_points() -> Dict[str, Dict]:
+    """latest 批次中每个 block 的原文哈希、生成版本和原始审核点（增量模式据此判断哪些 block 可复用）"""
+    query = """
+    MATCH (ptr:ReviewPointer {name: 'latest'})
+    MATCH (b:BlockState {run_id: ptr.run_id})
+    RETURN b.block_id AS block_id, b.content_hash AS content_hash, b.generation_version AS generation_version,
+           b.points AS points
+    """
+    with driver.session() as session:
+        return {record["block_id"]: dict(record.data(), points=json.loads(record["points"]))
+                for record in session.run(query)}
+
+def prune_old_runs(keep: int = RUNS_TO_KEEP, batch_size: int = PRUNE_BATCH_SIZE):
+    """分批删除过期批次的 ReviewPoint（保留最近 keep 个完成批次及 latest 所指批次）；
+    失败批次若还有未完成的进度日志（--resume 可续跑）则保留"""
+    stale_query = """
+    OPTIONAL MATCH (ptr:ReviewPointer {name: 'latest'})
+    MATCH (run:GenerationRun)
+    WHERE run.status <> 'running' AND run.run_id <> coalesce(ptr.run_id, '')
+    WITH run ORDER BY run.started_at DESC
+    WITH collect(run) AS runs
+    // 多模型审核批次（multi_agent_audit_system）不切换 latest，单独计数，不挤占流水线批次的保留名额
+    WITH [r IN runs WHERE r.status = 'completed' AND coalesce(r.generator, '') <> 'multi_agent'][$keep - 1..]
+         + [r IN runs WHERE r.status = 'completed' AND r.generator = 'multi_agent'][$keep..]
+         + [r IN runs WHERE r.status = 'failed'] AS stale
+    UNWIND stale AS run
+    RETURN run.run_id AS run_id, run.status AS status
+    """
+    delete_points_query = """
+    MATCH (r:ReviewPoint) WHERE r.run_id IN $run_ids
+    CALL { WITH r DETACH DELETE r } IN TRANSACTIONS OF $batch_size ROWS
+    """
+    with driver.session() as session:
+        run_ids = [r["run_id"] for r in session.run(stale_query, keep=max(keep, 1))
+                   if r["status"] != "failed" or not has_unfinished_journal(r["run_id"])]
+        if not run_ids:
+            return
+        # CALL {} IN TRANSACTIONS 需要自动提交事务（session.run），每批独立提交，内存占用有界
+        summary = session.run(delete_points_query, run_ids=run_ids, batch_size=batch_size).consume()
+        session.run("MATCH (b:BlockState) WHERE b.run_id IN $run_ids DELETE b", run_ids=run_ids).consume()
+        session.run("MATCH (g:GenerationRun) WHERE g.run_id IN $run_ids DELETE g", run_ids=run_ids).consume()
+    print(f"🗑️  已清理 {len(run_ids)} 个过期批次，删除 {summary.counters.nodes_deleted} 个 ReviewPoint 节点")
+
+def prune_old_runs_in_background(keep: int = RUNS_TO_KEEP) -> threading.Thread:
+    """后台线程执行清理，不阻塞读端（指针已切换）"""
+    thread = threading.Thread(target=prune_old_runs, kwargs={"keep": keep}, name="prune-old-runs")
+    thread.start()
+    return thread
+
+def clean_review_point(p: Dict, seen: set) -> Optional[Dict]:
+    """清洗单条审核点；不合规或与 seen 中已有 (question, section_id) 重复时返回 None（流式写入时逐条调用）"""
+    # 1. 必填字段检查
+    required_fields = ["type", "question", "evidence", "section_id"]
+    if not all(k in p and p[k] for k in required_fields):
+        return None
+
+    # 2. question 必须以“是否”开头
+    q = p["question"].strip()
+    if not q.startswith("是否"):
+        return None
+
+    # 3. evidence 长度合理（5~100 字符）
+    e = p["evidence"].strip()
+    if len(e) < 5 or len(e) > 100:
+        return None
+
+    # 4. type 必须是 required/recommended
+    if p["type"] not in ["required", "recommended"]:
+        return None
+
+    # 5. 去重：相同问题（忽略空白和标点，与 review_id 一致）+ 相同章节
+    key = (normalize_question(q), p["section_id"])
+    if key in seen:
+        return None
+    seen.add(key)
+
+    # 6. 标准化字段
+    return {
+        "review_id": p["review_id"],
+        "content_hash": p.get("content_hash"),
+        "generator": p.get("generator", "llm"),
+        "generated_from": p.get("generated_from"),
+        "model": p.get("model"),
+        "block_id": p.get("block_id"),
+        "section_id": p["section_id"],
+        "type": p["type"],
+        "question": q,
+        "evidence": e
+    }
 
+def clean_review_points(points: List[Dict]) -> List[Dict]:
     """清洗审核点列表，确保数据干净、合规"""
-    cleaned = []
     seen = set()  # 用于去重：(question, section_id)
-
-    for p in points:
-        # 1. 必填字段检查
-        required_fields = ["type", "question", "evidence", "section_id"]
-        if not all(k in p and p[k] for k in required_fields):
-            continue
-
-        # 2. question 必须以“是否”开头
-        q = p["question"].strip()
-        if not q.startswith("是否"):
-            continue
-
-        # 3. evidence 长度合理（5~100 字符）
-        e = p["evidence"].strip()
-        if len(e) < 5 or len(e) > 100:
-            continue
-
-        # 4. type 必须是 required/recommended
-        if p["type"] not in ["required", "recommended"]:
-            continue
-
-        # 5. 去重：相同问题 + 相同章节
-        key = (q, p["section_id"])
-        if key in seen:
-            continue
-        seen.add(key)
-
-        # 6. 标准化字段
-        cleaned.append({
-            "review_id": p["review_id"],
-            "block_id": p.get("block_id"),
-            "section_id": p["section_id"],
-            "type": p["type"],
-            "question": q,
-            "evidence": e
-        })
-    print(f"🧹 清洗审核点: {original_count} → {len(cleaned)} 条")
+    cleaned = [c for c in (clean_review_point(p, seen) for p in points) if c]
+    print(f"🧹 清洗审核点: {len(points)} → {len(cleaned)} 条")
     return cleaned
 
 
@@ -87,6 +252,27 @@ def get_block_content(block_id: str) -> str:
         result = session.run(query, block_id=block_id).single()
         return "\n".join(result["lines"]) if result else ""
 
+def get_blocks_with_content() -> List[Dict]:
+    """一次查询取出所有待生成 block 及其原文，按首行行号排序"""
+    query = """
+    MATCH (l:Line)
+    WHERE l.block_id IS NOT NULL AND l.block_type IN ['concern', 'table', 'example']
+    WITH l
+    ORDER BY l.line_number
+    WITH l.block_id AS block_id, l.parent_section AS section_id, l.block_type AS block_type,
+         collect(l.text) AS lines, min(l.line_number) AS first_line
+    RETURN block_id, section_id, block_type, first_line, lines
+    ORDER BY first_line
+    """
+    with driver.session() as session:
+        return [{
+            "block_id": r["block_id"],
+            "section_id": r["section_id"],
+            "block_type": r["block_type"],
+            "first_line": r["first_line"],
+            "content": "\n".join(r["lines"])
+        } for r in session.run(query)]
+
 def get_section_content(section_id: str) -> str:
     query = """
     MATCH (l:Line)
@@ -100,6 +286,50 @@ def get_section_content(section_id: str) -> str:
         result = session.run(query, section_id=section_id).single()
         return "\n".join(result["lines"]) if result else ""
 
+def get_section_lines(section_id: str) -> List[Dict]:
+    """section 下所有 block 行（含 section_path / block_id），供 map-reduce 切分"""
+    query = """
+    MATCH (l:Line)
+    WHERE ANY(p IN l.section_path WHERE p STARTS WITH $section_id)
+      AND l.block_id IS NOT NULL
+    RETURN l.line_number AS line_number, l.text AS text, l.section_path AS section_path,
+           l.parent_section AS parent_section, l.block_id AS block_id
+    ORDER BY l.line_number
+    """
+    with driver.session() as session:
+        return [record.data() for record in session.run(query, section_id=section_id)]
+
+def get_section_paths() -> List[List[str]]:
+    """所有 block 行的 section_path（去重），用于构建章节树"""
+    query = """
+    MATCH (l:Line)
+    WHERE l.block_id IS NOT NULL AND l.section_path IS NOT NULL
+    RETURN DISTINCT l.section_path AS path
+    """
+    with driver.session() as session:
+        return [record["path"] for record in session.run(query)]
+
+def get_block_lines() -> List[Dict]:
+    """所有 block 行（含 section_path / block_type），供 --plan 在本地组装 block 和 section"""
+    query = """
+    MATCH (l:Line)
+    WHERE l.block_id IS NOT NULL
+    RETURN l.line_number AS line_number, l.text AS text, l.section_path AS section_path,
+           l.parent_section AS parent_section, l.block_id AS block_id, l.block_type AS block_type
+    ORDER BY l.line_number
+    """
+    with driver.session() as session:
+        return [record.data() for record in session.run(query)]
+
+def get_document_lines() -> List[Dict]:
+    query = """
+    MATCH (l:Line)
+    RETURN l.line_number AS line_number, l.text AS text, l.block_id AS block_id, l.section_path AS section_path
+    ORDER BY l.line_number
+    """
+    with driver.session() as session:
+        return [record.data() for record in session.run(query)]
+
 # ================== 动态 Prompt 模板 ==================
 def get_system_prompt(block_type: str, section_id: str) -> str:
     if block_type == "concern":
@@ -143,122 +373,964 @@ def get_system_prompt(block_type: str, section_id: str) -> str:
 5. 输出 JSON：{{"review_points": [{{"type": "...", "question": "...", "evidence": "...", "source_block_id": null, "source_section_id": "{section_id}"}}]}}
 """
 
+def get_hierarchical_system_prompt(section_id: str) -> str:
+    """自底向上模式：输入是子内容块/子章节的审核点摘要，而不是原文"""
+    return f"""
+你是一名药品注册高级审评员，请根据章节（{section_id}）下各内容块和子章节已生成的审核点摘要，生成本章节的综合审核清单。
+要求：
+1. 不要逐条复述子项审核点，而是归纳本章节层面的要求：跨子章节的一致性、完整性、相互引用关系
+2. 区分“必须项”（required）和“建议项”（recommended）
+3. 问题以“是否……？”开头
+4. evidence 填写所依据的子项审核点原文
+5. 输出 JSON：{{"review_points": [{{"type": "...", "question": "...", "evidence": "...", "source_block_id": null, "source_section_id": "{section_id}"}}]}}
+"""
+
+def get_packed_system_prompt(block_type: str) -> str:
+    """多个同类型 block 打包时的 system prompt：要求按 source_block_id 区分各块的审核点"""
+    return get_system_prompt(block_type, "<所属块的 section_id>") + """
+补充要求（多块输入）：
+1. 输入包含多个内容块，每块以【block_id=... | section_id=...】开头
+2. 逐块生成审核点，每条审核点的 source_block_id、source_section_id 必须填写其所属块的 ID
+3. 所有块的审核点放在同一个 review_points 数组中输出
+"""
+
 # ================== 审核点生成 ==================
-def generate_review_points_for_block(block_id: str, section_id: str, block_type: str) -> List[Dict]:
-    content = get_block_content(block_id)
+rate_limiter = ModelRateLimiter()
+llm_cache = LLMCache()
+model_router = ModelRouter()
+salvage_stats = SalvageStats()
+hedger = Hedger(siblings=HEDGE_SIBLINGS)
+telemetry = Telemetry(script="generate_review_points")
+
+def invoke_llm(model: str, system_prompt: str, input_text: str, label: str) -> Tuple[str, str]:
+    """先查缓存；未命中时限流 + 退避重试地调用模型（复用客户端）。
+    返回 (实际给出回复的模型, 回复文本)：对冲副本胜出时是同级模型，缓存、调用统计和审核点都记在它名下"""
+    cache_prompt = f"{system_prompt}\n{input_text}"
+    prompt_tokens = estimate_tokens(cache_prompt)
+    cached = llm_cache.get(model, LLM_TEMPERATURE, cache_prompt)
+    if cached is not None:
+        telemetry.record_call(model, prompt_tokens, estimate_tokens(cached), 0.0, cache_hit=True)
+        return model, cached
+    budget = prompt_tokens + EXPECTED_COMPLETION_TOKENS
+
+    def call_model(target_model: str) -> str:
+        return chat_completion(target_model, system_prompt, input_text, LLM_TEMPERATURE, tools=REVIEW_TOOLS)
+
+    def attempt() -> Tuple[str, str]:
+        # 主请求先排队拿限流额度再计时，p95 样本不含限流等待；对冲副本只在额度立即可用时发出
+        rate_limiter.acquire(model, budget)
+        return hedger.call(model, call_model, reserve=lambda target: rate_limiter.try_acquire(target, budget))
+
+    started = time.monotonic()
+    retries = []
+    try:
+        answered, raw_output = call_with_retry(attempt, label=label, on_retry=lambda n, e: retries.append(n))
+    except Exception as e:
+        telemetry.record_call(model, prompt_tokens, 0, time.monotonic() - started, retries=len(retries),
+                              error=repr(e))
+        raise
+    elapsed = time.monotonic() - started
+    model_router.record_call(answered, elapsed, prompt_tokens, estimate_tokens(raw_output))
+    telemetry.record_call(answered, prompt_tokens, estimate_tokens(raw_output), elapsed, retries=len(retries))
+    llm_cache.put(answered, LLM_TEMPERATURE, cache_prompt, raw_output)
+    return answered, raw_output
+
+def stream_llm(model: str, system_prompt: str, input_text: str, label: str) -> Iterator[str]:
+    """流式版 invoke_llm：逐段产出回复文本。缓存命中时一次性产出；仅在首个片段到达前重试，避免重复输出"""
+    cache_prompt = f"{system_prompt}\n{input_text}"
+    prompt_tokens = estimate_tokens(cache_prompt)
+    cached = llm_cache.get(model, LLM_TEMPERATURE, cache_prompt)
+    if cached is not None:
+        telemetry.record_call(model, prompt_tokens, estimate_tokens(cached), 0.0, cache_hit=True)
+        yield cached
+        return
+
+    def open_stream():
+        # 每次（含重试）打开流前都要拿限流额度
+        rate_limiter.acquire(model, prompt_tokens + EXPECTED_COMPLETION_TOKENS)
+        stream = stream_chat_completion(model, system_prompt, input_text, LLM_TEMPERATURE)
+        return next(stream, ""), stream
+
+    started = time.monotonic()
+    retries = []
+    try:
+        first, stream = call_with_retry(open_stream, label=label, on_retry=lambda n, e: retries.append(n))
+        pieces = [first]
+        yield first
+        for piece in stream:
+            pieces.append(piece)
+            yield piece
+    except Exception as e:
+        telemetry.record_call(model, prompt_tokens, 0, time.monotonic() - started, retries=len(retries),
+                              error=repr(e))
+        raise
+    raw_output = "".join(pieces)
+    telemetry.record_call(model, prompt_tokens, estimate_tokens(raw_output), time.monotonic() - started,
+                          retries=len(retries))
+    llm_cache.put(model, LLM_TEMPERATURE, cache_prompt, raw_output)
+
+def record_salvage(result: Dict):
+    """解析结果同时计入容错解析统计和本线程最近一次调用的遥测记录"""
+    salvage_stats.record(result)
+    telemetry.record_parse(result["status"])
+
+def invoke_for_items(model: str, system_prompt: str, input_text: str, label: str,
+                     required_fields=REVIEW_POINT_FIELDS) -> List[Tuple[str, Dict]]:
+    """调用模型并容错解析：修复常见格式问题、保留完整元素；输出被截断时只请求续写剩余部分。
+    返回 [(实际给出该条的模型, item)]"""
+    answered, raw_output = invoke_llm(model, system_prompt, input_text, label)
+    result = salvage_review_points(raw_output, required_fields)
+    record_salvage(result)
+    items = [(answered, item) for item in result["items"]]
+    continuations = 0
+    while not result["complete"] and items and continuations < MAX_CONTINUATIONS:
+        continuations += 1
+        salvage_stats.record_continuation()
+        print(f"✂️  {label}: 输出在第 {len(items)} 条后截断，请求续写剩余部分")
+        answered, raw_output = invoke_llm(model, system_prompt,
+                                          build_continuation_input(input_text, [item for _, item in items]),
+                                          label=f"{label}+{continuations}")
+        result = salvage_review_points(raw_output, required_fields)
+        record_salvage(result)
+        items.extend((answered, item) for item in result["items"])
+    return items
+
+def build_block_prompt(block_type: str, section_id: str, content: str) -> Tuple[str, str]:
+    """单个 block 的 (system prompt, 用户输入)；实时、流式、批量文件共用"""
+    return (get_system_prompt(block_type, section_id),
+            f"根据以下内容生成审核点：\n{compact_block_content(block_type, content)}")
+
+def stream_review_points_for_block(block: Dict, on_point: Callable[[Dict], None]) -> List[Dict]:
+    """流式生成单个 block 的审核点：数组元素一闭合就校验、转换并回调 on_point，返回全部审核点。
+    输出被截断时与 invoke_for_items 一样只续写剩余部分（续写走非流式调用，结果整批回调）"""
+    system_prompt, input_text = build_block_prompt(block["block_type"], block["section_id"], block["content"])
+    parser = ReviewPointStreamParser()
+    source_hash = content_hash(block["content"])
+    pieces, points = [], []
+    model = model_router.candidates(block["block_type"], block["content"])[0]  # 流式边生成边写入，不做升档
+    started = time.monotonic()
+
+    def emit(item: Dict, answered: str):
+        # 与非流式路径相同的字段校验：question 等必须是非空字符串，type 归一
+        item = validate_review_item(item)
+        if item is not None:
+            point = to_review_point(item, block["block_id"], block["section_id"], source_hash, answered)
+            points.append(point)
+            on_point(point)
+
+    with telemetry.tags(block_id=block["block_id"], block_type=block["block_type"]):
+        for piece in stream_llm(model, system_prompt, input_text, label=block["block_id"]):
+            pieces.append(piece)
+            for item in parser.feed(piece):
+                emit(item, model)
+        if parser.state != "seek":
+            complete = parser.state == "done"
+            telemetry.record_parse("ok" if complete else "salvaged")
+        else:
+            # 增量扫描没找到 review_points 数组（如 key 不规范），回退整体解析
+            result = salvage_review_points("".join(pieces))
+            record_salvage(result)
+            for item in result["items"]:
+                emit(item, model)
+            complete = result["complete"]
+        continuations = 0
+        while not complete and points and continuations < MAX_CONTINUATIONS:
+            continuations += 1
+            salvage_stats.record_continuation()
+            print(f"✂️  {block['block_id']}: 流式输出在第 {len(points)} 条后截断，请求续写剩余部分")
+            answered, raw_output = invoke_llm(model, system_prompt, build_continuation_input(input_text, points),
+                                              label=f"{block['block_id']}+{continuations}")
+            result = salvage_review_points(raw_output)
+            record_salvage(result)
+            for item in result["items"]:
+                emit(item, answered)
+            complete = result["complete"]
+    accepted = count_accepted(points)
+    model_router.record_result(model, block["block_type"], len(points), accepted)
+    model_router.record_block(block["block_type"], model, time.monotonic() - started, 0, len(points), accepted)
+    return points
+
+def count_accepted(points: List[Dict]) -> int:
+    """通过 clean_review_point 的点数（单个 block 内去重），用于路由通过率和升档判断"""
+    seen = set()
+    return sum(1 for p in points if clean_review_point(p, seen))
+
+def generate_review_points_for_block(block_id: str, section_id: str, block_type: str,
+                                     content: Optional[str] = None, min_model: Optional[str] = None) -> List[Dict]:
+    """按路由选择模型；输出清洗后不合格时升到下一档重试（最高档的结果无论如何都返回）"""
+    if content is None:
+        content = get_block_content(block_id)
     if not content.strip():
         return []
 
-    llm = ChatOpenAI(
-        model="qwen-max",
-        openai_api_key=DASHSCOPE_API_KEY,
-        openai_api_base="https://dashscope.aliyuncs.com/compatible-mode/v1"
-    )
-    
-    system_prompt = get_system_prompt(block_type, section_id)
-    agent = create_react_agent(llm, tools=[], prompt=SystemMessage(content=system_prompt))
-    
-    input_text = f"根据以下内容生成审核点：\n{content}"
-    response = agent.invoke({"messages": [("user", input_text)]})
-    return parse_agent_output(response["messages"][-1].content, block_id, section_id)
-
-def generate_review_points_for_section(section_id: str) -> List[Dict]:
+    system_prompt, input_text = build_block_prompt(block_type, section_id, content)
+    started = time.monotonic()
+    models = model_router.candidates(block_type, content, min_model)
+    for escalations, model in enumerate(models):
+        with telemetry.tags(block_id=block_id, block_type=block_type):
+            items = invoke_for_items(model, system_prompt, input_text, label=f"{block_id}@{model}")
+        points = [to_review_point(item, block_id, section_id, content_hash(content), item_model)
+                  for item_model, item in items]
+        answered = items[0][0] if items else model  # 对冲副本胜出时按实际模型统计通过率
+        accepted = count_accepted(points)
+        model_router.record_result(answered, block_type, len(points), accepted)
+        if is_acceptable(len(points), accepted) or model == models[-1]:
+            break
+        print(f"⤴️  {block_id}: {model} 输出仅 {accepted}/{len(points)} 条通过清洗，升档重试")
+    model_router.record_block(block_type, answered, time.monotonic() - started, escalations, len(points), accepted)
+    return points
+
+def generate_review_points_for_section(section_id: str, chunk_tokens: int = SECTION_CHUNK_TOKENS,
+                                       concurrency: int = MAX_CONCURRENCY) -> List[Dict]:
+    """section 原文超过 chunk_tokens 时走 map-reduce，否则单次调用"""
     content = get_section_content(section_id)
     if not content.strip():
         return []
+    if estimate_tokens(content) > chunk_tokens:
+        return generate_review_points_for_section_mapreduce(section_id, chunk_tokens, concurrency)
 
-    llm = ChatOpenAI(
-        model="qwen-max",
-        openai_api_key=DASHSCOPE_API_KEY,
-        openai_api_base="https://dashscope.aliyuncs.com/compatible-mode/v1"
-    )
-    
     system_prompt = get_system_prompt("section", section_id)
-    agent = create_react_agent(llm, tools=[], prompt=SystemMessage(content=system_prompt))
-    
     input_text = f"根据以下章节内容生成审核点：\n{content}"
-    response = agent.invoke({"messages": [("user", input_text)]})
-    return parse_agent_output(response["messages"][-1].content, None, section_id)
+    with telemetry.tags(block_id=section_id, block_type="section"):
+        items = invoke_for_items(LLM_MODEL, system_prompt, input_text, label=section_id)
+    return [to_review_point(item, None, section_id, content_hash(content), answered) for answered, item in items]
 
-def parse_agent_output(raw_output: str, block_id: str, section_id: str) -> List[Dict]:
-    try:
-        json_match = re.search(r'\{.*\}', raw_output, re.DOTALL)
-        if not json_match:
+def generate_review_points_for_section_mapreduce(section_id: str, chunk_tokens: int = SECTION_CHUNK_TOKENS,
+                                                 concurrency: int = MAX_CONCURRENCY) -> List[Dict]:
+    """map：按子章节/block 边界切块并发生成；reduce：跨块去重"""
+    chunks = chunk_section_lines(get_section_lines(section_id), budget=chunk_tokens)
+    source_hash = content_hash("\n".join(chunk["content"] for chunk in chunks))
+    print(f"🧩 section {section_id} 超长，切分为 {len(chunks)} 块并发生成")
+    system_prompt = get_system_prompt("section", section_id)
+
+    def generate_chunk(indexed_chunk) -> List[Dict]:
+        index, chunk = indexed_chunk
+        input_text = (f"以下是章节 {section_id} 的第 {index}/{len(chunks)} 部分"
+                      f"（涵盖 {'、'.join(chunk['sections'])}），根据这部分内容生成审核点：\n{chunk['content']}")
+        with telemetry.tags(block_id=f"{section_id}#{index}", block_type="section"):
+            items = invoke_for_items(LLM_MODEL, system_prompt, input_text, label=f"{section_id}#{index}")
+        return [to_review_point(item, None, section_id, source_hash, answered) for answered, item in items]
+
+    chunk_points = [points for _, points in run_ordered(enumerate(chunks, start=1), generate_chunk,
+                                                           concurrency=concurrency)]
+    merged = reduce_points(chunk_points)
+    print(f"🧩 section {section_id} reduce：{sum(len(p) for p in chunk_points)} → {len(merged)} 条")
+    return merged
+
+def generate_sections_bottom_up(blocks: List[Dict], block_points: Dict[str, List[Dict]],
+                                concurrency: int = MAX_CONCURRENCY) -> Dict[str, List[Dict]]:
+    """从叶子到根逐层生成 section 审核点；父章节只看子 block / 子章节审核点摘要。同层并发"""
+    tree = build_section_tree(get_section_paths())
+    block_ids_by_section: Dict[str, List[str]] = {}
+    for block in blocks:
+        block_ids_by_section.setdefault(block["section_id"], []).append(block["block_id"])
+
+    section_points: Dict[str, List[Dict]] = {}
+
+    def generate_section(section_id: str) -> List[Dict]:
+        input_text = build_parent_input(section_id, tree, block_ids_by_section, block_points, section_points)
+        if input_text is None:
             return []
-        data = json.loads(json_match.group(0))
-        points = []
-        for item in data.get("review_points", []):
-            if all(k in item for k in ["type", "question", "evidence"]):
-                points.append({
-                    "review_id": f"RP_{block_id or section_id}_{hash(item['question']) % 10000}",
-                    "block_id": block_id,
-                    "section_id": section_id,
-                    "type": item["type"],
-                    "question": item["question"],
-                    "evidence": item["evidence"]
-                })
-        return points
-    except Exception as e:
-        print(f"⚠️ JSON 解析失败: {e}")
-        return []
+        print(f"🔍 生成 section {section_id} 的审核点（基于子项摘要）...")
+        with telemetry.tags(block_id=section_id, block_type="section"):
+            items = invoke_for_items(LLM_MODEL, get_hierarchical_system_prompt(section_id), input_text,
+                                     label=section_id)
+        return clean_review_points([dict(to_review_point(item, None, section_id, content_hash(input_text), answered),
+                                         generator="hierarchical") for answered, item in items])
+
+    for level in bottom_up_levels(tree):
+        for section_id, points in run_ordered(level, generate_section, concurrency=concurrency):
+            section_points[section_id] = points
+    return section_points
+
+def generate_review_points_for_pack(pack: List[Dict]) -> Dict[str, List[Dict]]:
+    """一次请求生成多个同类型 block 的审核点，返回 {block_id: points}；格式异常或漏块时回退逐块调用"""
+    if len(pack) == 1:
+        block = pack[0]
+        print(f"🔍 生成 {block['block_type']} block {block['block_id']} 的审核点...")
+        return {block["block_id"]: generate_review_points_for_block(
+            block["block_id"], block["section_id"], block["block_type"], block["content"])}
+
+    # 打包请求用成员中最高的初始档位；个别 block 不合格时单独升档
+    model = max((model_router.initial_model(b["block_type"], b["content"]) for b in pack),
+                key=MODEL_TIERS.index)
+    print(f"🔍 打包生成 {len(pack)} 个 {pack[0]['block_type']} block 的审核点（{pack[0]['block_id']} 起，{model}）...")
+    started = time.monotonic()
+    compacted = [dict(b, content=compact_block_content(b["block_type"], b["content"])) for b in pack]
+    with telemetry.tags(block_id=pack[0]["block_id"], block_type=pack[0]["block_type"], pack_size=len(pack)):
+        answered, raw_output = invoke_llm(model, get_packed_system_prompt(pack[0]["block_type"]),
+                                          format_pack_input(compacted), label=f"pack:{pack[0]['block_id']}@{model}")
+    elapsed = (time.monotonic() - started) / len(pack)
+    salvaged = salvage_review_points(raw_output, REVIEW_POINT_FIELDS + ("source_block_id",))
+    record_salvage(salvaged)
+    grouped = split_pack_output(salvaged, pack)
+    if grouped is None:
+        print(f"⚠️ 打包结果格式异常，回退逐块调用（{len(pack)} 个 block）")
+        grouped = {}
+
+    results = {}
+    for block in pack:
+        items = grouped.get(block["block_id"])
+        if items:
+            points = [to_review_point(item, block["block_id"], block["section_id"], content_hash(block["content"]),
+                                      answered) for item in items if is_complete_item(item)]
+            accepted = count_accepted(points)
+            model_router.record_result(answered, block["block_type"], len(points), accepted)
+            if is_acceptable(len(points), accepted) or not model_router.next_model(model):
+                model_router.record_block(block["block_type"], answered, elapsed, 0, len(points), accepted)
+                results[block["block_id"]] = points
+                continue
+            print(f"⤴️  {block['block_id']}: 打包输出仅 {accepted}/{len(points)} 条通过清洗，单独升档重试")
+            results[block["block_id"]] = generate_review_points_for_block(
+                block["block_id"], block["section_id"], block["block_type"], block["content"],
+                min_model=model_router.next_model(model))
+        else:
+            results[block["block_id"]] = generate_review_points_for_block(
+                block["block_id"], block["section_id"], block["block_type"], block["content"])
+    return results
+
+def is_complete_item(item: Dict) -> bool:
+    return all(k in item for k in ["type", "question", "evidence"])
+
+def to_review_point(item: Dict, block_id: Optional[str], section_id: str, source_hash: str,
+                    model: Optional[str] = None) -> Dict:
+    """source_hash 为生成该点所用原文的哈希，参与内容寻址的 review_id；model 为实际产出该点的模型（路由/升档后）"""
+    return {
+        "review_id": make_review_id(block_id or section_id, source_hash, PROMPT_VERSION, item["question"]),
+        "content_hash": source_hash,
+        "block_id": block_id,
+        "section_id": section_id,
+        "model": model,
+        "type": item["type"],
+        "question": item["question"],
+        "evidence": item["evidence"]
+    }
+
+def parse_agent_output(raw_output: str, block_id: str, section_id: str, source_hash: str,
+                       model: Optional[str] = None) -> List[Dict]:
+    """容错解析一段完整回复（不续写）"""
+    result = salvage_review_points(raw_output)
+    record_salvage(result)
+    if result["status"] == "failed":
+        print(f"⚠️ JSON 解析失败（{block_id or section_id}）")
+    return [to_review_point(item, block_id, section_id, source_hash, model) for item in result["items"]]
 
 # ================== 保存到 Neo4j ==================
-def save_review_points(points: List[Dict]):
+def save_review_points(points: List[Dict], run_id: str):
+    if not points:
+        return
     query = """
+    UNWIND $points AS p
     CREATE (:ReviewPoint {
-      review_id: $review_id,
-      block_id: $block_id,
-      section_id: $section_id,
-      type: $type,
-      question: $question,
-      evidence: $evidence,
+      review_id: p.review_id,
+      run_id: $run_id,
+      content_hash: p.content_hash,
+      prompt_version: $prompt_version,
+      generator: coalesce(p.generator, 'llm'),
+      generated_from: p.generated_from,
+      model: p.model,
+      block_id: p.block_id,
+      section_id: p.section_id,
+      type: p.type,
+      question: p.question,
+      evidence: p.evidence,
       created_at: timestamp()
     })
     """
     with driver.session() as session:
-        for p in points:
-            session.run(query, p)
+        session.run(query, points=points, run_id=run_id, prompt_version=PROMPT_VERSION).consume()
+    touch_generation_run(driver, run_id)
 
-# ================== 主流程 ==================
-def main():
-    # 🔥 新增：清理旧数据
-    clear_existing_review_points()
-    # 1. 生成 block 审核点
-    block_query = """
-    MATCH (l:Line)
-    WHERE l.block_id IS NOT NULL AND l.block_type IN ['concern', 'table', 'example']
-    RETURN DISTINCT l.block_id, l.parent_section, l.block_type
-    """
+def collapse_near_duplicates(run_id: str, block_points: Dict[str, List[Dict]],
+                             threshold: float = NEAR_DUP_THRESHOLD) -> Dict[str, List[Dict]]:
+    """同一 section 内跨 block 的近似重复审核点只保留代表点：删除其余节点，代表点记录被合并的来源"""
+    points = [p for block_list in block_points.values() for p in block_list]
+    merged = merge_near_duplicates(points, threshold, scope=lambda p: p["section_id"])
+    dropped = [rid for rep in merged for rid in rep["merged_review_ids"] if rid != rep["review_id"]]
+    updates = [{
+        "review_id": rep["review_id"],
+        "merged_review_ids": rep["merged_review_ids"],
+        "source_block_ids": rep["source_block_ids"]
+    } for rep in merged if rep["cluster_size"] > 1]
+    if dropped:
+        with driver.session() as session:
+            session.run("""
+            MATCH (r:ReviewPoint {run_id: $run_id}) WHERE r.review_id IN $dropped
+            DETACH DELETE r
+            """, run_id=run_id, dropped=dropped).consume()
+            session.run("""
+            UNWIND $updates AS u
+            MATCH (r:ReviewPoint {run_id: $run_id, review_id: u.review_id})
+            SET r.merged_review_ids = u.merged_review_ids, r.source_block_ids = u.source_block_ids
+            """, run_id=run_id, updates=updates).consume()
+    print(f"🧬 近似去重：{len(points)} → {len(merged)} 条（{len(updates)} 个簇被合并）")
+    kept = {rep["review_id"] for rep in merged}
+    return {block_id: [p for p in block_list if p["review_id"] in kept] for block_id, block_list in block_points.items()}
+
+def evidence_scopes(points: List[Dict], lines: List[Dict]) -> List[Optional[Set[int]]]:
+    """每条审核点优先匹配的行号：block 点取自身及被合并来源 block 的行，section 点取该章节下的行"""
+    block_lines: Dict[str, Set[int]] = {}
+    for line in lines:
+        if line.get("block_id"):
+            block_lines.setdefault(line["block_id"], set()).add(line["line_number"])
+    scopes: List[Optional[Set[int]]] = []
+    for p in points:
+        if p.get("block_id"):
+            block_ids = [p["block_id"]] + list(p.get("source_block_ids") or [])
+            scopes.append(set().union(*(block_lines.get(b, set()) for b in block_ids)))
+        else:
+            scopes.append({l["line_number"] for l in lines if p["section_id"] in (l.get("section_path") or [])})
+    return scopes
+
+def evidence_in_children(point: Dict, points: List[Dict]) -> bool:
+    """自底向上的 section 点引用的是子项审核点，在该章节下其他审核点的问题 / evidence 中核对"""
+    pattern = normalize_evidence(point.get("evidence") or "")
+    section_id = point["section_id"]
+    children = [p for p in points if p is not point and
+                (p["section_id"] == section_id or p["section_id"].startswith(section_id + "."))]
+    return bool(pattern) and any(pattern in normalize_evidence(c["question"]) or
+                                 pattern in normalize_evidence(c.get("evidence") or "") for c in children)
+
+def verify_run_evidence(run_id: str, policy: str = "flag") -> int:
+    """evidence 原文定位：优先在审核点自身 block / 章节的行内匹配，找不到再退回全文；
+    命中的写入行号/字符偏移，未命中的按 policy 标记（flag）或删除（reject）。返回剩余审核点数"""
+    points = get_run_review_points(run_id)
+    if not points:
+        return 0
+    hierarchical = [p for p in points if p.get("generator") == "hierarchical"]
+    text_points = [p for p in points if p.get("generator") != "hierarchical"]
+    lines = get_document_lines()
+    spans = DocumentIndex(lines).locate_many([p.get("evidence") or "" for p in text_points],
+                                             evidence_scopes(text_points, lines))
+    located = [dict(span, review_id=p["review_id"]) for p, span in zip(text_points, spans) if span]
+    from_children = [p["review_id"] for p in hierarchical if evidence_in_children(p, points)]
+    missing = [p["review_id"] for p, span in zip(text_points, spans) if not span]
+    missing += [p["review_id"] for p in hierarchical if p["review_id"] not in from_children]
     with driver.session() as session:
-        blocks = list(session.run(block_query))
-        for record in blocks:
-            block_id = record["l.block_id"]
-            section_id = record["l.parent_section"]
-            block_type = record["l.block_type"]
-            print(f"🔍 生成 {block_type} block {block_id} 的审核点...")
-            points = generate_review_points_for_block(block_id, section_id, block_type)
-            points = clean_review_points(points)  # ← 新增清洗
-
-            save_review_points(points)
-    
-    # 2. 生成 section 审核点
-    section_query = """
-    MATCH (l:Line)
-    WHERE l.section_path IS NOT NULL
-    UNWIND l.section_path AS path
-    WITH path WHERE path STARTS WITH '2.3.P.'
-    RETURN DISTINCT path AS section_id
-    ORDER BY section_id
-    """
-    # with driver.session() as session:
-    #     sections = [r["section_id"] for r in session.run(section_query)]
-    #     for sec_id in sections:
-    #         print(f"🔍 生成 section {sec_id} 的审核点...")
-    #         points = generate_review_points_for_section(sec_id)
-    #         points = clean_review_points(points)
-    #         save_review_points(points)
-    
+        session.run("""
+        UNWIND $located AS s
+        MATCH (r:ReviewPoint {run_id: $run_id, review_id: s.review_id})
+        SET r.evidence_verified = true, r.evidence_scope = s.evidence_scope,
+            r.evidence_start_line = s.evidence_start_line, r.evidence_start_offset = s.evidence_start_offset,
+            r.evidence_end_line = s.evidence_end_line, r.evidence_end_offset = s.evidence_end_offset
+        """, run_id=run_id, located=located).consume()
+        session.run("""
+        MATCH (r:ReviewPoint {run_id: $run_id}) WHERE r.review_id IN $ids
+        SET r.evidence_verified = true, r.evidence_scope = 'children'
+        """, run_id=run_id, ids=from_children).consume()
+        if policy == "reject":
+            session.run("""
+            MATCH (r:ReviewPoint {run_id: $run_id}) WHERE r.review_id IN $missing
+            DETACH DELETE r
+            """, run_id=run_id, missing=missing).consume()
+        else:
+            session.run("""
+            MATCH (r:ReviewPoint {run_id: $run_id}) WHERE r.review_id IN $missing
+            SET r.evidence_verified = false
+            """, run_id=run_id, missing=missing).consume()
+    fallback = sum(1 for span in located if span["evidence_scope"] == "document")
+    action = "已删除" if policy == "reject" else "已标记"
+    print(f"🔎 evidence 定位：{len(located) + len(from_children)}/{len(points)} 条找到出处"
+          f"（{fallback} 条只在所属 block/章节外找到，{len(from_children)} 条章节点出自子项审核点），"
+          f"{len(missing)} 条疑似编造（{action}）")
+    return len(points) - len(missing) if policy == "reject" else len(points)
+
+# ================== 干跑估算（--plan） ==================
+def plan_generation(lines: List[Dict], concurrency: int = MAX_CONCURRENCY, pack_budget: int = PACK_TOKEN_BUDGET,
+                    with_sections: bool = False, section_chunk_tokens: int = SECTION_CHUNK_TOKENS,
+                    hierarchical: bool = False, rule_tiering: bool = True, block_dedup: bool = True) -> Dict:
+    """按 main 的流程列出将发出的请求并估算，不调用模型、不写 Neo4j"""
+    started = time.perf_counter()
+    blocks = [b for b in blocks_from_lines(lines) if b["content"].strip()]
+    rule_results, llm_blocks = tier_blocks(blocks) if rule_tiering else ({}, blocks)
+    if block_dedup:
+        groups = group_duplicate_blocks(llm_blocks)
+        dedup_report(llm_blocks, groups, calls_for=lambda bs: len(pack_blocks(bs, budget=pack_budget)))
+        representatives = [group[0] for group in groups.values()]
+    else:
+        representatives = llm_blocks
+
+    calls = []
+    for job in pack_blocks(representatives, budget=pack_budget):
+        block_type = job[0]["block_type"]
+        completion = sum(PLAN_COMPLETION_TOKENS[b["block_type"]] for b in job)
+        if len(job) == 1:
+            model = model_router.initial_model(block_type, job[0]["content"])
+            system_prompt, input_text = build_block_prompt(block_type, job[0]["section_id"], job[0]["content"])
+            calls.append(planned_call(model, block_type, system_prompt, input_text, completion))
+        else:
+            model = max((model_router.initial_model(b["block_type"], b["content"]) for b in job),
+                        key=MODEL_TIERS.index)
+            compacted = [dict(b, content=compact_block_content(b["block_type"], b["content"])) for b in job]
+            calls.append(planned_call(model, f"pack:{block_type}", get_packed_system_prompt(block_type),
+                                      format_pack_input(compacted), completion))
+
+    section_lines = [l for l in lines if l.get("block_id") and l.get("section_path")]
+    if with_sections and hierarchical:
+        # 父章节输入为子项审核点摘要，按子 block / 子章节数粗估
+        tree = build_section_tree([l["section_path"] for l in section_lines])
+        child_blocks: Dict[str, int] = {}
+        for block in blocks:
+            child_blocks[block["section_id"]] = child_blocks.get(block["section_id"], 0) + 1
+        for section_id, node in tree.items():
+            children = child_blocks.get(section_id, 0) + len(node["children"])
+            if children:
+                calls.append(planned_call(LLM_MODEL, "section", get_hierarchical_system_prompt(section_id), "",
+                                          PLAN_COMPLETION_TOKENS["section"],
+                                          input_tokens=children * POINTS_PER_CHILD * POINT_SUMMARY_TOKENS))
+    elif with_sections:
+        section_ids = sorted({p for l in lines for p in (l.get("section_path") or []) if p.startswith("2.3.P.")})
+        for section_id in section_ids:
+            sec_lines = [l for l in section_lines if any(p.startswith(section_id) for p in l["section_path"])]
+            content = "\n".join(l["text"] for l in sec_lines)
+            if not content.strip():
+                continue
+            system_prompt = get_system_prompt("section", section_id)
+            if estimate_tokens(content) > section_chunk_tokens:
+                for chunk in chunk_section_lines(sec_lines, budget=section_chunk_tokens):
+                    calls.append(planned_call(LLM_MODEL, "section-map", system_prompt, chunk["content"],
+                                              PLAN_COMPLETION_TOKENS["section"]))
+            else:
+                calls.append(planned_call(LLM_MODEL, "section", system_prompt, content,
+                                          PLAN_COMPLETION_TOKENS["section"]))
+
+    plan = plan_report(calls, concurrency, f"运行计划（{len(blocks)} 个 block，规则直出 {len(rule_results)} 个）")
+    print(f"   - 计划耗时 {time.perf_counter() - started:.3f}s，未调用任何模型")
+    return plan
+
+# ================== 离线批量推理 ==================
+def select_llm_blocks(blocks: List[Dict], rule_tiering: bool = True, block_dedup: bool = True) -> List[Dict]:
+    """规则分层、重复 block 合并之后仍需 LLM 生成的代表 block（与 main 的选择一致）"""
+    _, llm_blocks = tier_blocks(blocks) if rule_tiering else ({}, blocks)
+    if not block_dedup:
+        return llm_blocks
+    groups = group_duplicate_blocks(llm_blocks)
+    return [group[0] for group in groups.values()]
+
+def write_batch_file(path: str, blocks: List[Dict], rule_tiering: bool = True, block_dedup: bool = True) -> int:
+    """把需要 LLM 的 block 写成批量请求文件；模型取路由的初始档位（批量模式不升档）"""
+    blocks = [b for b in blocks if b["content"].strip()]
+    requests = []
+    for block in select_llm_blocks(blocks, rule_tiering, block_dedup):
+        system_prompt, input_text = build_block_prompt(block["block_type"], block["section_id"], block["content"])
+        requests.append(build_batch_request(
+            make_custom_id(block["block_id"], content_hash(block["content"])),
+            model_router.initial_model(block["block_type"], block["content"]),
+            system_prompt, input_text, LLM_TEMPERATURE))
+    write_batch_requests(Path(path), requests)
+    print(f"📤 已写出 {len(requests)} 条批量请求（{len(blocks)} 个 block）→ {path}")
+    return len(requests)
+
+# ================== 分布式 worker（工作队列） ==================
+def delete_block_points(run_id: str, block_ids: List[str]):
+    """删除批次中指定 block 的审核点；任务被重新领取重做时先删后写，结果不会重复"""
+    with driver.session() as session:
+        session.run("""
+        MATCH (r:ReviewPoint {run_id: $run_id}) WHERE r.block_id IN $block_ids
+        DETACH DELETE r
+        """, run_id=run_id, block_ids=block_ids).consume()
+
+def enqueue_run(queue: WorkQueue, rule_tiering: bool = True, block_dedup: bool = True,
+                pack_budget: int = PACK_TOKEN_BUDGET) -> str:
+    """创建批次、写入规则层审核点，并把重复 block 组的代表按 main 相同的方式打包，每个包一个任务（队列名即 run_id）"""
+    ensure_review_schema()
+    run_id = start_run()
+    try:
+        blocks = [b for b in get_blocks_with_content() if b["content"].strip()]
+        rule_results, llm_blocks = tier_blocks(blocks) if rule_tiering else ({}, blocks)
+        rule_count = 0
+        blocks_by_id = {block["block_id"]: block for block in blocks}
+        for block_id, points in rule_results.items():
+            points = clean_review_points(points)
+            save_review_points(points, run_id)
+            save_block_states(run_id, [block_state(blocks_by_id[block_id], points)])
+            rule_count += len(points)
+        if block_dedup:
+            groups = group_duplicate_blocks(llm_blocks)
+        else:
+            groups = {block["block_id"]: [block] for block in llm_blocks}
+        jobs = []
+        for pack in pack_blocks([members[0] for members in groups.values()], budget=pack_budget):
+            pack_hash = content_hash("\n".join(block["content"] for block in pack))
+            jobs.append((make_custom_id(pack[0]["block_id"], pack_hash),
+                         {"run_id": run_id, "groups": [groups[block["block_id"]] for block in pack]}))
+        added = queue.enqueue(run_id, jobs)
+    except BaseException as e:
+        fail_generation_run(driver, run_id, repr(e))
+        raise
+    print(f"📮 批次 {run_id}：规则生成 {rule_count} 条审核点，{added} 个任务入队（覆盖 {len(llm_blocks)} 个 block）")
+    print(f"   启动 worker：python generate_review_points.py --worker {run_id}；队列排空后 --finalize {run_id}")
+    return run_id
+
+def process_job(job: Dict) -> Dict[str, List[Dict]]:
+    """一次请求生成包内各代表 block 的审核点并分发给组内成员，返回 {block_id: 清洗后的 points}"""
+    groups = job["payload"]["groups"]
+    results = generate_review_points_for_pack([members[0] for members in groups])
+    points_by_block = {}
+    for members in groups:
+        rep_id = members[0]["block_id"]
+        for member in members:
+            points_by_block[member["block_id"]] = clean_review_points(
+                fan_out_points(results[rep_id], member, rep_id, PROMPT_VERSION))
+    return points_by_block
+
+def run_worker(queue: WorkQueue, queue_name: Optional[str] = None, worker_id: Optional[str] = None,
+               concurrency: int = 1, poll_seconds: float = 5.0, exit_when_idle: bool = True) -> int:
+    """循环领取任务 → 生成 → 确认租约后写入 Neo4j → 完成；每个并发槽独立持有租约。返回完成的任务数"""
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    stats = LatencyStats()
+
+    def loop(slot: int):
+        slot_id = f"{worker_id}/{slot}"
+        while True:
+            job = queue.lease(slot_id, queue_name)
+            if job is None:
+                counts = queue.counts(queue_name)
+                if exit_when_idle and not counts["queued"] and not counts["leased"] and not counts["committing"]:
+                    return
+                time.sleep(poll_seconds)  # 退避中的任务或其他 worker 持有的租约可能还会回到队列
+                continue
+            started = time.monotonic()
+            try:
+                run_id = job["payload"]["run_id"]
+                touch_generation_run(driver, run_id)
+                with LeaseKeeper(queue, job) as keeper, telemetry.tags(run_id=run_id):
+                    points_by_block = process_job(job)
+                    members = [member for group in job["payload"]["groups"] for member in group]
+
+                    def commit():
+                        # 仅在 complete 确认租约仍属本 worker 后执行；先删后写，被重新领取重做时结果不重复
+                        delete_block_points(run_id, list(points_by_block))
+                        save_review_points([p for points in points_by_block.values() for p in points], run_id)
+                        save_block_states(run_id, [block_state(m, points_by_block[m["block_id"]]) for m in members])
+
+                    # 续约在写入期间继续进行
+                    if keeper.lost or not queue.complete(job["queue"], job["job_id"], job["lease_token"], commit):
+                        print(f"⚠️ 任务 {job['job_id']} 的租约已被收回，结果丢弃（由新持有者重做）")
+                        continue
+                stats.record(time.monotonic() - started)
+            except Exception as e:
+                status = queue.fail(job["queue"], job["job_id"], job["lease_token"], repr(e))
+                print(f"⚠️ 任务 {job['job_id']} 第 {job['attempts']} 次失败（→ {status}）：{e!r}")
+
+    threads = [threading.Thread(target=loop, args=(slot,)) for slot in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats.report(f"worker {worker_id} 完成任务（并发 {concurrency}）")
+    llm_cache.report()
+    model_router.report()
+    salvage_stats.report()
+    hedger.report()
+    model_router.save()
+    telemetry.close()
+    return stats.summary()["count"]
+
+def finalize_run(queue: WorkQueue, run_id: str, near_dedup: bool = True, evidence_policy: str = "flag") -> int:
+    """队列排空后收尾：近似去重、evidence 定位，再切换 latest 指针；有死信时拒绝切换"""
+    counts = queue.counts(run_id)
+    if counts["queued"] or counts["leased"] or counts["committing"]:
+        raise ValueError(f"批次 {run_id} 还有 {counts['queued']} 个排队、"
+                         f"{counts['leased'] + counts['committing']} 个进行中的任务")
+    dead = queue.dead_letters(run_id)
+    if dead:
+        for letter in dead:
+            print(f"💀 {letter['job_id']}（{letter['attempts']} 次）：{letter['last_error']}")
+        raise ValueError(f"批次 {run_id} 有 {len(dead)} 个死信任务，修复后用 --requeue-dead {run_id} 重放")
+    try:
+        block_points: Dict[str, List[Dict]] = {}
+        for point in get_run_review_points(run_id):
+            block_points.setdefault(point["block_id"], []).append(point)
+        if near_dedup:
+            block_points = collapse_near_duplicates(run_id, block_points)
+        total_points = sum(len(points) for points in block_points.values())
+        if evidence_policy != "off":
+            total_points = verify_run_evidence(run_id, evidence_policy)
+    except BaseException as e:
+        fail_generation_run(driver, run_id, repr(e))
+        raise
+    print(f"🧾 队列：{counts['done']} 个任务完成")
+    # 调用分散在各 worker 进程里，这里不汇总 model_calls；每条审核点的实际模型见 ReviewPoint.model
+    complete_generation_run(driver, run_id, total_points)
+    prune_old_runs_in_background()
+    return total_points
+
+# ================== 主流程 ==================
+def main(concurrency: int = MAX_CONCURRENCY, pack_budget: int = PACK_TOKEN_BUDGET,
+         with_sections: bool = False, section_chunk_tokens: int = SECTION_CHUNK_TOKENS,
+         hierarchical: bool = False, stream: bool = False, resume: Optional[str] = None,
+         incremental: bool = False, near_dedup: bool = True, evidence_policy: str = "flag",
+         rule_tiering: bool = True, block_dedup: bool = True,
+         batch_results: Optional[Dict[str, Tuple[Optional[str], Optional[str]]]] = None):
+    # 新批次写入独立 run_id，完成后再原子切换 latest 指针；旧批次在后台分批清理
+    ensure_review_schema()
+    finished: Dict[str, Dict] = {}
+    if resume:
+        run_id = find_resumable_run() if resume == "latest" else resume
+        if not run_id or not resume_generation_run(run_id):
+            raise ValueError(f"没有可续跑的批次: {resume}")
+        journal = RunJournal(run_id)
+        finished = journal.completed_blocks()
+        print(f"⏯️  续跑批次 {run_id}：日志中已完成 {len(finished)} 个 block")
+    else:
+        run_id = start_run()
+        journal = RunJournal(run_id)
+        journal.record_start(ROUTED_MODEL if model_router.enabled else LLM_MODEL, PROMPT_VERSION)
+    telemetry.run_id = run_id
+    total_points = 0
+    try:
+        # 1. 生成 block 审核点（按首行行号排序，保证输出顺序稳定）
+        blocks = [b for b in get_blocks_with_content() if b["content"].strip()]
+        previous = get_latest_block_points() if incremental else {}
+        block_points: Dict[str, List[Dict]] = {}
+        carried, todo = [], []
+        for block in blocks:
+            block_hash = content_hash(block["content"])
+            record = finished.get(block["block_id"])
+            prev = previous.get(block["block_id"])
+            if record and record["content_hash"] == block_hash:
+                block_points[block["block_id"]] = record["points"]
+                total_points += len(record["points"])
+            elif prev and prev["content_hash"] == block_hash and prev["generation_version"] == GENERATION_VERSION:
+                carried.append(block)
+                block_points[block["block_id"]] = prev["points"]
+            else:
+                todo.append(block)
+        if resume:
+            # 只保留日志中已完成 block 的审核点；增量复用的 block 下面会重新写入，崩溃前写了一半的也先删掉，避免重复
+            carried_ids = {block["block_id"] for block in carried}
+            delete_partial_points(run_id, [block_id for block_id in block_points if block_id not in carried_ids])
+            print(f"⏯️  跳过 {len(blocks) - len(todo) - len(carried)} 个已完成 block，剩余 {len(todo)} 个")
+        if incremental:
+            # 原文和生成版本都没变的 block 直接复制上一批次的原始审核点（review_id 内容寻址，保持不变），
+            # 近似去重和 evidence 定位在本批次重新执行；0 条审核点的 block 同样复用
+            for block in carried:
+                points = block_points[block["block_id"]]
+                save_review_points(points, run_id)
+                save_block_states(run_id, [block_state(block, points)])
+                journal.record_block(block["block_id"], content_hash(block["content"]), points)
+                total_points += len(points)
+            print(f"♻️  增量模式：复用 {len(carried)} 个未变 block，重新生成 {len(todo)} 个")
+
+        # 规则优先：模板可推导的 block 不调用 LLM，其结果与 LLM 结果一样按 block 顺序写入
+        rule_results, llm_blocks = tier_blocks(todo) if rule_tiering else ({}, todo)
+        if batch_results is not None:
+            pack_budget, stream = 0, False  # 批量结果按 block 的 custom_id 对应
+        if stream:
+            pack_budget = 0  # 流式模式逐块请求，每条审核点解析出来就写入
+            for block_id, points in rule_results.items():
+                rule_results[block_id] = clean_review_points(points)
+                save_review_points(rule_results[block_id], run_id)
+        # 相同/几乎相同的 block 只生成代表，结果再分发给组内其他 block
+        if block_dedup:
+            groups = group_duplicate_blocks(llm_blocks)
+            dedup_report(llm_blocks, groups, calls_for=lambda bs: len(pack_blocks(bs, budget=pack_budget)))
+        else:
+            groups = {block["block_id"]: [block] for block in llm_blocks}
+        representatives = [group[0] for group in groups.values()]
+        compaction_report(representatives)
+        jobs = pack_blocks(representatives, budget=pack_budget)
+        packing_report(representatives, jobs, estimate_tokens(get_packed_system_prompt("concern")))
+
+        # 并发调用 LLM；打包作业的结果先缓存，按 block 顺序依次清洗、写入
+        stats = LatencyStats()
+        pending: Dict[str, List[Dict]] = dict(rule_results)
+        next_index = 0
+        first_point_stats = LatencyStats()
+
+        def flush_ready():
+            nonlocal next_index, total_points
+            while next_index < len(todo) and todo[next_index]["block_id"] in pending:
+                block = todo[next_index]
+                points = pending.pop(block["block_id"])
+                if not stream:
+                    points = clean_review_points(points)  # ← 新增清洗
+                    save_review_points(points, run_id)
+                save_block_states(run_id, [block_state(block, points)])
+                journal.record_block(block["block_id"], content_hash(block["content"]), points)  # 写入 Neo4j 后再记日志
+                block_points[block["block_id"]] = points
+                total_points += len(points)
+                next_index += 1
+
+        def stream_job(job: List[Dict]) -> Dict[str, List[Dict]]:
+            # 流式：每条审核点清洗后立即写入（写入顺序按到达顺序）
+            block = job[0]
+            print(f"🔍 流式生成 {block['block_type']} block {block['block_id']} 的审核点...")
+            started, seen, saved = time.monotonic(), set(), []
+
+            def on_point(point: Dict):
+                cleaned = clean_review_point(point, seen)
+                if cleaned:
+                    if not saved:
+                        first_point_stats.record(time.monotonic() - started)
+                    save_review_points([cleaned], run_id)
+                    saved.append(cleaned)
+
+            stream_review_points_for_block(block, on_point)
+            return {block["block_id"]: saved}
+
+        batch_missing: List[str] = []
+
+        def batch_job(job: List[Dict]) -> Dict[str, List[Dict]]:
+            # 批量结果走与实时调用相同的解析 → 清洗 → 写入路径；缺失、失败或原文已变的 block 实时补齐
+            block = job[0]
+            block_hash = content_hash(block["content"])
+            model, raw_output = batch_results.get(make_custom_id(block["block_id"], block_hash), (None, None))
+            if raw_output is None:
+                batch_missing.append(block["block_id"])
+                return generate_review_points_for_pack(job)
+            # 模型取请求文件写出时选的档位（custom_id 带回）；旧格式结果文件没有时才按当前路由推断
+            model = model or model_router.initial_model(block["block_type"], block["content"])
+            return {block["block_id"]: parse_agent_output(raw_output, block["block_id"], block["section_id"], block_hash,
+                                                          model)}
+
+        if batch_results is not None:
+            worker = batch_job
+        else:
+            worker = stream_job if stream else generate_review_points_for_pack
+        flush_ready()
+        for _, results in run_ordered(jobs, worker, concurrency=concurrency, stats=stats):
+            for rep_id, points in results.items():
+                for member in groups[rep_id]:
+                    fanned = fan_out_points(points, member, rep_id, PROMPT_VERSION)
+                    if stream and member["block_id"] != rep_id:
+                        fanned = clean_review_points(fanned)  # 代表的点已在流式回调中写入，成员的点在此写入
+                        save_review_points(fanned, run_id)
+                    pending[member["block_id"]] = fanned
+            flush_ready()
+        stats.report(f"block 审核点生成（{len(jobs)} 次请求，并发 {concurrency}）")
+        if batch_results is not None:
+            print(f"📥 批量结果：{len(jobs) - len(batch_missing)}/{len(jobs)} 个 block 使用结果文件，"
+                  f"{len(batch_missing)} 个缺失或原文已变，已实时补齐")
+        if stream:
+            first_point_stats.report("首条审核点耗时")
+        llm_cache.report()
+        model_router.report()
+        salvage_stats.report()
+        hedger.report()
+        model_router.save()
+        if near_dedup:
+            block_points = collapse_near_duplicates(run_id, block_points)
+            total_points = sum(len(points) for points in block_points.values())
+
+        # 2. 生成 section 审核点
+        section_query = """
+        MATCH (l:Line)
+        WHERE l.section_path IS NOT NULL
+        UNWIND l.section_path AS path
+        WITH path WHERE path STARTS WITH '2.3.P.'
+        RETURN DISTINCT path AS section_id
+        ORDER BY section_id
+        """
+        if with_sections and hierarchical:
+            # 自底向上：复用上面已生成的 block 审核点，父章节不再重发原文
+            for points in generate_sections_bottom_up(blocks, block_points, concurrency).values():
+                save_review_points(points, run_id)
+                total_points += len(points)
+        elif with_sections:
+            with driver.session() as session:
+                sections = [r["section_id"] for r in session.run(section_query)]
+            for sec_id in sections:
+                print(f"🔍 生成 section {sec_id} 的审核点...")
+                points = generate_review_points_for_section(sec_id, section_chunk_tokens, concurrency)
+                points = clean_review_points(points)
+                save_review_points(points, run_id)
+                total_points += len(points)
+        if evidence_policy != "off":
+            total_points = verify_run_evidence(run_id, evidence_policy)
+    except BaseException as e:
+        fail_generation_run(driver, run_id, repr(e))
+        telemetry.close()
+        raise
+
+    complete_generation_run(driver, run_id, total_points, model_calls=model_call_counts())
+    journal.record_complete()
+    telemetry.close()
+    prune_old_runs_in_background()
     # print("✅ 审核点生成完成！")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="基于 Neo4j 中的 Line 节点生成 ReviewPoint")
+    parser.add_argument("--concurrency", type=int, default=MAX_CONCURRENCY, help="并发 LLM 调用数")
+    parser.add_argument("--no-cache", action="store_true", help="跳过 LLM 缓存读取（仍写入新结果）")
+    parser.add_argument("--pack-budget", type=int, default=PACK_TOKEN_BUDGET,
+                        help="小 block 打包请求的原文 token 上限，0 表示逐块调用")
+    parser.add_argument("--sections", action="store_true", help="同时生成 section 级综合审核清单")
+    parser.add_argument("--section-chunk-tokens", type=int, default=SECTION_CHUNK_TOKENS,
+                        help="section 原文超过该 token 数时走 map-reduce")
+    parser.add_argument("--hierarchical", action="store_true",
+                        help="配合 --sections：自底向上，父章节基于子项审核点摘要生成")
+    parser.add_argument("--stream", action="store_true", help="流式生成：每条审核点解析完成即写入 Neo4j")
+    parser.add_argument("--resume", nargs="?", const="latest", default=None, metavar="RUN_ID",
+                        help="续跑未完成的批次（不带 RUN_ID 时取最近一个未完成的批次）")
+    parser.add_argument("--incremental", action="store_true",
+                        help="只为原文或 Prompt 版本有变化的 block 重新生成，其余复用 latest 批次")
+    parser.add_argument("--no-near-dedup", action="store_true", help="关闭跨 block 的近似重复合并")
+    parser.add_argument("--evidence-policy", choices=["flag", "reject", "off"], default="flag",
+                        help="evidence 在原文中找不到时：flag 标记 evidence_verified=false，reject 删除，off 不校验")
+    parser.add_argument("--no-block-dedup", action="store_true", help="关闭重复 block 识别，每个 block 单独生成")
+    parser.add_argument("--no-hedge", action="store_true", help="关闭超过 p95 时的对冲请求")
+    parser.add_argument("--no-routing", action="store_true", help="关闭按 block 选模型，全部使用 qwen-max")
+    parser.add_argument("--plan", action="store_true", help="干跑：只估算请求数、token、耗时和费用，不调用模型")
+    parser.add_argument("--lines-json", default=None,
+                        help="配合 --plan：从 pdf_to_structured_lines 输出的 JSON 读取，而不是 Neo4j")
+    parser.add_argument("--batch-write", metavar="PATH", default=None,
+                        help="离线批量：只把需要 LLM 的 block 写成 JSONL 批量请求文件（可配合 --lines-json）")
+    parser.add_argument("--batch-ingest", metavar="PATH", default=None,
+                        help="离线批量：读取 JSONL 结果文件，按正常流程解析、清洗并写入新批次")
+    parser.add_argument("--no-rules", action="store_true", help="关闭规则优先分层，所有 block 都调用 LLM")
+    parser.add_argument("--enqueue", action="store_true", help="创建批次并把 block 按 --pack-budget 打包写入工作队列，由 --worker 进程生成")
+    parser.add_argument("--worker", nargs="?", const="", default=None, metavar="RUN_ID",
+                        help="作为 worker 领取队列任务（不指定 RUN_ID 时领取所有批次），队列空后退出")
+    parser.add_argument("--finalize", metavar="RUN_ID", default=None, help="队列排空后去重、定位 evidence 并切换 latest")
+    parser.add_argument("--requeue-dead", metavar="RUN_ID", default=None, help="把批次的死信任务重新排队")
+    parser.add_argument("--queue-path", default=str(DEFAULT_QUEUE_PATH), help="SQLite 工作队列文件")
+    parser.add_argument("--rate-share", type=float, default=1.0,
+                        help="本进程占账号限额的比例；N 个 worker 共用一个账号时设为 1/N")
+    parser.add_argument("--metrics", default=DEFAULT_METRICS_PREFIX, metavar="PREFIX",
+                        help="逐次调用遥测写入 PREFIX.jsonl，Prometheus 指标写入 PREFIX.prom")
+    parser.add_argument("--no-telemetry", action="store_true", help="不记录逐次调用遥测")
+    args = parser.parse_args()
+    llm_cache.bypass = args.no_cache
+    model_router.enabled = not args.no_routing
+    hedger.enabled = not args.no_hedge
+    telemetry.enabled = not args.no_telemetry
+    # worker 进程各写一份，避免多个进程覆盖同一个 .prom 文件
+    telemetry.prefix = (f"{args.metrics}.{socket.gethostname()}-{os.getpid()}" if args.worker is not None
+                        else args.metrics)
+    if args.rate_share != 1.0:
+        rate_limiter = ModelRateLimiter(scaled_rate_limits(args.rate_share))
+    if args.enqueue or args.worker is not None or args.finalize or args.requeue_dead:
+        queue = SQLiteWorkQueue(Path(args.queue_path))
+        if args.enqueue:
+            enqueue_run(queue, rule_tiering=not args.no_rules, block_dedup=not args.no_block_dedup,
+                        pack_budget=args.pack_budget)
+        elif args.worker is not None:
+            run_worker(queue, args.worker or None, concurrency=args.concurrency)
+        elif args.finalize:
+            finalize_run(queue, args.finalize, near_dedup=not args.no_near_dedup,
+                         evidence_policy=args.evidence_policy)
+        else:
+            print(f"♻️  {queue.requeue_dead(args.requeue_dead)} 个死信任务已重新排队")
+        raise SystemExit(0)
+    if args.plan:
+        lines = load_structured_lines(args.lines_json) if args.lines_json else get_block_lines()
+        plan_generation(lines, concurrency=args.concurrency, pack_budget=args.pack_budget,
+                        with_sections=args.sections, section_chunk_tokens=args.section_chunk_tokens,
+                        hierarchical=args.hierarchical, rule_tiering=not args.no_rules,
+                        block_dedup=not args.no_block_dedup)
+        raise SystemExit(0)
+    if args.batch_write:
+        blocks = (blocks_from_lines(load_structured_lines(args.lines_json)) if args.lines_json
+                  else get_blocks_with_content())
+        write_batch_file(args.batch_write, blocks, rule_tiering=not args.no_rules,
+                         block_dedup=not args.no_block_dedup)
+        raise SystemExit(0)
+    main(concurrency=args.concurrency, pack_budget=args.pack_budget,
+         with_sections=args.sections, section_chunk_tokens=args.section_chunk_tokens,
+         hierarchical=args.hierarchical, stream=args.stream, resume=args.resume,
+         incremental=args.incremental, near_dedup=not args.no_near_dedup,
+         evidence_policy=args.evidence_policy, rule_tiering=not args.no_rules,
+         block_dedup=not args.no_block_dedup,
+         batch_results=read_batch_results(Path(args.batch_ingest)) if args.batch_ingest else None)
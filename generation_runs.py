@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+生成批次（GenerationRun）的生命周期，generate_review_points 与 multi_agent_audit_system 共用
+- start_generation_run：创建 status=running 的批次节点，返回 run_id；创建前先清理僵死批次
+- complete_generation_run：标记完成；switch_latest=True 时在同一事务内把 latest 指针切换到该批次
+  （多模型审核只覆盖指定目标，不切换指针）；model_calls 记录本批次各模型的实际调用次数
+  （Neo4j 属性不支持 map，存 JSON 字符串）
+- fail_generation_run：标记失败，latest 指针不变
+- touch_generation_run：写入审核点、领取队列任务时更新 heartbeat_at（同一批次至多每 HEARTBEAT_SECONDS 一次）
+- expire_stale_runs：进程被杀、来不及标记失败的批次会一直停在 running；
+  超过 STALE_RUN_HOURS 没有心跳（或开始、续跑）的 running 批次标记为 failed，之后由 prune_old_runs 清理。
+  按心跳而不是开始时间判断，--enqueue … --finalize 这类跨天、worker 仍在写入的批次不会被误判
+"""
+import json
+import threading
+import time
+import uuid
+from typing import Dict, Optional
+
+STALE_RUN_HOURS = 24
+HEARTBEAT_SECONDS = 60
+
+_last_heartbeat: Dict[str, float] = {}
+_heartbeat_lock = threading.Lock()
+
+
+def touch_generation_run(driver, run_id: str):
+    """记录批次有进展；同一进程内同一批次至多每 HEARTBEAT_SECONDS 写一次"""
+    now = time.monotonic()
+    with _heartbeat_lock:
+        if now - _last_heartbeat.get(run_id, float("-inf")) < HEARTBEAT_SECONDS:
+            return
+        _last_heartbeat[run_id] = now
+    with driver.session() as session:
+        session.run("MATCH (run:GenerationRun {run_id: $run_id}) SET run.heartbeat_at = timestamp()",
+                    run_id=run_id).consume()
+
+
+def expire_stale_runs(driver, max_age_hours: float = STALE_RUN_HOURS) -> int:
+    query = """
+    MATCH (run:GenerationRun {status: 'running'})
+    WITH run, timestamp() - $max_age_ms AS cutoff
+    WHERE run.started_at < cutoff AND coalesce(run.resumed_at, 0) < cutoff AND coalesce(run.heartbeat_at, 0) < cutoff
+    SET run.status = 'failed', run.finished_at = timestamp(),
+        run.error = 'stale: no progress for ' + toString($max_age_hours) + 'h (process killed?)'
+    RETURN count(run) AS expired
+    """
+    with driver.session() as session:
+        expired = session.run(query, max_age_ms=int(max_age_hours * 3600 * 1000),
+                              max_age_hours=max_age_hours).single()["expired"]
+    if expired:
+        print(f"🧟 {expired} 个超过 {max_age_hours:g} 小时仍为 running 的批次已标记为 failed")
+    return expired
+
+
+def start_generation_run(driver, model: str, prompt_version: str, generator: str = "generate_review_points",
+                         routing: bool = False) -> str:
+    """创建 GenerationRun 节点（status=running），返回 run_id；routing=True 时 model 只是标签，实际模型见各 ReviewPoint.model"""
+    expire_stale_runs(driver)
+    run_id = f"run_{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+    query = """
+    CREATE (:GenerationRun {
+      run_id: $run_id,
+      model: $model,
+      prompt_version: $prompt_version,
+      generator: $generator,
+      routing: $routing,
+      status: 'running',
+      started_at: timestamp()
+    })
+    """
+    with driver.session() as session:
+        session.run(query, run_id=run_id, model=model, prompt_version=prompt_version, generator=generator,
+                    routing=routing).consume()
+    print(f"🏷️  新生成批次: {run_id}（模型 {model}，Prompt {prompt_version}）")
+    return run_id
+
+
+def complete_generation_run(driver, run_id: str, point_count: int, switch_latest: bool = True,
+                            model_calls: Optional[Dict[str, int]] = None):
+    """标记批次完成；switch_latest 时在同一事务内把 latest 指针切换到该批次；model_calls 为 {模型: 调用次数}。
+    批次节点不存在（如已被清理）时抛出 ValueError，指针不动"""
+    query = """
+    MATCH (run:GenerationRun {run_id: $run_id})
+    SET run.status = 'completed',
+        run.finished_at = timestamp(),
+        run.duration_ms = timestamp() - run.started_at,
+        run.point_count = $point_count,
+        run.model_calls = $model_calls
+    """
+    if switch_latest:
+        query += """
+    MERGE (ptr:ReviewPointer {name: 'latest'})
+    SET ptr.run_id = $run_id, ptr.switched_at = timestamp()
+    """
+    query += "RETURN count(run) AS matched"
+    with driver.session() as session:
+        calls = json.dumps(model_calls, ensure_ascii=False, sort_keys=True) if model_calls else None
+        matched = session.execute_write(lambda tx: tx.run(query, run_id=run_id, point_count=point_count,
+                                                          model_calls=calls).single()["matched"])
+    if not matched:
+        raise ValueError(f"批次 {run_id} 不存在（可能已过期被清理），无法标记完成")
+    if switch_latest:
+        print(f"🔀 latest 指针已切换到 {run_id}（{point_count} 条审核点）")
+    else:
+        print(f"🏁 批次 {run_id} 完成（{point_count} 条审核点，latest 指针未切换）")
+
+
+def fail_generation_run(driver, run_id: str, error: str):
+    """标记批次失败；latest 指针保持不变，读端继续看到上一个完成的批次"""
+    query = """
+    MATCH (run:GenerationRun {run_id: $run_id})
+    SET run.status = 'failed', run.finished_at = timestamp(), run.error = $error
+    """
+    with driver.session() as session:
+        session.run(query, run_id=run_id, error=error[:500]).consume()
+    print(f"❌ 批次 {run_id} 失败，latest 指针未切换")
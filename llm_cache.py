@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+LLM 响应磁盘缓存（SQLite）
+- key = sha256(模型名 + temperature + 完整 prompt)，prompt 或原文任一变化都会自然失效
+- 按总字节数做 LRU 淘汰（last_access 最早的先删）；总字节数由触发器维护在 llm_cache_meta 单行表中，
+  写入时 O(1) 读取，超限时才扫描 last_access 索引（多个进程共用同一文件时也保持一致）
+- 命中/未命中统计；bypass=True 时跳过读取、仍写入（用于强制刷新）
+"""
+import hashlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+DEFAULT_CACHE_PATH = Path("llm_cache.sqlite3")
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024  # 200 MB
+EVICT_TARGET_RATIO = 0.9               # 淘汰到上限的 90%，避免每次写入都触发淘汰
+
+
+def make_cache_key(model: str, temperature: float, prompt: str) -> str:
+    payload = f"{model}\x1f{temperature!r}\x1f{prompt}".encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
+
+class LLMCache:
+    def __init__(self, path: Path = DEFAULT_CACHE_PATH, max_bytes: int = DEFAULT_MAX_BYTES, bypass: bool = False):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_last_access ON llm_cache (last_access)")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_cache_meta (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                total_bytes INTEGER NOT NULL
+            )
+        """)
+        if self.conn.execute("SELECT 1 FROM llm_cache_meta").fetchone() is None:
+            # 旧缓存文件升级：只在首次统计一次
+            self.conn.execute("INSERT INTO llm_cache_meta (id, total_bytes) "
+                              "SELECT 0, COALESCE(SUM(size), 0) FROM llm_cache")
+        self.conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS llm_cache_size_insert AFTER INSERT ON llm_cache
+            BEGIN UPDATE llm_cache_meta SET total_bytes = total_bytes + NEW.size WHERE id = 0; END
+        """)
+        self.conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS llm_cache_size_delete AFTER DELETE ON llm_cache
+            BEGIN UPDATE llm_cache_meta SET total_bytes = total_bytes - OLD.size WHERE id = 0; END
+        """)
+        self.conn.commit()
+
+    def get(self, model: str, temperature: float, prompt: str) -> Optional[str]:
+        if self.bypass:
+            return None
+        key = make_cache_key(model, temperature, prompt)
+        with self.lock:
+            row = self.conn.execute("SELECT response FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (time.time(), key))
+            self.conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, model: str, temperature: float, prompt: str, response: str):
+        if not response:
+            return  # 失败/空响应不缓存
+        key = make_cache_key(model, temperature, prompt)
+        size = len(response.encode("utf-8")) + len(key)
+        now = time.time()
+        with self.lock:
+            # 先删后插而不是 INSERT OR REPLACE：REPLACE 隐式删除旧行时不触发 DELETE 触发器
+            self.conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            self.conn.execute(
+                "INSERT INTO llm_cache (key, model, response, size, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, response, size, now, now),
+            )
+            self.writes += 1
+            self._evict_if_needed()
+            self.conn.commit()
+
+    def _total_bytes(self) -> int:
+        return self.conn.execute("SELECT total_bytes FROM llm_cache_meta WHERE id = 0").fetchone()[0]
+
+    def _evict_if_needed(self):
+        total = self._total_bytes()
+        if total <= self.max_bytes:
+            return
+        target = self.max_bytes * EVICT_TARGET_RATIO
+        victims = []
+        for key, size in self.conn.execute("SELECT key, size FROM llm_cache ORDER BY last_access"):
+            if total <= target:
+                break
+            victims.append((key,))
+            total -= size
+        self.conn.executemany("DELETE FROM llm_cache WHERE key = ?", victims)
+        self.evictions += len(victims)
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        with self.lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+            total = self._total_bytes()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "writes": self.writes,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": total,
+        }
+
+    def report(self):
+        s = self.stats()
+        mode = "（bypass：只写不读）" if self.bypass else ""
+        print(f"💾 LLM 缓存{mode}: 命中 {s['hits']} / 未命中 {s['misses']}（命中率 {s['hit_rate']:.0%}），"
+              f"写入 {s['writes']}，淘汰 {s['evictions']}，共 {s['entries']} 条 / {s['bytes'] / 1024 / 1024:.1f} MB")
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+LLM 客户端复用
+- 每个 (模型, temperature) 只创建一个 ChatOpenAI，所有模型共享同一个带连接池的 httpx.Client
+- 未配置工具时直接走 chat completion，不再为每次调用编译一个无工具的 ReAct agent
+- 配置了工具时才走 langgraph 的 create_react_agent（按模型 + system prompt + 工具缓存）
+- stream_chat_completion：流式返回文本片段，供增量解析审核点
+"""
+import os
+import threading
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import httpx
+from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_openai import ChatOpenAI
+
+DEFAULT_BASE_URL = "https://dashscope.aliyuncs.com/compatible-mode/v1"
+HTTP_MAX_CONNECTIONS = 32
+HTTP_MAX_KEEPALIVE = 16
+HTTP_TIMEOUT = 120.0  # 秒
+
+_settings = {
+    "base_url": os.getenv("DASHSCOPE_BASE_URL", DEFAULT_BASE_URL),
+    "api_key": None,
+}
+_lock = threading.Lock()
+_http_client: Optional[httpx.Client] = None
+_chat_clients: Dict[Tuple[str, float], ChatOpenAI] = {}
+_agents: Dict[Tuple, object] = {}
+
+
+def configure_clients(base_url: Optional[str] = None, api_key: Optional[str] = None):
+    """修改接入点（如本地 mock）时调用；会丢弃已缓存的客户端"""
+    global _http_client
+    with _lock:
+        if base_url:
+            _settings["base_url"] = base_url
+        if api_key:
+            _settings["api_key"] = api_key
+        _chat_clients.clear()
+        _agents.clear()
+        if _http_client is not None:
+            _http_client.close()
+            _http_client = None
+
+
+def get_http_client() -> httpx.Client:
+    global _http_client
+    with _lock:
+        if _http_client is None:
+            _http_client = httpx.Client(
+                limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS,
+                                    max_keepalive_connections=HTTP_MAX_KEEPALIVE),
+                timeout=HTTP_TIMEOUT,
+            )
+        return _http_client
+
+
+def get_chat_client(model: str, temperature: float) -> ChatOpenAI:
+    http_client = get_http_client()
+    key = (model, temperature)
+    with _lock:
+        if key not in _chat_clients:
+            _chat_clients[key] = ChatOpenAI(
+                model=model,
+                temperature=temperature,
+                openai_api_key=_settings["api_key"] or os.getenv("DASHSCOPE_API_KEY"),
+                openai_api_base=_settings["base_url"],
+                http_client=http_client,
+                max_retries=0  # 重试统一由 llm_runtime.call_with_retry 处理
+            )
+        return _chat_clients[key]
+
+
+def _get_agent(model: str, temperature: float, system_prompt: str, tools: Sequence):
+    from langgraph.prebuilt import create_react_agent  # 仅工具路径需要 langgraph
+
+    key = (model, temperature, system_prompt, tuple(id(t) for t in tools))
+    llm = get_chat_client(model, temperature)
+    with _lock:
+        if key not in _agents:
+            _agents[key] = create_react_agent(llm, tools=list(tools), prompt=SystemMessage(content=system_prompt))
+        return _agents[key]
+
+
+def chat_completion(model: str, system_prompt: str, user_text: str, temperature: float,
+                    tools: Optional[List] = None) -> str:
+    """返回模型最终回复文本；tools 为空时直接调用 chat completion"""
+    if tools:
+        agent = _get_agent(model, temperature, system_prompt, tools)
+        response = agent.invoke({"messages": [("user", user_text)]})
+        return response["messages"][-1].content
+    llm = get_chat_client(model, temperature)
+    return llm.invoke([SystemMessage(content=system_prompt), HumanMessage(content=user_text)]).content
+
+
+def stream_chat_completion(model: str, system_prompt: str, user_text: str, temperature: float) -> Iterator[str]:
+    """流式返回模型回复的文本片段（不支持工具路径）"""
+    llm = get_chat_client(model, temperature)
+    for chunk in llm.stream([SystemMessage(content=system_prompt), HumanMessage(content=user_text)]):
+        if chunk.content:
+            yield chunk.content
@@ -0,0 +1,360 @@
+# -*- coding: utf-8 -*-
+"""
+LLM 调用运行时（generate_review_points / multi_agent_audit_system 共用）
+- 按模型的令牌桶限流：每分钟请求数（RPM）+ 每分钟 token 数（TPM）
+- 429 / 5xx / 超时的指数退避重试（full jitter）
+- 保序并发执行器：结果按输入顺序返回
+- 延迟统计：吞吐、p50 / p95 / p99
+- 对冲请求（hedging）：单次调用超过该模型滚动 p95 仍未返回时，再发一个副本（可发给同级模型），
+  先返回者胜出；副本数受预算比例限制
+"""
+import math
+import random
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# ================== 配置 ==================
+# 默认配额，按账号实际限额调整
+DEFAULT_RATE_LIMITS = {
+    "qwen-max": {"rpm": 60, "tpm": 100000},
+    "qwen-plus": {"rpm": 120, "tpm": 300000},
+    "qwen-turbo": {"rpm": 120, "tpm": 500000},
+}
+FALLBACK_RATE_LIMIT = {"rpm": 60, "tpm": 100000}
+
+
+def scaled_rate_limits(share: float) -> Dict[str, Dict[str, int]]:
+    """多个 worker 进程共用一个账号配额时，每个进程按 share（如 1/worker 数）取一份"""
+    return {model: {"rpm": max(1, int(limit["rpm"] * share)), "tpm": max(1, int(limit["tpm"] * share))}
+            for model, limit in DEFAULT_RATE_LIMITS.items()}
+
+MAX_RETRIES = 5
+BASE_RETRY_DELAY = 1.0   # 秒
+MAX_RETRY_DELAY = 30.0   # 秒
+
+# ================== Token 估算 ==================
+CJK_RE = re.compile(r'[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]')
+NON_CJK_TOKEN_RE = re.compile(r'[A-Za-z]+|\d|[^\sA-Za-z\d]')
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：中文及全角字符按 1 个/字，英文单词按 4 字母/个，数字与符号各 1 个"""
+    if not text:
+        return 0
+    cjk = len(CJK_RE.findall(text))
+    rest = CJK_RE.sub(" ", text)
+    tokens = cjk
+    for piece in NON_CJK_TOKEN_RE.findall(rest):
+        tokens += math.ceil(len(piece) / 4) if piece.isalpha() else 1
+    return tokens
+
+WHITESPACE_RUN_RE = re.compile(r'\s+')
+
+def estimate_tokens_with_whitespace(text: str) -> int:
+    """estimate_tokens 不计空白；BPE 分词里一段连续空白（含换行）一般单独占 1 个 token，
+    只有英文/数字之间的单个空格会并入后一个词。用于衡量 PDF 表格行尾空白这类开销"""
+    tokens = estimate_tokens(text)
+    for match in WHITESPACE_RUN_RE.finditer(text):
+        before = text[match.start() - 1] if match.start() else ""
+        after = text[match.end()] if match.end() < len(text) else ""
+        if match.group() == " " and (before.isascii() and before.isalnum()) and (after.isascii() and after.isalnum()):
+            continue
+        tokens += 1
+    return tokens
+
+# ================== 令牌桶限流 ==================
+class TokenBucket:
+    """线程安全的令牌桶；acquire 在额度不足时阻塞等待"""
+
+    def __init__(self, capacity: float, refill_per_sec: float):
+        self.capacity = float(capacity)
+        self.refill_per_sec = float(refill_per_sec)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_per_sec)
+        self.updated = now
+
+    def acquire(self, amount: float = 1.0):
+        amount = min(float(amount), self.capacity)  # 单次请求超过桶容量时按满桶处理，避免永久阻塞
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.refill_per_sec
+            time.sleep(min(wait, 1.0))
+
+    def try_acquire(self, amount: float = 1.0) -> bool:
+        """额度足够时立即扣减并返回 True，否则不等待、返回 False"""
+        amount = min(float(amount), self.capacity)
+        with self.lock:
+            self._refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return True
+            return False
+
+    def refund(self, amount: float = 1.0):
+        with self.lock:
+            self.tokens = min(self.capacity, self.tokens + min(float(amount), self.capacity))
+
+class ModelRateLimiter:
+    """每个模型一组 RPM / TPM 令牌桶"""
+
+    def __init__(self, limits: Optional[Dict[str, Dict[str, int]]] = None):
+        self.limits = dict(DEFAULT_RATE_LIMITS)
+        self.limits.update(limits or {})
+        self.buckets: Dict[str, Tuple[TokenBucket, TokenBucket]] = {}
+        self.lock = threading.Lock()
+
+    def _buckets_for(self, model: str) -> Tuple[TokenBucket, TokenBucket]:
+        with self.lock:
+            if model not in self.buckets:
+                limit = self.limits.get(model, FALLBACK_RATE_LIMIT)
+                self.buckets[model] = (
+                    TokenBucket(limit["rpm"], limit["rpm"] / 60.0),
+                    TokenBucket(limit["tpm"], limit["tpm"] / 60.0),
+                )
+            return self.buckets[model]
+
+    def acquire(self, model: str, tokens: int):
+        requests_bucket, tokens_bucket = self._buckets_for(model)
+        requests_bucket.acquire(1)
+        tokens_bucket.acquire(tokens)
+
+    def try_acquire(self, model: str, tokens: int) -> bool:
+        """两个桶都有余量时立即扣减；否则不扣减、返回 False（对冲副本不排队等限流）"""
+        requests_bucket, tokens_bucket = self._buckets_for(model)
+        if not requests_bucket.try_acquire(1):
+            return False
+        if not tokens_bucket.try_acquire(tokens):
+            requests_bucket.refund(1)
+            return False
+        return True
+
+# ================== 重试 ==================
+class RetryableLLMError(Exception):
+    """非异常式 API（如 DashScope 原生 SDK 返回 status_code）转换成可重试异常"""
+
+    def __init__(self, status_code: int, message: str = ""):
+        super().__init__(f"HTTP {status_code}: {message}")
+        self.status_code = status_code
+
+RETRYABLE_EXCEPTION_NAMES = {"APITimeoutError", "APIConnectionError", "Timeout", "ReadTimeout",
+                             "ConnectTimeout", "ConnectError", "TimeoutError", "ConnectionError"}
+
+def _status_code_of(exc: BaseException) -> Optional[int]:
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    try:
+        return int(status) if status is not None else None
+    except (TypeError, ValueError):
+        return None
+
+def is_retryable_error(exc: BaseException) -> bool:
+    status = _status_code_of(exc)
+    if status is not None:
+        return status == 429 or status >= 500
+    return type(exc).__name__ in RETRYABLE_EXCEPTION_NAMES
+
+def _retry_after_seconds(exc: BaseException) -> Optional[float]:
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        value = headers.get("retry-after") or headers.get("Retry-After")
+        return float(value) if value else None
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt: int, base: float = BASE_RETRY_DELAY, cap: float = MAX_RETRY_DELAY) -> float:
+    """指数退避 + full jitter"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+def call_with_retry(fn: Callable[[], Any], max_retries: int = MAX_RETRIES, label: str = "",
+                    on_retry: Optional[Callable[[int, BaseException], None]] = None) -> Any:
+    """on_retry(第几次重试, 异常) 在每次重试前调用，供遥测统计重试次数"""
+    for attempt in range(max_retries + 1):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt >= max_retries or not is_retryable_error(e):
+                raise
+            if on_retry:
+                on_retry(attempt + 1, e)
+            delay = _retry_after_seconds(e) or backoff_delay(attempt)
+            print(f"🔁 {label} 第 {attempt + 1} 次重试（{type(e).__name__}: {e}），{delay:.1f}s 后重试")
+            time.sleep(delay)
+
+# ================== 延迟统计 ==================
+def percentile(values: List[float], p: float) -> float:
+    """最近秩法百分位"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(p / 100.0 * len(ordered)))
+    return ordered[rank - 1]
+
+class LatencyStats:
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.started = time.monotonic()
+        self.lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self.lock:
+            self.latencies.append(seconds)
+
+    def summary(self) -> Dict[str, float]:
+        wall = time.monotonic() - self.started
+        count = len(self.latencies)
+        return {
+            "count": count,
+            "wall_seconds": wall,
+            "throughput_per_min": count / wall * 60 if wall > 0 else 0.0,
+            "p50": percentile(self.latencies, 50),
+            "p95": percentile(self.latencies, 95),
+            "p99": percentile(self.latencies, 99),
+        }
+
+    def report(self, label: str = "任务"):
+        s = self.summary()
+        print(f"📊 {label}: {s['count']} 个，用时 {s['wall_seconds']:.1f}s，"
+              f"吞吐 {s['throughput_per_min']:.1f}/min，p50 {s['p50']:.2f}s，p95 {s['p95']:.2f}s，p99 {s['p99']:.2f}s")
+
+# ================== 对冲请求 ==================
+HEDGE_BUDGET_RATIO = 0.1   # 副本请求数不超过总调用数的 10%
+HEDGE_WINDOW = 200         # 滚动 p95 的样本窗口
+HEDGE_MIN_SAMPLES = 20     # 样本不足时不对冲
+HEDGE_MAX_WORKERS = 32
+
+class Hedger:
+    """超过滚动 p95 才发副本，先返回者胜出。
+    已在途的 HTTP 请求无法强制中断：落败的请求只是结果被丢弃（未开始的会被取消）。
+    延迟样本按实际发出请求的模型、从该请求开始到它自己完成计时：主请求被副本抢先时仍等它完成再记录，
+    只记胜者会让 p95 越来越低、对冲越来越频繁。限流等待应在调用 call 之前完成，不计入样本"""
+
+    def __init__(self, budget_ratio: float = HEDGE_BUDGET_RATIO, window: int = HEDGE_WINDOW,
+                 min_samples: int = HEDGE_MIN_SAMPLES, siblings: Optional[Dict[str, str]] = None,
+                 enabled: bool = True):
+        self.budget_ratio = budget_ratio
+        self.window = window
+        self.min_samples = min_samples
+        self.siblings = siblings or {}
+        self.enabled = enabled
+        self.samples: Dict[str, deque] = {}
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.denied = 0
+        self.throttled = 0
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=HEDGE_MAX_WORKERS)
+
+    def record(self, model: str, seconds: float):
+        with self.lock:
+            self.samples.setdefault(model, deque(maxlen=self.window)).append(seconds)
+
+    def hedge_delay(self, model: str) -> Optional[float]:
+        with self.lock:
+            samples = list(self.samples.get(model, ()))
+        if not self.enabled or len(samples) < self.min_samples:
+            return None
+        return percentile(samples, 95)
+
+    def _take_budget(self) -> bool:
+        with self.lock:
+            if self.hedged + 1 > max(1.0, self.calls * self.budget_ratio):
+                self.denied += 1
+                return False
+            self.hedged += 1
+            return True
+
+    def _submit_timed(self, model: str, fn: Callable[[str], Any]):
+        """提交 fn(model)，成功完成时按该请求自身耗时记录样本（胜负无关）"""
+        started = time.monotonic()
+        future = self.executor.submit(fn, model)
+
+        def on_done(f):
+            if not f.cancelled() and f.exception() is None:
+                self.record(model, time.monotonic() - started)
+        future.add_done_callback(on_done)
+        return future
+
+    def call(self, model: str, fn: Callable[[str], Any],
+             reserve: Optional[Callable[[str], bool]] = None) -> Tuple[str, Any]:
+        """fn(model) 发起一次请求；返回 (实际给出结果的模型, 结果)，两者都失败时抛出主请求的异常。
+        reserve(hedge_model) 在发副本前调用（如非阻塞地占用限流额度），返回 False 时不发副本"""
+        with self.lock:
+            self.calls += 1
+        delay = self.hedge_delay(model)
+        if delay is None:
+            started = time.monotonic()
+            result = fn(model)
+            self.record(model, time.monotonic() - started)
+            return model, result
+
+        primary = self._submit_timed(model, fn)
+        done, _ = wait([primary], timeout=delay)
+        if done or not self._take_budget():
+            return model, primary.result()
+
+        hedge_model = self.siblings.get(model, model)
+        if reserve is not None and not reserve(hedge_model):
+            with self.lock:
+                self.hedged -= 1
+                self.throttled += 1
+            return model, primary.result()
+        print(f"🪁 {model} 超过 p95（{delay:.2f}s）未返回，对冲请求 {hedge_model}")
+        hedge = self._submit_timed(hedge_model, fn)
+        pending = {primary, hedge}
+        first_error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    if future is hedge:
+                        with self.lock:
+                            self.hedge_wins += 1
+                        return hedge_model, future.result()
+                    return model, future.result()
+                if future is primary or first_error is None:
+                    first_error = future.exception()
+        raise first_error
+
+    def report(self):
+        if not self.calls:
+            return
+        print(f"🪁 对冲：{self.calls} 次调用，发出副本 {self.hedged} 次（副本先返回 {self.hedge_wins} 次），"
+              f"预算不足未对冲 {self.denied} 次，限流额度不足未对冲 {self.throttled} 次")
+
+# ================== 保序并发执行 ==================
+def run_ordered(items: Iterable[Any], worker: Callable[[Any], Any], concurrency: int = 4,
+                stats: Optional[LatencyStats] = None) -> Iterator[Tuple[Any, Any]]:
+    """并发执行 worker(item)，按输入顺序逐个产出 (item, result)；任一任务异常时取消未开始的任务并抛出"""
+    stats = stats or LatencyStats()
+
+    def timed(item):
+        start = time.monotonic()
+        try:
+            return worker(item)
+        finally:
+            stats.record(time.monotonic() - start)
+
+    items = list(items)
+    executor = ThreadPoolExecutor(max_workers=max(1, concurrency))
+    try:
+        futures = [executor.submit(timed, item) for item in items]
+        for item, future in zip(items, futures):
+            yield item, future.result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
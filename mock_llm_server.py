@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+"""
+本地 mock LLM 服务（OpenAI 兼容 + DashScope 原生接口），用于基准测试和回归测试，不产生费用
+- OpenAI 兼容：POST …/chat/completions（支持 stream=true 的 SSE）
+  → llm_clients.configure_clients(base_url=server.openai_base_url)，或环境变量 DASHSCOPE_BASE_URL=http://host:port/v1
+- DashScope 原生：POST …/services/aigc/text-generation/generation（prompt 或 messages，
+  result_format=text/message）→ 环境变量 DASHSCOPE_HTTP_BASE_URL=http://host:port/api/v1（multi_agent_audit_system）
+三种模式：
+- synthetic：responder 合成回复（默认 batch_io.mock_review_model），按 LatencyProfile 注入延迟，
+  按 error_rate 注入 429/5xx（带 Retry-After）。随机数按 (seed, 请求, 第几次出现) 取，重跑结果一致
+- record：转发到真实接口（沿用请求里的 Authorization），回复文本和 usage 追加写入 cassette（JSONL）
+- replay：按请求内容从 cassette 取回复，确定性；未录制的请求返回 404
+cassette 只存回复文本和 usage，同一条录制可按任一接口格式、流式或非流式回放。
+用法：python mock_llm_server.py --mode synthetic --port 8089 --latency-median 1.5 --latency-p95 4 --error-rate 0.05
+"""
+import argparse
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from batch_io import iter_jsonl, mock_review_model
+from llm_runtime import estimate_tokens
+
+OPENAI_UPSTREAM = "https://dashscope.aliyuncs.com/compatible-mode/v1"
+DASHSCOPE_UPSTREAM = "https://dashscope.aliyuncs.com/api/v1"
+DASHSCOPE_GENERATION_PATH = "/services/aigc/text-generation/generation"
+DEFAULT_CASSETTE_PATH = Path("llm_cassette.jsonl")
+STREAM_CHUNK_CHARS = 16
+Z_95 = 1.6449  # 标准正态 95 分位
+
+
+class LatencyProfile:
+    """对数正态延迟：由中位数和 p95 确定；tokens_per_second > 0 时再按输出 token 数加上生成时间"""
+
+    def __init__(self, median: float = 0.0, p95: Optional[float] = None, tokens_per_second: float = 0.0):
+        self.median = median
+        self.sigma = math.log(p95 / median) / Z_95 if median > 0 and p95 and p95 > median else 0.0
+        self.tokens_per_second = tokens_per_second
+
+    def sample(self, rng: random.Random, completion_tokens: int) -> float:
+        seconds = self.median * math.exp(rng.gauss(0, self.sigma)) if self.median > 0 else 0.0
+        if self.tokens_per_second > 0:
+            seconds += completion_tokens / self.tokens_per_second
+        return seconds
+
+
+def request_key(api: str, model: str, temperature, messages: List[Dict]) -> str:
+    payload = json.dumps([api, model, temperature, messages], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def parse_request(path: str, body: Dict) -> Tuple[str, str, object, List[Dict], bool]:
+    """→ (api, model, temperature, messages, stream)；DashScope 的 prompt 视为单条 user 消息"""
+    if path.endswith(DASHSCOPE_GENERATION_PATH):
+        inputs = body.get("input") or {}
+        messages = inputs.get("messages") or [{"role": "user", "content": inputs.get("prompt", "")}]
+        temperature = (body.get("parameters") or {}).get("temperature")
+        return "dashscope", body.get("model", ""), temperature, messages, False
+    return "openai", body.get("model", ""), body.get("temperature"), body.get("messages") or [], bool(body.get("stream"))
+
+
+def usage_for(messages: List[Dict], content: str) -> Dict[str, int]:
+    prompt_tokens = sum(estimate_tokens(m.get("content") or "") for m in messages)
+    completion_tokens = estimate_tokens(content)
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens}
+
+
+class MockLLMServer:
+    def __init__(self, mode: str = "synthetic", cassette_path: Path = DEFAULT_CASSETTE_PATH,
+                 responder: Callable[[str, List[Dict]], str] = mock_review_model,
+                 latency: Optional[LatencyProfile] = None, error_rate: float = 0.0,
+                 error_statuses: Tuple[int, ...] = (429, 500, 503), retry_after: float = 0.5,
+                 seed: int = 0, host: str = "127.0.0.1", port: int = 0,
+                 openai_upstream: str = OPENAI_UPSTREAM, dashscope_upstream: str = DASHSCOPE_UPSTREAM):
+        if mode not in ("synthetic", "record", "replay"):
+            raise ValueError(f"未知模式: {mode}")
+        self.mode = mode
+        self.cassette_path = Path(cassette_path)
+        self.responder = responder
+        self.latency = latency or LatencyProfile()
+        self.error_rate = error_rate
+        self.error_statuses = error_statuses
+        self.retry_after = retry_after
+        self.seed = seed
+        self.upstreams = {"openai": openai_upstream.rstrip("/"), "dashscope": dashscope_upstream.rstrip("/")}
+        self.lock = threading.Lock()
+        self.cassette: Dict[str, Dict] = {}
+        if mode == "replay" or (mode == "record" and self.cassette_path.exists()):
+            self.cassette = {entry["key"]: entry for entry in iter_jsonl(self.cassette_path)}
+        self.occurrences: Dict[str, int] = {}
+        self.stats = {"requests": 0, "injected_errors": 0, "replay_misses": 0, "recorded": 0, "upstream_errors": 0}
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def openai_base_url(self) -> str:
+        return f"{self.base_url}/v1"
+
+    @property
+    def dashscope_base_url(self) -> str:
+        return f"{self.base_url}/api/v1"
+
+    def start(self) -> "MockLLMServer":
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    def _rng_for(self, key: str) -> random.Random:
+        with self.lock:
+            self.stats["requests"] += 1
+            occurrence = self.occurrences.get(key, 0)
+            self.occurrences[key] = occurrence + 1
+        return random.Random(f"{self.seed}:{key}:{occurrence}")
+
+    def _count(self, name: str):
+        with self.lock:
+            self.stats[name] += 1
+
+    def respond(self, path: str, body: Dict, headers: Dict[str, str]) -> Tuple[int, Dict, Dict[str, str], bool]:
+        """→ (HTTP 状态, 回复信息 {content, usage} 或错误体, 额外响应头, 是否流式)"""
+        api, model, temperature, messages, stream = parse_request(path, body)
+        key = request_key(api, model, temperature, messages)
+        rng = self._rng_for(key)
+        if self.mode == "replay":
+            entry = self.cassette.get(key)
+            if entry is None:
+                self._count("replay_misses")
+                return 404, {"message": "请求未录制", "key": key}, {}, False
+            return 200, entry, {}, stream
+        if self.mode == "record":
+            return self._record(api, path, body, headers, key, model, messages, stream)
+        if rng.random() < self.error_rate:
+            self._count("injected_errors")
+            time.sleep(self.latency.sample(rng, 0) / 2)
+            status = rng.choice(self.error_statuses)
+            return status, {"message": "mock 注入的错误"}, {"Retry-After": str(self.retry_after)}, False
+        content = self.responder(model, messages)
+        usage = usage_for(messages, content)
+        time.sleep(self.latency.sample(rng, usage["completion_tokens"]))
+        return 200, {"content": content, "usage": usage}, {}, stream
+
+    def _record(self, api: str, path: str, body: Dict, headers: Dict[str, str], key: str, model: str,
+                messages: List[Dict], stream: bool) -> Tuple[int, Dict, Dict[str, str], bool]:
+        upstream_body = dict(body, stream=False) if api == "openai" else body
+        suffix = path[path.index("/v1") + 3:] if "/v1" in path else path
+        request = urllib.request.Request(
+            self.upstreams[api] + suffix, data=json.dumps(upstream_body, ensure_ascii=False).encode("utf-8"),
+            headers={"Content-Type": "application/json", "Authorization": headers.get("Authorization", "")})
+        try:
+            with urllib.request.urlopen(request, timeout=300) as response:
+                reply = json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            self._count("upstream_errors")
+            return e.code, {"message": e.read().decode("utf-8", "replace")[:500]}, {}, False
+        if api == "openai":
+            content = reply["choices"][0]["message"]["content"]
+            usage = reply.get("usage") or usage_for(messages, content)
+        else:
+            output = reply.get("output") or {}
+            content = output.get("text") or output["choices"][0]["message"]["content"]
+            raw = reply.get("usage") or {}
+            usage = {"prompt_tokens": raw.get("input_tokens", 0), "completion_tokens": raw.get("output_tokens", 0),
+                     "total_tokens": raw.get("total_tokens", 0)}
+        entry = {"key": key, "api": api, "model": model, "content": content, "usage": usage}
+        with self.lock:
+            self.cassette[key] = entry
+            with open(self.cassette_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self.stats["recorded"] += 1
+        return 200, entry, {}, stream
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive，与真实接口的连接复用行为一致
+            # 响应头和响应体分两次写出；不关 Nagle 时会与客户端的延迟 ACK 叠加出约 40ms 的固定等待
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                status, reply, extra_headers, stream = server.respond(self.path, body, dict(self.headers))
+                model = body.get("model", "mock")
+                if status != 200:
+                    self._send_json(status, {"error": {"message": reply.get("message"), "code": status},
+                                             "code": str(status), "message": reply.get("message")}, extra_headers)
+                elif stream:
+                    self._send_stream(model, reply["content"], reply["usage"])
+                elif self.path.endswith(DASHSCOPE_GENERATION_PATH):
+                    self._send_json(200, self._dashscope_body(body, reply))
+                else:
+                    self._send_json(200, {
+                        "id": "chatcmpl-mock", "object": "chat.completion", "created": int(time.time()),
+                        "model": model,
+                        "choices": [{"index": 0, "message": {"role": "assistant", "content": reply["content"]},
+                                     "finish_reason": "stop"}],
+                        "usage": reply["usage"],
+                    })
+
+            def _dashscope_body(self, body: Dict, reply: Dict) -> Dict:
+                usage = reply["usage"]
+                if (body.get("parameters") or {}).get("result_format") == "message":
+                    output = {"choices": [{"finish_reason": "stop",
+                                           "message": {"role": "assistant", "content": reply["content"]}}]}
+                else:
+                    output = {"text": reply["content"], "finish_reason": "stop"}
+                return {"request_id": "mock", "output": output,
+                        "usage": {"input_tokens": usage["prompt_tokens"], "output_tokens": usage["completion_tokens"],
+                                  "total_tokens": usage["total_tokens"]}}
+
+            def _send_json(self, status: int, payload: Dict, extra_headers: Optional[Dict[str, str]] = None):
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (extra_headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_stream(self, model: str, content: str, usage: Dict):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                pieces = [content[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(content), STREAM_CHUNK_CHARS)]
+                for i, piece in enumerate(pieces + [None]):
+                    delta = {"content": piece} if piece is not None else {}
+                    if i == 0:
+                        delta["role"] = "assistant"
+                    chunk = {"id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": int(time.time()),
+                             "model": model, "choices": [{"index": 0, "delta": delta,
+                                                          "finish_reason": None if piece is not None else "stop"}]}
+                    if piece is None:
+                        chunk["usage"] = usage
+                    self._write_chunk(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n")
+                self._write_chunk("data: [DONE]\n\n")
+                self.wfile.write(b"0\r\n\r\n")
+
+            def _write_chunk(self, text: str):
+                data = text.encode("utf-8")
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地 mock LLM 服务（OpenAI 兼容 + DashScope 原生）")
+    parser.add_argument("--mode", choices=["synthetic", "record", "replay"], default="synthetic")
+    parser.add_argument("--cassette", default=str(DEFAULT_CASSETTE_PATH), help="录制/回放文件（JSONL）")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency-median", type=float, default=0.0, help="合成延迟中位数（秒）")
+    parser.add_argument("--latency-p95", type=float, default=None, help="合成延迟 p95（秒）")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="按输出 token 数追加的生成时间")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="注入 429/5xx 的比例")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = MockLLMServer(mode=args.mode, cassette_path=Path(args.cassette),
+                           latency=LatencyProfile(args.latency_median, args.latency_p95, args.tokens_per_second),
+                           error_rate=args.error_rate, seed=args.seed, host=args.host, port=args.port)
+    print(f"🧪 mock LLM 服务（{args.mode}）：OpenAI 兼容 {server.openai_base_url}，DashScope {server.dashscope_base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"📊 请求 {server.stats['requests']} 次，注入错误 {server.stats['injected_errors']} 次，"
+              f"录制 {server.stats['recorded']} 条，回放未命中 {server.stats['replay_misses']} 次")
+
+
+if __name__ == "__main__":
+    main()
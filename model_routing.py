@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+按 block 选择模型：便宜模型能胜任的 block 不再一律走 qwen-max
+- 初始档位由 block_type 和原文 token 数决定（短表格 → turbo，长 concern → max）
+- 历史通过率：每个 (模型, block_type) 累计 “清洗后保留的点 / 解析出的点”，
+  样本足够且通过率偏低时初始档位自动上调一档（持久化到 JSON，跨批次生效）；
+  多个 worker 共用同一个 JSON：save 在文件锁内重读磁盘上的累计值，只叠加本进程的增量，不会互相覆盖
+- 输出未通过 clean_review_point（无有效点或保留比例过低）时自动升到下一档重试
+- 运行结束打印每个模型的调用数、平均耗时、估算费用，以及每个 block 的平均耗时/费用和点保留率
+"""
+import fcntl
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from llm_runtime import estimate_tokens
+
+MODEL_TIERS = ["qwen-turbo", "qwen-plus", "qwen-max"]
+# (block_type, token 上限, 档位)：按顺序取第一条 token 数不超过上限的规则
+ROUTING_RULES = [
+    ("table", 300, "qwen-turbo"),
+    ("table", None, "qwen-plus"),
+    ("concern", 150, "qwen-plus"),
+    ("concern", None, "qwen-max"),
+    ("example", None, "qwen-plus"),
+]
+DEFAULT_MODEL = "qwen-max"
+# 每千 token 估算价格（元，输入/输出），按百炼公开价格填写，调价后更新
+MODEL_PRICES = {
+    "qwen-turbo": (0.0003, 0.0006),
+    "qwen-plus": (0.0008, 0.002),
+    "qwen-max": (0.0024, 0.0096),
+}
+MIN_ACCEPT_RATIO = 0.5          # 单次输出清洗后保留比例低于该值视为失败，升档重试
+MIN_PASS_RATE = 0.7             # 历史通过率低于该值的 (模型, block_type) 不再作为初始档位
+MIN_HISTORY_POINTS = 30         # 历史样本（解析出的点数）达到该值才参考通过率
+ROUTING_STATS_PATH = Path("model_routing_stats.json")
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    price_in, price_out = MODEL_PRICES.get(model, MODEL_PRICES[DEFAULT_MODEL])
+    return (prompt_tokens * price_in + completion_tokens * price_out) / 1000
+
+
+def is_acceptable(parsed: int, accepted: int) -> bool:
+    return accepted > 0 and accepted / parsed >= MIN_ACCEPT_RATIO
+
+
+class ModelRouter:
+    def __init__(self, path: Path = ROUTING_STATS_PATH, enabled: bool = True):
+        self.path = path
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.history = self.read_history()
+        self.pending: Dict[str, Dict[str, int]] = {}  # 上次 save 之后本进程新增的样本
+        self.calls: Dict[str, Dict[str, float]] = {}
+        self.blocks: List[Dict] = []
+
+    def read_history(self) -> Dict[str, Dict[str, int]]:
+        if not self.path.exists():
+            return {}
+        try:
+            return json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def pass_rate(self, model: str, block_type: str) -> Optional[float]:
+        record = self.history.get(f"{model}|{block_type}")
+        if not record or record["parsed"] < MIN_HISTORY_POINTS:
+            return None
+        return record["accepted"] / record["parsed"]
+
+    def initial_model(self, block_type: str, content: str) -> str:
+        if not self.enabled:
+            return DEFAULT_MODEL
+        tokens = estimate_tokens(content)
+        model = DEFAULT_MODEL
+        for rule_type, limit, rule_model in ROUTING_RULES:
+            if rule_type == block_type and (limit is None or tokens <= limit):
+                model = rule_model
+                break
+        tier = MODEL_TIERS.index(model)
+        while tier < len(MODEL_TIERS) - 1:
+            rate = self.pass_rate(MODEL_TIERS[tier], block_type)
+            if rate is None or rate >= MIN_PASS_RATE:
+                break
+            tier += 1
+        return MODEL_TIERS[tier]
+
+    def candidates(self, block_type: str, content: str, min_model: Optional[str] = None) -> List[str]:
+        """从初始档位到最高档的升档序列；min_model 给出时不低于该档"""
+        tier = MODEL_TIERS.index(self.initial_model(block_type, content))
+        if min_model:
+            tier = max(tier, MODEL_TIERS.index(min_model))
+        return MODEL_TIERS[tier:] if self.enabled else [DEFAULT_MODEL]
+
+    def next_model(self, model: str) -> Optional[str]:
+        tier = MODEL_TIERS.index(model)
+        return MODEL_TIERS[tier + 1] if tier + 1 < len(MODEL_TIERS) else None
+
+    def record_call(self, model: str, seconds: float, prompt_tokens: int, completion_tokens: int):
+        with self.lock:
+            stats = self.calls.setdefault(model, {"calls": 0, "seconds": 0.0, "cost": 0.0})
+            stats["calls"] += 1
+            stats["seconds"] += seconds
+            stats["cost"] += estimate_cost(model, prompt_tokens, completion_tokens)
+
+    def record_result(self, model: str, block_type: str, parsed: int, accepted: int):
+        with self.lock:
+            key = f"{model}|{block_type}"
+            for target in (self.history, self.pending):
+                record = target.setdefault(key, {"parsed": 0, "accepted": 0})
+                record["parsed"] += parsed
+                record["accepted"] += accepted
+
+    def record_block(self, block_type: str, model: str, seconds: float, escalations: int,
+                     parsed: int, accepted: int):
+        with self.lock:
+            self.blocks.append({"block_type": block_type, "model": model, "seconds": seconds,
+                                "escalations": escalations, "parsed": parsed, "accepted": accepted})
+
+    def save(self):
+        """文件锁内重读磁盘上的历史，叠加本进程的增量后原子替换；其它 worker 同时写入的样本不会丢"""
+        with self.lock, open(self.path.with_name(self.path.name + ".lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            merged = self.read_history()
+            for key, delta in self.pending.items():
+                record = merged.setdefault(key, {"parsed": 0, "accepted": 0})
+                record["parsed"] += delta["parsed"]
+                record["accepted"] += delta["accepted"]
+            tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+            tmp_path.write_text(json.dumps(merged, ensure_ascii=False, indent=2), encoding="utf-8")
+            os.replace(tmp_path, self.path)
+            self.history = merged
+            self.pending = {}
+
+    def report(self):
+        if not self.blocks:
+            return
+        total_cost = sum(s["cost"] for s in self.calls.values())
+        parsed = sum(b["parsed"] for b in self.blocks)
+        accepted = sum(b["accepted"] for b in self.blocks)
+        escalated = sum(1 for b in self.blocks if b["escalations"])
+        print(f"🧭 模型路由：{len(self.blocks)} 个 block，{escalated} 个升档；"
+              f"平均每 block 耗时 {sum(b['seconds'] for b in self.blocks) / len(self.blocks):.2f}s，"
+              f"估算总费用 ¥{total_cost:.4f}，点保留率 {accepted / parsed if parsed else 0:.0%}")
+        for model in MODEL_TIERS:
+            final = [b for b in self.blocks if b["model"] == model]
+            stats = self.calls.get(model)
+            if not final and not stats:
+                continue
+            line = f"   - {model}: 最终采用 {len(final)} 个 block"
+            if stats:
+                line += (f"，实际调用 {stats['calls']} 次，平均 {stats['seconds'] / stats['calls']:.2f}s，"
+                         f"¥{stats['cost']:.4f}")
+            print(line)
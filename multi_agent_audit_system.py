@@ -1,9 +1,20 @@
 # -*- coding: utf-8 -*-
-import json
-import re
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from typing import List, Dict
 from dashscope import Generation
+import argparse
 import os
+from generation_runs import complete_generation_run, fail_generation_run, start_generation_run, touch_generation_run
+from llm_cache import LLMCache
+from llm_runtime import Hedger, estimate_tokens
+from near_dedup import merge_near_duplicates
+from review_ids import content_hash, make_review_id, normalize_question
+from review_point_parser import (MAX_CONTINUATIONS, REVIEW_POINT_FIELDS, SalvageStats, build_continuation_input,
+                                 salvage_review_points)
+from run_planner import PLAN_COMPLETION_TOKENS, plan_report, planned_call
+from telemetry import DEFAULT_METRICS_PREFIX, Telemetry
 
 os.environ['DASHSCOPE_API_KEY'] = 'sk-57056cdaa1ec49c883e585d7ce1ea3d5'
 
@@ -47,24 +58,53 @@ MODELS = {
     "qwen_turbo": "qwen-turbo"
 }
 
+# 每个模型的最长等待时间（秒）；超时的模型不参与本次仲裁
+MODEL_TIMEOUTS = {
+    "qwen-max": 60,
+    "qwen-plus": 45,
+    "qwen-turbo": 30
+}
+
+TEMPERATURE = 0.5
+llm_cache = LLMCache()
+hedger = Hedger()  # 超过该模型滚动 p95 仍未返回时再发一个副本，先返回者胜出
+telemetry = Telemetry(script="multi_agent_audit_system")
+
 def call_dashscope(model: str, prompt: str) -> str:
-    """调用 DashScope 原生 API"""
+    """调用 DashScope 原生 API（相同模型 + temperature + prompt 直接复用缓存）"""
+    cached = llm_cache.get(model, TEMPERATURE, prompt)
+    if cached is not None:
+        telemetry.record_call(model, estimate_tokens(prompt), estimate_tokens(cached), 0.0, cache_hit=True)
+        return cached
+    started = time.monotonic()
     try:
-        response = Generation.call(
-            model=model,
+        answered, response = hedger.call(model, lambda target_model: Generation.call(
+            model=target_model,
             prompt=prompt,
             api_key=DASHSCOPE_API_KEY,
-            temperature=0.5,
+            temperature=TEMPERATURE,
             max_tokens=800,
-            timeout=60
-        )
+            timeout=MODEL_TIMEOUTS.get(target_model, 60)
+        ))
+        usage = getattr(response, "usage", None)
+        prompt_tokens = getattr(usage, "input_tokens", None) if usage else None
+        completion_tokens = getattr(usage, "output_tokens", None) if usage else None
         if response.status_code == 200:
-            return response.output.text
+            text = response.output.text
+            # 对冲副本胜出时缓存和遥测记在实际回复的模型名下
+            telemetry.record_call(answered, prompt_tokens or estimate_tokens(prompt),
+                                  completion_tokens or estimate_tokens(text), time.monotonic() - started,
+                                  tokens_estimated=prompt_tokens is None)
+            llm_cache.put(answered, TEMPERATURE, prompt, text)
+            return text
         else:
-            print(f"❌ API 错误 ({model}): {response.code} - {response.message}")
+            print(f"❌ API 错误 ({answered}): {response.code} - {response.message}")
+            telemetry.record_call(answered, estimate_tokens(prompt), 0, time.monotonic() - started,
+                                  error=f"HTTP {response.status_code}: {response.code}")
             return ""
     except Exception as e:
         print(f"⚠️ 调用失败 ({model}): {e}")
+        telemetry.record_call(model, estimate_tokens(prompt), 0, time.monotonic() - started, error=repr(e))
         return ""
 
 # ================== ReAct Prompt（简化版，不依赖 LangChain） ==================
@@ -87,8 +127,121 @@ Action Input: {{"review_points": [{{"type": "...", "question": "...", "evidence"
 Question: {input_text}
 """
 
+# ================== 多模型并发调用 ==================
+def call_models_concurrently(prompt: str, models: Dict[str, str]) -> Dict[str, List[Dict]]:
+    """同一 prompt 并发发给多个模型，各模型按自己的超时截止（含截断后的续写）；
+    返回 {name: 审核点列表}（只含按时且非空返回的模型；续写超时的模型保留已解析出的点）。
+    解析在调用线程内完成，遥测记录才能带上解析结果"""
+    executor = ThreadPoolExecutor(max_workers=len(models))
+    started = time.monotonic()
+    partials: Dict[str, List[Dict]] = {name: [] for name in models}
+    # 每个任务复制当前 contextvars，调用记录带上 target 标签
+    futures = {name: executor.submit(contextvars.copy_context().run, call_and_salvage, name, model, prompt,
+                                     partials[name])
+               for name, model in models.items()}
+    outputs = {}
+    try:
+        for name, future in futures.items():
+            deadline = started + MODEL_TIMEOUTS.get(models[name], 60)
+            try:
+                outputs[name] = future.result(timeout=max(0.0, deadline - time.monotonic()))
+            except FutureTimeoutError:
+                if partials[name]:
+                    print(f"⏰ {name} 续写超时（{MODEL_TIMEOUTS.get(models[name], 60)}s），保留已解析的 "
+                          f"{len(partials[name])} 条")
+                    outputs[name] = list(partials[name])
+                else:
+                    print(f"⏰ {name} 超时（{MODEL_TIMEOUTS.get(models[name], 60)}s），跳过")
+    finally:
+        # 不等待超时的线程；其结果被丢弃
+        executor.shutdown(wait=False, cancel_futures=True)
+    return {name: points for name, points in outputs.items() if points}
+
+def call_and_salvage(name: str, model: str, prompt: str, points: List[Dict]) -> List[Dict]:
+    """调用并容错解析；被 max_tokens 截断时只续写剩余部分，不整段重新生成。
+    points 由调用方传入并就地追加，超时时调用方仍能拿到已解析的部分"""
+    raw_output = call_dashscope(model, prompt)
+    if not raw_output:
+        return points
+    result = salvage_react_output(raw_output)
+    points.extend(dict(item, source_model=name) for item in result["items"])
+    for attempt in range(1, MAX_CONTINUATIONS + 1):
+        if result["complete"] or not points:
+            break
+        salvage_stats.record_continuation()
+        print(f"✂️  {name} 输出在第 {len(points)} 条后截断，请求续写（第 {attempt} 次）")
+        raw_output = call_dashscope(model, build_continuation_input(prompt, points))
+        if not raw_output:
+            break
+        result = salvage_react_output(raw_output)
+        points.extend(dict(item, source_model=name) for item in result["items"])
+    return points
+
+REACT_FIELDS = REVIEW_POINT_FIELDS + ("source_section_id",)
+salvage_stats = SalvageStats()
+
+def salvage_react_output(raw_output: str) -> Dict:
+    """从 ReAct 输出最后一个 Action Input 之后容错解析 review_points（修复格式、截断时保留完整元素）"""
+    start = raw_output.rfind("Action Input:")
+    result = salvage_review_points(raw_output[start:] if start >= 0 else raw_output, REACT_FIELDS)
+    salvage_stats.record(result)
+    telemetry.record_parse(result["status"])
+    return result
+
+# ================== 仲裁 ==================
+# adaptive 模式：先跑两个便宜模型，仅在分歧大或覆盖不足时再调用 qwen-max
+CHEAP_MODELS = ["qwen_turbo", "qwen_plus"]
+EXPENSIVE_MODEL = "qwen_max"
+ESCALATION_DISAGREEMENT = 0.2   # 只被一个便宜模型给出的点占比超过该值 → 调用 qwen-max
+MIN_CONSENSUS_POINTS = 2        # 两个便宜模型一致的点少于该数（覆盖不足） → 调用 qwen-max
+
+arbitration_stats = {"targets": 0, "expensive_calls": 0}
+
+PROMPT_VERSION = "v1"  # 修改 build_react_prompt 后请递增（参与 review_id 计算）
+
+def vote(outputs: Dict[str, List[Dict]]) -> List[Dict]:
+    """跨模型近似去重（MinHash/LSH），每簇一个代表点，source_models 为簇内模型的并集"""
+    points = [dict(p, source_model=name) for name, model_points in outputs.items()
+              for p in model_points if normalize_question(p.get("question"))]
+    return merge_near_duplicates(points)
+
+def needs_escalation(cheap_outputs: Dict[str, List[Dict]]) -> bool:
+    """便宜模型缺失、分歧占比过高或一致点过少时需要 qwen-max 投票"""
+    if any(not cheap_outputs.get(name) for name in CHEAP_MODELS):
+        return True
+    unique_points = vote(cheap_outputs)
+    agreed = sum(1 for p in unique_points if len(p["source_models"]) >= 2)
+    disputed = len(unique_points) - agreed
+    return agreed < MIN_CONSENSUS_POINTS or disputed / len(unique_points) > ESCALATION_DISAGREEMENT
+
+def arbitrate(outputs: Dict[str, List[Dict]], mode: str = "full") -> List[Dict]:
+    """两个及以上模型给出的点为 required，否则 recommended；arbitration_path 记录每个点的判定路径"""
+    escalated = EXPENSIVE_MODEL in outputs
+    final_points = []
+    for p in vote(outputs):
+        p["type"] = "required" if len(p["source_models"]) >= 2 else "recommended"
+        cheap_votes = sum(1 for m in p["source_models"] if m in CHEAP_MODELS)
+        if mode == "full":
+            p["arbitration_path"] = "full"
+        elif cheap_votes >= 2:
+            p["arbitration_path"] = "cheap_consensus"
+        elif escalated:
+            p["arbitration_path"] = "escalated"
+        else:
+            p["arbitration_path"] = "cheap_single"
+        final_points.append(p)
+    return final_points
+
+def labels_by_question(points: List[Dict]) -> Dict[str, str]:
+    """簇内每个原始问题都继承代表点的标签，便于跨模式比较"""
+    return {normalize_question(q): p["type"] for p in points for q in p["merged_questions"]}
+
+def collect_outputs(full_prompt: str, models: Dict[str, str]) -> Dict[str, List[Dict]]:
+    """{name: 带 source_model 的审核点}；续写在各模型自己的任务里完成，整体耗时仍接近最慢的单个模型"""
+    return call_models_concurrently(full_prompt, models)
+
 # ================== 主流程 ==================
-def generate_audit_points(target_id: str, id_type: str = "block"):
+def build_full_prompt(target_id: str, id_type: str) -> str:
     # 1. 构建工具描述
     tools_desc = (
         "get_block_content(block_id: str): 获取 block 原文\n"
@@ -98,83 +251,156 @@ def generate_audit_points(target_id: str, id_type: str = "block"):
     # 2. 初始 Prompt
     input_text = f"为 {id_type}_id='{target_id}' 生成审核点"
     prompt = build_react_prompt(input_text, tools_desc)
-    
-    all_outputs = []
-    for name, model in MODELS.items():
-        print(f"🔍 {name} 正在生成...")
-        
-        # 模拟 ReAct 工具调用（简化：直接注入内容）
-        if id_type == "block":
-            content = get_block_content(target_id)
-            tool_output = f"Observation: {content}"
-        else:
-            content = get_section_content(target_id)
-            tool_output = f"Observation: {content}"
-        
-        # 替换 Prompt 中的工具调用
-        full_prompt = prompt + "\nThought: 获取内容\nAction: get_block_content\nAction Input: \"" + target_id + "\"\n" + tool_output
-        
-        # 调用模型
-        raw_output = call_dashscope(model, full_prompt)
-        if raw_output:
-            # 解析 JSON
-            json_match = re.search(r'Action Input:\s*({.*})', raw_output, re.DOTALL)
-            if json_match:
-                try:
-                    data = json.loads(json_match.group(1))
-                    for point in data.get("review_points", []):
-                        point["source_model"] = name
-                    all_outputs.append(data.get("review_points", []))
-                except:
-                    pass
-    
-    # 3. 仲裁（同前）
-    from collections import defaultdict
-    unique_points = {}
-    for points in all_outputs:
-        for p in points:
-            key = p["question"]
-            if key not in unique_points:
-                unique_points[key] = p
-                unique_points[key]["source_models"] = [p["source_model"]]
-            else:
-                unique_points[key]["source_models"].append(p["source_model"])
-    
-    final_points = []
-    for p in unique_points.values():
-        p["type"] = "required" if len(p["source_models"]) >= 2 else "recommended"
-        p["source_models"] = list(set(p["source_models"]))
-        final_points.append(p)
+
+    # 模拟 ReAct 工具调用（简化：直接注入内容）；内容只读取一次，所有模型共用
+    if id_type == "block":
+        content = get_block_content(target_id)
+    else:
+        content = get_section_content(target_id)
+    tool_output = f"Observation: {content}"
+    return prompt + "\nThought: 获取内容\nAction: get_block_content\nAction Input: \"" + target_id + "\"\n" + tool_output
+
+def generate_audit_points(target_id: str, run_id: str, id_type: str = "block", mode: str = "full"):
+    with telemetry.tags(block_id=target_id, block_type=id_type):
+        return _generate_audit_points(target_id, run_id, id_type, mode)
+
+def _generate_audit_points(target_id: str, run_id: str, id_type: str, mode: str):
+    started = time.monotonic()
+    full_prompt = build_full_prompt(target_id, id_type)
+
+    # 3. 并发调用模型并仲裁（只使用按时返回的结果）
+    arbitration_stats["targets"] += 1
+    if mode == "adaptive":
+        cheap = {name: MODELS[name] for name in CHEAP_MODELS}
+        print(f"🔍 {', '.join(cheap)} 并发生成中...")
+        outputs = collect_outputs(full_prompt, cheap)
+        if needs_escalation(outputs):
+            print(f"⚖️  便宜模型分歧或覆盖不足，调用 {EXPENSIVE_MODEL}...")
+            outputs.update(collect_outputs(full_prompt, {EXPENSIVE_MODEL: MODELS[EXPENSIVE_MODEL]}))
+            arbitration_stats["expensive_calls"] += 1
+    else:
+        print(f"🔍 {', '.join(MODELS)} 并发生成中...")
+        outputs = collect_outputs(full_prompt, MODELS)
+        arbitration_stats["expensive_calls"] += 1
+    print(f"⏱️  {len(outputs)} 个模型有效返回，耗时 {time.monotonic() - started:.1f}s")
+    final_points = arbitrate(outputs, mode)
+    source_hash = content_hash(full_prompt)  # prompt 中已包含原文
     
     # 4. 保存到 Neo4j（同前）
     query = """
     CREATE (:ReviewPoint {
       review_id: $review_id,
+      run_id: $run_id,
+      content_hash: $content_hash,
+      prompt_version: $prompt_version,
+      generator: 'multi_agent',
       block_id: $block_id,
       section_id: $section_id,
       type: $type,
       question: $question,
       evidence: $evidence,
       source_models: $source_models,
+      arbitration_path: $arbitration_path,
       created_at: timestamp()
     })
     """
     with driver.session() as session:
         for p in final_points:
             session.run(query, {
-                "review_id": f"RP_{p.get('source_block_id', p['source_section_id']).replace('.', '_')}_{hash(p['question']) % 10000}",
+                "review_id": make_review_id(p.get("source_block_id") or p["source_section_id"], source_hash,
+                                            PROMPT_VERSION, p["question"]),
+                "run_id": run_id,
+                "content_hash": source_hash,
+                "prompt_version": PROMPT_VERSION,
                 "block_id": p.get("source_block_id"),
                 "section_id": p["source_section_id"],
                 "type": p["type"],
                 "question": p["question"],
                 "evidence": p["evidence"],
-                "source_models": p["source_models"]
+                "source_models": p["source_models"],
+                "arbitration_path": p["arbitration_path"]
             })
+    touch_generation_run(driver, run_id)
     
     print(f"✅ 生成 {len(final_points)} 条审核点")
     return final_points
 
+def evaluate_arbitration(target_ids: List[str], id_type: str = "block"):
+    """在固定评测集上对比 full 与 adaptive：标签一致率、qwen-max 调用节省（三模型结果走缓存，不写 Neo4j）"""
+    same, total, expensive = 0, 0, 0
+    for target_id in target_ids:
+        with telemetry.tags(block_id=target_id, block_type=id_type):
+            outputs = collect_outputs(build_full_prompt(target_id, id_type), MODELS)
+        full_labels = labels_by_question(arbitrate(outputs, "full"))
+        cheap_outputs = {name: outputs.get(name, []) for name in CHEAP_MODELS}
+        if needs_escalation(cheap_outputs):
+            expensive += 1
+            adaptive_points = arbitrate(outputs, "adaptive")
+        else:
+            adaptive_points = arbitrate(cheap_outputs, "adaptive")
+        adaptive_labels = labels_by_question(adaptive_points)
+        for key, label in full_labels.items():
+            total += 1
+            same += adaptive_labels.get(key) == label
+    print(f"📊 评测 {len(target_ids)} 个目标：qwen-max 调用 {expensive}/{len(target_ids)}，"
+          f"标签一致 {same}/{total}（{same / total if total else 1:.1%}）")
+
+def plan_audit(target_ids: List[str], id_type: str = "block", mode: str = "full"):
+    """--plan：只读取原文拼 prompt，估算请求数、token、耗时和费用；adaptive 按每个目标都升级 qwen-max 估上限"""
+    started = time.monotonic()
+    completion = PLAN_COMPLETION_TOKENS["section" if id_type == "section" else "concern"]
+    calls = []
+    for target_id in target_ids:
+        full_prompt = build_full_prompt(target_id, id_type)
+        names = CHEAP_MODELS + [EXPENSIVE_MODEL] if mode == "adaptive" else list(MODELS)
+        for name in names:
+            kind = "escalation" if mode == "adaptive" and name == EXPENSIVE_MODEL else id_type
+            calls.append(planned_call(MODELS[name], kind, "", full_prompt, completion))
+    # 同一目标的模型并发调用，目标之间串行
+    plan_report(calls, concurrency=len(MODELS), title=f"审核计划（{len(target_ids)} 个目标，{mode}）")
+    print(f"   - 计划耗时 {time.monotonic() - started:.3f}s，未调用任何模型")
+
 if __name__ == "__main__":
-    points = generate_audit_points("concern_2_3_P_2_1_1_1", "block")
-    for p in points[:2]:
-        print(f"[{p['type']}] {p['question']}")
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="多模型审核点生成与仲裁")
+    parser.add_argument("target_ids", nargs="*", default=["concern_2_3_P_2_1_1_1"])
+    parser.add_argument("--id-type", choices=["block", "section"], default="block")
+    parser.add_argument("--mode", choices=["full", "adaptive"], default="full",
+                        help="adaptive：先跑 qwen-turbo/qwen-plus，分歧时再调用 qwen-max")
+    parser.add_argument("--evaluate", action="store_true", help="对 target_ids 对比 full 与 adaptive 的标签一致率")
+    parser.add_argument("--no-cache", action="store_true", help="跳过 LLM 缓存读取（仍写入新结果）")
+    parser.add_argument("--no-hedge", action="store_true", help="关闭超过 p95 时的对冲请求")
+    parser.add_argument("--plan", action="store_true", help="干跑：只估算请求数、token、耗时和费用，不调用模型")
+    parser.add_argument("--metrics", default=DEFAULT_METRICS_PREFIX, metavar="PREFIX",
+                        help="逐次调用遥测写入 PREFIX.jsonl，Prometheus 指标写入 PREFIX.prom")
+    parser.add_argument("--no-telemetry", action="store_true", help="不记录逐次调用遥测")
+    args = parser.parse_args()
+    llm_cache.bypass = args.no_cache
+    hedger.enabled = not args.no_hedge
+    telemetry.enabled = not args.no_telemetry
+    telemetry.prefix = args.metrics
+
+    if args.plan:
+        plan_audit(args.target_ids, args.id_type, args.mode)
+    elif args.evaluate:
+        evaluate_arbitration(args.target_ids, args.id_type)
+    else:
+        # 审核点写入独立批次；只覆盖指定目标，完成后不切换 latest 指针
+        run_id = start_generation_run(driver, ",".join(MODELS.values()), PROMPT_VERSION, generator="multi_agent")
+        telemetry.run_id = run_id
+        total_points = 0
+        try:
+            for target_id in args.target_ids:
+                points = generate_audit_points(target_id, run_id, args.id_type, args.mode)
+                total_points += len(points)
+                for p in points[:2]:
+                    print(f"[{p['type']}] {p['question']}")
+        except BaseException as e:
+            fail_generation_run(driver, run_id, repr(e))
+            telemetry.close()
+            raise
+        complete_generation_run(driver, run_id, total_points, switch_latest=False)
+        print(f"⚖️  qwen-max 调用 {arbitration_stats['expensive_calls']}/{arbitration_stats['targets']} 个目标")
+    salvage_stats.report()
+    hedger.report()
+    llm_cache.report()
+    telemetry.close()
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+审核点近似去重：字符 n-gram MinHash + LSH 分桶（纯 CPU，适配中文）
+- 问题先归一化（去空白和标点），再切成字符 2-gram；中文无需分词
+- 每条问题计算 NUM_PERM 个 MinHash，按 BANDS 段分桶，同桶的簇首（每簇第一条）为候选
+- 候选须通过校验才并入该簇：与簇首的精确 Jaccard 达到阈值，且两者包含的领域关键词相同
+  （“原料药粒度” 与 “原料药晶型” 这类只差关键词的问题不合并）；
+  每个成员都直接与簇首比较，不会出现 A≈B≈C 的链式合并。整体约为线性复杂度
+- 簇内选一个代表，合并 source_models / 来源 block
+"""
+import hashlib
+from typing import Callable, Dict, List, Optional
+
+from review_ids import normalize_question
+
+SHINGLE_SIZE = 2
+NUM_PERM = 64
+BANDS = 16                 # 16 段 × 4 行：估算 Jaccard 约 0.5 以上的对大概率进入同一桶
+NEAR_DUP_THRESHOLD = 0.8   # 与簇首的精确 Jaccard 达到该值视为近似重复
+# 领域关键词：两条问题包含的关键词集合不同则不合并（只差一个检测项目/研究对象的问题不是重复）
+DOMAIN_TERMS = (
+    "粒度", "粒径", "晶型", "溶解度", "比表面积", "堆密度", "流动性", "吸湿性", "性状", "鉴别",
+    "溶出", "有关物质", "杂质", "降解", "元素杂质", "亚硝胺", "致突变", "残留溶剂", "含量", "均匀度", "装量",
+    "水分", "pH", "渗透压", "可见异物", "不溶性微粒", "微生物", "无菌", "内毒素", "热原",
+    "专属性", "线性", "准确度", "精密度", "耐用性", "检测限", "定量限", "溶液稳定性",
+    "稳定性", "影响因素", "加速", "长期", "中间条件", "光照", "高温", "高湿",
+    "原料药", "辅料", "包材", "相容性", "灭菌", "处方", "工艺", "设备", "批量", "规格",
+    "参比制剂", "对照品", "质量标准", "说明书", "有效期",
+)
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+
+def _perm_params(num_perm: int):
+    params = []
+    for i in range(num_perm):
+        digest = hashlib.blake2b(f"minhash-perm-{i}".encode(), digest_size=16).digest()
+        a = int.from_bytes(digest[:8], "big") % (_MERSENNE_PRIME - 1) + 1
+        b = int.from_bytes(digest[8:], "big") % _MERSENNE_PRIME
+        params.append((a, b))
+    return params
+
+
+_PERMS = _perm_params(NUM_PERM)
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> set:
+    text = normalize_question(text)
+    if len(text) <= size:
+        return {text} if text else set()
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+def minhash(shingle_set: set) -> List[int]:
+    hashes = [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "big")
+              for s in shingle_set]
+    if not hashes:
+        return [_MAX_HASH] * NUM_PERM
+    return [min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes) for a, b in _PERMS]
+
+
+def estimated_jaccard(sig_a: List[int], sig_b: List[int]) -> float:
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / len(sig_a)
+
+
+def jaccard(a: set, b: set) -> float:
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+def domain_terms(text: str) -> frozenset:
+    return frozenset(term for term in DOMAIN_TERMS if term in text)
+
+
+def cluster_points(points: List[Dict], threshold: float = NEAR_DUP_THRESHOLD,
+                   scope: Optional[Callable[[Dict], str]] = None) -> List[List[int]]:
+    """返回按首个成员顺序排列的簇（点的下标列表）；scope 给出分组键时只在同组内聚类"""
+    questions = [p.get("question", "") for p in points]
+    shingle_sets = [shingles(q) for q in questions]
+    signatures = [minhash(s) for s in shingle_sets]
+    terms = [domain_terms(q) for q in questions]
+    rows = NUM_PERM // BANDS
+    buckets: Dict[tuple, List[int]] = {}   # 桶内只登记簇首
+    clusters: Dict[int, List[int]] = {}
+    for i, sig in enumerate(signatures):
+        group = scope(points[i]) if scope else ""
+        keys = [(group, band, tuple(sig[band * rows:(band + 1) * rows])) for band in range(BANDS)]
+        candidates = sorted({leader for key in keys for leader in buckets.get(key, ())})
+        leader = next((c for c in candidates
+                       if estimated_jaccard(signatures[c], sig) >= threshold
+                       and terms[c] == terms[i]
+                       and jaccard(shingle_sets[c], shingle_sets[i]) >= threshold), None)
+        if leader is None:
+            clusters[i] = [i]
+            for key in keys:
+                buckets.setdefault(key, []).append(i)
+        else:
+            clusters[leader].append(i)
+    return sorted(clusters.values(), key=lambda c: c[0])
+
+
+def choose_representative(members: List[Dict]) -> Dict:
+    """优先 required，其次 evidence 更完整的；并列时保留先出现的"""
+    return min(enumerate(members), key=lambda im: (im[1].get("type") != "required",
+                                                    -len(im[1].get("evidence") or ""), im[0]))[1]
+
+
+def merge_near_duplicates(points: List[Dict], threshold: float = NEAR_DUP_THRESHOLD,
+                          scope: Optional[Callable[[Dict], str]] = None) -> List[Dict]:
+    """每簇保留一个代表（副本），并写入 source_models、merged_review_ids、merged_questions、source_block_ids、cluster_size"""
+    merged = []
+    for cluster in cluster_points(points, threshold, scope):
+        members = [points[i] for i in cluster]
+        rep = dict(choose_representative(members))
+        models = []
+        for m in members:
+            for model in m.get("source_models") or ([m["source_model"]] if m.get("source_model") else []):
+                if model not in models:
+                    models.append(model)
+        if models:
+            rep["source_models"] = models
+        rep["merged_review_ids"] = [m["review_id"] for m in members if m.get("review_id")]
+        rep["merged_questions"] = [m.get("question", "") for m in members]
+        rep["source_block_ids"] = sorted({m["block_id"] for m in members if m.get("block_id")})
+        rep["cluster_size"] = len(members)
+        merged.append(rep)
+    return merged
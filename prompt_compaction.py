@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+Prompt 侧的原文压缩（只影响发送给 LLM 的文本，content_hash / 入库原文不变）
+- table：先按 rule_tiering 拼回单元格折行、划分表头和数据行，压缩为 TSV：
+  第一行 “表头<TAB>…”，之后每个数据行一行，单元格以 TAB 分隔（行结构保留）；
+  “……”等占位单元格去掉，只含占位的行并入上一行（行标签后加 “…”），
+  “原料药1 / 原料药2 / ……” 这类编号序列只保留首项并加 “…”（首项仍是原文，evidence 可定位），重复行去掉；
+  表头/数据行划分不可靠时不标注表头，每个逻辑行按数据行同样压缩
+- example：PDF 折行拼回整句，连续的 “××、××、……” 占位合并为一个 “××…”，多余空白去掉
+- 节省量按 estimate_tokens_with_whitespace 统计：PDF 表格的大量行尾空白正是要省掉的部分，
+  estimate_tokens 不计空白，会低估原文
+python prompt_compaction.py [structured_lines.json] 按 block 类型报告压缩前后的 token 数
+"""
+import re
+import sys
+from typing import Dict, List
+
+from llm_runtime import estimate_tokens_with_whitespace
+from rule_tiering import MAX_HEADER_CELL_CHARS, PLACEHOLDER_CELL, parse_table, table_logical_lines
+from run_planner import blocks_from_lines, load_structured_lines
+
+NUMBERED_CELL = re.compile(r"^(.*?\D)(\d+)$")
+FILLER_RUN = re.compile(r"(?:××|……|…)(?:\s*[、，,]\s*(?:××|……|…))+")
+SENTENCE_END = ("。", "：", ":", "；", ";", "！", "？", "）")
+
+
+def numbered_prefix(cell: str):
+    """“原料药2” → “原料药”；不是短编号单元格时返回 None"""
+    match = NUMBERED_CELL.match(cell)
+    return match.group(1) if match and len(cell) <= MAX_HEADER_CELL_CHARS else None
+
+
+def collapse_cells(cells: List[str]) -> List[str]:
+    """去掉占位单元格，相邻的同前缀编号或完全相同的单元格（规格1 规格2 ……、批号×× 批号××）只保留首项并加 “…”"""
+    collapsed: List[str] = []
+    last_prefix = None
+    for cell in cells:
+        if PLACEHOLDER_CELL.match(cell):
+            if collapsed and not collapsed[-1].endswith("…"):
+                collapsed[-1] += "…"
+            continue
+        prefix = numbered_prefix(cell)
+        if (prefix and prefix == last_prefix) or (collapsed and collapsed[-1].rstrip("…") == cell):
+            if not collapsed[-1].endswith("…"):
+                collapsed[-1] += "…"
+            continue
+        last_prefix = prefix
+        collapsed.append(cell)
+    return collapsed
+
+
+def compact_rows(rows: List[List[str]]) -> List[List[str]]:
+    """数据行：占位行并入上一行，同前缀编号的相邻行（原料药1、原料药2）只保留首行，完全相同的行去重"""
+    compacted: List[List[str]] = []
+    seen = set()
+    last_prefix = None
+    for row in rows:
+        cells = collapse_cells(row)
+        prefix = numbered_prefix(cells[0]) if cells else None
+        if not cells or (prefix and prefix == last_prefix):
+            if compacted and not compacted[-1][0].endswith("…"):
+                compacted[-1][0] += "…"
+            continue
+        last_prefix = prefix
+        if tuple(cells) in seen:
+            continue
+        seen.add(tuple(cells))
+        compacted.append(cells)
+    return compacted
+
+
+def compact_table(content: str) -> str:
+    header, rows, reliable = parse_table(content)
+    if not reliable:
+        # 划分不可靠时不冒充表头/数据行，逐个逻辑行压缩
+        return "\n".join("\t".join(cells) for cells in compact_rows([line.split() for line in table_logical_lines(content)]))
+    lines = ["表头\t" + "\t".join(collapse_cells(header))] if header else []
+    lines.extend("\t".join(cells) for cells in compact_rows(rows))
+    return "\n".join(lines)
+
+
+def normalize_example(content: str) -> str:
+    merged = []
+    for line in content.splitlines():
+        line = re.sub(r"\s+", " ", line).strip()
+        if not line:
+            continue
+        if merged and not merged[-1].endswith(SENTENCE_END):
+            merged[-1] += line  # PDF 折行
+        else:
+            merged.append(line)
+    return "\n".join(FILLER_RUN.sub("××…", line) for line in merged)
+
+
+def compact_block_content(block_type: str, content: str) -> str:
+    if block_type == "table":
+        compacted = compact_table(content)
+    elif block_type == "example":
+        compacted = normalize_example(content)
+    else:
+        return content
+    # 压缩失败（如表格全是占位）时保留原文
+    return compacted if compacted.strip() else content
+
+
+def compaction_report(blocks: List[Dict]):
+    if not blocks:
+        print("🗜️  Prompt 原文压缩：没有 block")
+        return
+    totals: Dict[str, List[int]] = {}
+    for block in blocks:
+        compacted = compact_block_content(block["block_type"], block["content"])
+        counts = totals.setdefault(block["block_type"], [0, 0, 0])
+        counts[0] += 1
+        counts[1] += estimate_tokens_with_whitespace(block["content"])
+        counts[2] += estimate_tokens_with_whitespace(compacted)
+    print("🗜️  Prompt 原文压缩（估算 token，含空白）：")
+    for block_type, (n, before, after) in sorted(totals.items()):
+        saved = 1 - after / before if before else 0
+        print(f"   - {block_type}: {n} 个 block，{before} → {after} tokens（-{saved:.0%}）")
+
+
+if __name__ == "__main__":
+    compaction_report(blocks_from_lines(load_structured_lines(sys.argv[1] if len(sys.argv) > 1 else "structured_lines.json")))
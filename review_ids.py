@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+"""
+内容寻址的审核点 ID
+review_id = RP_<来源ID>_<sha256(来源ID | 原文哈希 | Prompt 版本 | 归一化问题)[:16]>
+与进程无关（不依赖 Python 的随机化 hash()），跨批次稳定，可直接 diff / 复用；
+原文、Prompt 版本或问题任一变化都会得到新 ID。
+"""
+import hashlib
+import re
+
+QUESTION_NOISE_RE = re.compile(r'[\s，,。.？?！!、；;：:“”"‘’\'（）()]')
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def normalize_question(question: str) -> str:
+    """去掉空白和中英文标点，用于去重、投票和 ID 计算"""
+    return QUESTION_NOISE_RE.sub("", question or "")
+
+
+def make_review_id(source_id: str, source_hash: str, prompt_version: str, question: str) -> str:
+    payload = "\x1f".join([source_id, source_hash, prompt_version, normalize_question(question)])
+    digest = hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+    return f"RP_{source_id.replace('.', '_')}_{digest}"
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+review_points 增量解析器（流式输出用）
+模型回复形如 {"review_points": [{...}, {...}]}，可能带 ```json 围栏或前后说明文字。
+ReviewPointStreamParser 逐块接收文本，在数组中每个对象闭合时立即产出该元素，
+不必等待整个回复结束；字符串内的括号、转义引号不会干扰计数。
+
+salvage_review_points：非流式回复的容错解析，不再因一处格式问题丢弃整段回复
+- 先严格解析；失败则修复常见问题（代码围栏、全角引号作 JSON 定界符、尾逗号、字符串内裸换行）再解析
+- 仍失败（多为输出被截断）时用增量解析器保留所有已闭合的元素，并标记 complete=False，
+  调用方可用 build_continuation_input 只请求剩余部分
+- 每个元素按字段校验（必填、非空字符串、type 取值，常见中文别名归一）
+"""
+import json
+import re
+import threading
+from typing import Dict, List, Optional, Sequence
+
+ARRAY_KEY_RE = re.compile(r'"review_points"\s*:\s*\[')
+KEY_LOOKBEHIND = 32  # 未找到数组起点时保留的尾部长度，防止 key 被切在两个 chunk 之间
+REVIEW_POINT_FIELDS = ("type", "question", "evidence")
+REVIEW_POINT_TYPES = ("required", "recommended")
+TYPE_ALIASES = {"必需": "required", "必须": "required", "强制": "required", "建议": "recommended", "推荐": "recommended"}
+MAX_CONTINUATIONS = 2  # 截断后最多续写的次数
+FENCE_RE = re.compile(r"```(?:json)?", re.IGNORECASE)
+FULLWIDTH_OPEN_RE = re.compile(r'([{\[,:]\s*)[“”]')
+FULLWIDTH_CLOSE_RE = re.compile(r'[“”](\s*[:,}\]])')
+
+
+class ReviewPointStreamParser:
+    def __init__(self):
+        self.buffer = ""
+        self.pos = 0
+        self.state = "seek"  # seek → array → done
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.item_start = None
+        self.items_parsed = 0
+        self.items_failed = 0
+
+    def feed(self, chunk: str) -> List[Dict]:
+        """追加一段文本，返回本次新闭合的数组元素"""
+        self.buffer += chunk
+        completed = []
+        while self.state != "done" and self.pos < len(self.buffer):
+            if self.state == "seek":
+                match = ARRAY_KEY_RE.search(self.buffer, self.pos)
+                if not match:
+                    self.pos = max(self.pos, len(self.buffer) - KEY_LOOKBEHIND)
+                    break
+                self.state = "array"
+                self.pos = match.end()
+                continue
+
+            c = self.buffer[self.pos]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif c == "\\":
+                    self.escape = True
+                elif c == '"':
+                    self.in_string = False
+            elif c == '"':
+                self.in_string = True
+            elif c == "{":
+                if self.depth == 0:
+                    self.item_start = self.pos
+                self.depth += 1
+            elif c == "}":
+                self.depth -= 1
+                if self.depth == 0 and self.item_start is not None:
+                    item = self._load(self.buffer[self.item_start:self.pos + 1])
+                    if item is not None:
+                        completed.append(item)
+                    self.item_start = None
+            elif c == "]" and self.depth == 0:
+                self.state = "done"
+            self.pos += 1
+        return completed
+
+    def _load(self, text: str):
+        try:
+            item = json.loads(text)
+        except json.JSONDecodeError:
+            self.items_failed += 1
+            return None
+        if not isinstance(item, dict):
+            return None
+        self.items_parsed += 1
+        return item
+
+
+# ================== 容错解析 ==================
+def repair_json(text: str) -> str:
+    """修复常见格式问题；只在定界符位置替换全角引号，字符串内容里的中文引号保持不变"""
+    text = FENCE_RE.sub("", text)
+    text = FULLWIDTH_OPEN_RE.sub(r'\1"', text)
+    text = FULLWIDTH_CLOSE_RE.sub(r'"\1', text)
+    out: List[str] = []
+    in_string = escape = False
+    for c in text:
+        if in_string:
+            if escape:
+                escape = False
+            elif c == "\\":
+                escape = True
+            elif c == '"':
+                in_string = False
+            elif c == "\n":
+                out.append("\\n")
+                continue
+        elif c == '"':
+            in_string = True
+        elif c in "}]":
+            j = len(out) - 1
+            while j >= 0 and out[j].isspace():
+                j -= 1
+            if j >= 0 and out[j] == ",":
+                del out[j]  # 尾逗号
+        out.append(c)
+    return "".join(out)
+
+
+def validate_review_item(item, required_fields: Sequence[str] = REVIEW_POINT_FIELDS) -> Optional[Dict]:
+    """字段校验并归一，不合格返回 None"""
+    if not isinstance(item, dict):
+        return None
+    item = dict(item)
+    for field in required_fields:
+        value = item.get(field)
+        if not isinstance(value, str) or not value.strip():
+            return None
+        item[field] = value.strip()
+    if "type" in item:
+        point_type = TYPE_ALIASES.get(item["type"], str(item["type"]).lower())
+        if point_type not in REVIEW_POINT_TYPES:
+            return None
+        item["type"] = point_type
+    return item
+
+
+def _strict_items(text: str) -> Optional[list]:
+    match = re.search(r"\{.*\}", text, re.DOTALL)
+    if not match:
+        return None
+    try:
+        data = json.loads(match.group(0))
+    except json.JSONDecodeError:
+        return None
+    items = data.get("review_points") if isinstance(data, dict) else None
+    return items if isinstance(items, list) else None
+
+
+def salvage_review_points(raw_output: str, required_fields: Sequence[str] = REVIEW_POINT_FIELDS) -> Dict:
+    """返回 {"items": [...], "status": ok|repaired|salvaged|failed, "complete": bool, "invalid": int}"""
+    raw_output = raw_output or ""
+    repaired = repair_json(raw_output)
+    for status, text in (("ok", raw_output), ("repaired", repaired)):
+        items = _strict_items(text)
+        if items is not None:
+            valid = [v for v in (validate_review_item(i, required_fields) for i in items) if v]
+            return {"items": valid, "status": status, "complete": True, "invalid": len(items) - len(valid)}
+    parser = ReviewPointStreamParser()
+    items = parser.feed(repaired)
+    valid = [v for v in (validate_review_item(i, required_fields) for i in items) if v]
+    return {
+        "items": valid,
+        "status": "salvaged" if valid else "failed",
+        "complete": parser.state == "done",
+        "invalid": len(items) - len(valid) + parser.items_failed,
+    }
+
+
+def build_continuation_input(input_text: str, items: List[Dict]) -> str:
+    """截断后的续写请求：列出已得到的问题，只要求输出剩余部分"""
+    done = "\n".join(f"- {item['question']}" for item in items)
+    return (f"{input_text}\n\n你上一次的输出在第 {len(items)} 条审核点之后被截断，已输出的问题如下：\n{done}\n"
+            "请只输出尚未给出的其余审核点，格式仍为 {\"review_points\": [...]}；"
+            "如已全部给出，输出 {\"review_points\": []}。")
+
+
+class SalvageStats:
+    def __init__(self):
+        self.counts = {"ok": 0, "repaired": 0, "salvaged": 0, "failed": 0}
+        self.continuations = 0
+        self.lock = threading.Lock()
+
+    def record(self, result: Dict):
+        with self.lock:
+            self.counts[result["status"]] += 1
+
+    def record_continuation(self):
+        with self.lock:
+            self.continuations += 1
+
+    def report(self):
+        total = sum(self.counts.values())
+        if not total:
+            return
+        broken = total - self.counts["ok"]
+        rescued = self.counts["repaired"] + self.counts["salvaged"]
+        rate = f"{rescued / broken:.0%}" if broken else "-"
+        print(f"🩹 输出解析：{total} 次回复，{self.counts['ok']} 次直接通过，修复 {self.counts['repaired']} 次，"
+              f"部分抢救 {self.counts['salvaged']} 次（续写 {self.continuations} 次），失败 {self.counts['failed']} 次；"
+              f"抢救率 {rate}，避免整段重新生成 {rescued} 次")
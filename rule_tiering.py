@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+规则优先分层：能由模板直接推导的审核点不再调用 LLM
+- table：与 chunk_sections.generate_csvs 相同的表头模板
+  “是否提供…相关的结构化表格，且包含列：…？”，有行标签时追加“行：…”
+- concern：含“应/需/必须”的要求句直接改写为“是否…？”（排除“相应/对应/反应/无需”等非情态用法），
+  句中“（如…）”“，如…”举例分句去掉（系统 Prompt 同样不允许把举例写成审核点）
+- 表格规则覆盖率取 列覆盖、行覆盖、单元格覆盖 三者最小值：被 MAX_HEADER_COLUMNS 截掉或过长、
+  无法作为列名的表头单元格都算未覆盖；concern 为 要求句数 ÷ 总句数
+- 覆盖不足、表头/数据行划分不可靠（数据区开始后又出现表头式的行）、没有识别出数据行
+  或 block 语义丰富（示例、长段落）时交给 LLM（rule 层的点此时丢弃，避免与 LLM 输出重复）
+"""
+import re
+from typing import Dict, List, Tuple
+
+from llm_runtime import estimate_tokens
+from review_ids import content_hash, make_review_id
+
+RULES_VERSION = "rules-v3"      # 修改规则模板后请递增（参与 review_id）
+RULE_MIN_COVERAGE = 0.8         # 规则覆盖率低于该值的 block 交给 LLM
+RULE_RICH_TOKENS = 400          # 超过该长度的 concern 视为语义丰富，交给 LLM
+MAX_HEADER_COLUMNS = 5          # 与 generate_csvs 一致，问题中最多列出 5 列
+MAX_ROW_LABELS = 8              # 问题中最多列出的行标签数
+MAX_HEADER_CELL_CHARS = 15
+PLACEHOLDER_CELL = re.compile(r"^[…\.·\-—×xX、，,]*$")
+DATA_ROW_END = re.compile(r"\S\s{2,}$")
+REQUIREMENT_PATTERN = re.compile(r"(必须|(?<![相对反供适响效回感])应(?!用)|(?<![不无所])需(?!求))")
+SENTENCE_SPLIT = re.compile(r"(?<=[。；;！？])")
+EXAMPLE_CLAUSE = re.compile(r"[（(](?:例如|比如|如)[^（()）]*[)）]|[，,](?:例如|比如|如)[^，,；;。]*")
+
+
+def table_logical_lines(content: str) -> List[str]:
+    """PDF 抽取的表格：单元格内折行的行尾没有空白，单元格结束的行尾带空白。先按此把折行拼回"""
+    lines, buffer = [], ""
+    for line in content.splitlines():
+        if not line.strip():
+            continue
+        buffer += line
+        if line[-1].isspace():
+            lines.append(buffer)
+            buffer = ""
+    if buffer:
+        lines.append(buffer)
+    return lines
+
+
+def parse_table(content: str) -> Tuple[List[str], List[List[str]], bool]:
+    """返回 (表头单元格, 数据行单元格, 划分是否可靠)。数据行的空单元格在抽取结果里表现为行尾的连续空白，
+    第一个这样的行即数据区开始，之后的行都算数据行；一行内的多个单元格以空白分隔。
+    数据区开始后又出现行尾不带连续空白、且不全是占位符的行时，多半是按列抽取的表头（或跨行的行标签），
+    此时划分不可靠"""
+    header: List[str] = []
+    rows: List[List[str]] = []
+    reliable = True
+    for line in table_logical_lines(content):
+        cells = line.split()
+        if rows or DATA_ROW_END.search(line):
+            if rows and not DATA_ROW_END.search(line) and not all(PLACEHOLDER_CELL.match(c) for c in cells):
+                reliable = False
+            rows.append(cells)
+        else:
+            header.extend(cells)
+    return header, rows, reliable
+
+
+def is_label_cell(cell: str) -> bool:
+    """可作为列名/行标签的短单元格；占位符和“（版本号）”这类括注不算"""
+    return len(cell) <= MAX_HEADER_CELL_CHARS and not PLACEHOLDER_CELL.match(cell) and not cell.startswith(("（", "("))
+
+
+def requirement_sentences(content: str) -> Tuple[List[str], int]:
+    """PDF 换行会把一句话拆到多行，先拼回再按句号/分号切句。返回 (要求句, 总句数)"""
+    text = "".join(line.strip() for line in content.splitlines())
+    sentences = [s for s in SENTENCE_SPLIT.split(text) if len(s.strip("。；;！？ ")) >= 5]
+    return [s for s in sentences if REQUIREMENT_PATTERN.search(s)], len(sentences)
+
+
+def strip_examples(sentence: str) -> str:
+    """去掉“（如…）”和句中“，如…”举例分句；句首的“如…”是条件（“如…不一致，应有依据”），保留"""
+    return EXAMPLE_CLAUSE.sub("", sentence)
+
+
+def _rule_point(block: Dict, question: str, evidence: str, point_type: str) -> Dict:
+    block_hash = content_hash(block["content"])
+    return {
+        "review_id": make_review_id(block["block_id"], block_hash, RULES_VERSION, question),
+        "content_hash": block_hash,
+        "block_id": block["block_id"],
+        "section_id": block["section_id"],
+        "type": point_type,
+        "question": question,
+        "evidence": evidence[:100],
+        "generator": "rule",
+    }
+
+
+def rule_points_for_block(block: Dict) -> Tuple[List[Dict], float]:
+    """返回 (规则生成的审核点, 规则覆盖率)"""
+    if block["block_type"] == "table":
+        header, rows, reliable = parse_table(block["content"])
+        if not reliable or not rows:
+            return [], 0.0  # 只解析出表头，或表头/数据行划分不可靠时无法判断表格内容是否被规则覆盖
+        header_cells = list(dict.fromkeys(cell for cell in header if not PLACEHOLDER_CELL.match(cell)))
+        columns = [cell for cell in header_cells if is_label_cell(cell)][:MAX_HEADER_COLUMNS]
+        if len(columns) < 2:
+            return [], 0.0
+        row_heads = list(dict.fromkeys(row[0] for row in rows if not PLACEHOLDER_CELL.match(row[0])))
+        labels = [cell for cell in row_heads if is_label_cell(cell)][:MAX_ROW_LABELS]
+        total = sum(1 for cell in header + [cell for row in rows for cell in row] if not PLACEHOLDER_CELL.match(cell))
+        coverage = min(len(columns) / len(header_cells),
+                       len(labels) / len(row_heads) if row_heads else 1.0,
+                       (len(columns) + len(labels)) / total)
+        question = f"是否提供{block['section_id']}相关的结构化表格，且包含列：{'、'.join(f'‘{c}’' for c in columns)}"
+        if labels:
+            question += f"；行：{'、'.join(f'‘{label}’' for label in labels)}"
+        return [_rule_point(block, question + "？", " ".join(header), "required")], coverage
+
+    if block["block_type"] == "concern":
+        sentences, total = requirement_sentences(block["content"])
+        points = []
+        for sentence in sentences:
+            body = sentence.rstrip("。；;！？ ")
+            point_type = "recommended" if "建议" in body else "required"
+            points.append(_rule_point(block, f"是否{strip_examples(body)}？", body, point_type))
+        return points, (len(sentences) / total if total else 0.0)
+
+    return [], 0.0  # example 为填写模板，需要 LLM 理解占位含义
+
+
+def is_semantically_rich(block: Dict) -> bool:
+    return block["block_type"] == "example" or estimate_tokens(block["content"]) > RULE_RICH_TOKENS
+
+
+def tier_blocks(blocks: List[Dict], min_coverage: float = RULE_MIN_COVERAGE) -> Tuple[Dict[str, List[Dict]], List[Dict]]:
+    """返回 ({block_id: 规则审核点}（仅 rule 层）, 需要 LLM 的 block 列表)，并打印分层覆盖率"""
+    rule_results: Dict[str, List[Dict]] = {}
+    llm_blocks: List[Dict] = []
+    coverage: Dict[str, List[float]] = {"rule": [], "llm": []}
+    for block in blocks:
+        points, cov = rule_points_for_block(block)
+        if points and cov >= min_coverage and not is_semantically_rich(block):
+            rule_results[block["block_id"]] = points
+            coverage["rule"].append(cov)
+        else:
+            llm_blocks.append(block)
+            coverage["llm"].append(cov)
+    tier_report(blocks, rule_results, coverage)
+    return rule_results, llm_blocks
+
+
+def tier_report(blocks: List[Dict], rule_results: Dict[str, List[Dict]], coverage: Dict[str, List[float]]):
+    if not blocks:
+        return
+    by_type: Dict[str, List[int]] = {}
+    for block in blocks:
+        counts = by_type.setdefault(block["block_type"], [0, 0])
+        counts[0 if block["block_id"] in rule_results else 1] += 1
+    rule_count = sum(len(points) for points in rule_results.values())
+    print(f"📏 规则分层：{len(rule_results)}/{len(blocks)} 个 block 由规则直接生成（{rule_count} 条审核点），"
+          f"节省 {len(rule_results)} 次 block 级 LLM 调用")
+    for tier, values in coverage.items():
+        if values:
+            print(f"   - {tier} 层：{len(values)} 个 block，平均规则覆盖率 {sum(values) / len(values):.0%}")
+    for block_type, (rule_n, llm_n) in sorted(by_type.items()):
+        print(f"   - {block_type}: rule {rule_n} / llm {llm_n}")
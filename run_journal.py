@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+生成批次的追加写进度日志（JSONL，每个 run_id 一个文件）
+- start：批次元信息
+- block：已完成的 block、其原文哈希和清洗后的审核点（写入 Neo4j 之后才记录）
+- complete：批次完成
+崩溃后 --resume 读取日志，跳过原文未变的已完成 block，只生成剩余部分。
+最后一行可能因崩溃而不完整，读取时忽略。
+"""
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+JOURNAL_DIR = Path("run_journals")
+
+
+class RunJournal:
+    def __init__(self, run_id: str, directory: Path = JOURNAL_DIR):
+        self.run_id = run_id
+        directory.mkdir(exist_ok=True)
+        self.path = directory / f"{run_id}.jsonl"
+        self.lock = threading.Lock()
+
+    def _append(self, record: Dict):
+        record["ts"] = time.time()
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self.lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def record_start(self, model: str, prompt_version: str):
+        self._append({"event": "start", "run_id": self.run_id, "model": model, "prompt_version": prompt_version})
+
+    def record_block(self, block_id: str, block_hash: str, points: List[Dict]):
+        self._append({"event": "block", "block_id": block_id, "content_hash": block_hash, "points": points})
+
+    def record_complete(self):
+        self._append({"event": "complete"})
+
+    def read(self) -> List[Dict]:
+        if not self.path.exists():
+            return []
+        records = []
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    break  # 崩溃时写了一半的最后一行
+        return records
+
+    def completed_blocks(self) -> Dict[str, Dict]:
+        """{block_id: {"content_hash": ..., "points": [...]}}，同一 block 以最后一条为准"""
+        return {r["block_id"]: r for r in self.read() if r.get("event") == "block"}
+
+    def is_complete(self) -> bool:
+        return any(r.get("event") == "complete" for r in self.read())
+
+
+def has_unfinished_journal(run_id: str, directory: Path = JOURNAL_DIR) -> bool:
+    """批次有日志且未记录完成（--resume 可以续跑）"""
+    path = directory / f"{run_id}.jsonl"
+    return path.exists() and not RunJournal(run_id, directory).is_complete()
+
+
+def find_resumable_run(directory: Path = JOURNAL_DIR) -> Optional[str]:
+    """最近一个尚未完成的批次 run_id"""
+    if not directory.exists():
+        return None
+    for path in sorted(directory.glob("*.jsonl"), key=lambda p: p.stat().st_mtime, reverse=True):
+        journal = RunJournal(path.stem, directory)
+        if not journal.is_complete():
+            return journal.run_id
+    return None
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+--plan 干跑：不调用任何模型，估算一次运行的请求数、token、耗时和费用
+- 调用方按真实流程（规则分层、重复 block、打包、路由、map-reduce）列出将要发出的请求，
+  每个请求用 planned_call 记录模型、prompt token（CJK 感知估算）和预计输出 token
+- project_plan 按模型汇总，并结合 RPM/TPM 限流与并发数推算墙钟时间：
+  取 “总调用耗时 ÷ 并发” 与各模型限流下限中的较大者
+- 估算不含升档重试和缓存命中，实际调用数通常不高于计划值
+"""
+import json
+import math
+from typing import Dict, List, Optional
+
+from llm_runtime import DEFAULT_RATE_LIMITS, FALLBACK_RATE_LIMIT, estimate_tokens
+from model_routing import estimate_cost
+
+# 每个请求预计的输出 token（按经验值，打包请求按成员累加）
+PLAN_COMPLETION_TOKENS = {"concern": 500, "table": 300, "example": 400, "section": 1000}
+POINT_SUMMARY_TOKENS = 40       # 自底向上模式中每条子审核点摘要的 token 数
+POINTS_PER_CHILD = 4            # 自底向上模式中每个子 block / 子章节预计的审核点数
+# (首 token 延迟 秒, 输出速度 token/秒)
+MODEL_SPEED = {
+    "qwen-turbo": (0.6, 80),
+    "qwen-plus": (1.0, 45),
+    "qwen-max": (2.0, 25),
+}
+
+
+def planned_call(model: str, kind: str, system_prompt: str, input_text: str, completion_tokens: int,
+                 input_tokens: Optional[int] = None) -> Dict:
+    """input_tokens 给出时不再估算 input_text（输入要到运行时才知道，如子项审核点摘要）"""
+    return {
+        "model": model,
+        "kind": kind,
+        "prompt_tokens": estimate_tokens(system_prompt) + (estimate_tokens(input_text) if input_tokens is None
+                                                           else input_tokens),
+        "completion_tokens": completion_tokens,
+    }
+
+
+def call_seconds(call: Dict) -> float:
+    first_token, speed = MODEL_SPEED.get(call["model"], MODEL_SPEED["qwen-max"])
+    return first_token + call["completion_tokens"] / speed
+
+
+def project_plan(calls: List[Dict], concurrency: int,
+                 limits: Optional[Dict[str, Dict[str, int]]] = None) -> Dict:
+    limits = dict(DEFAULT_RATE_LIMITS, **(limits or {}))
+    per_model: Dict[str, Dict] = {}
+    for call in calls:
+        stats = per_model.setdefault(call["model"], {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                                                     "seconds": 0.0, "cost": 0.0})
+        stats["calls"] += 1
+        stats["prompt_tokens"] += call["prompt_tokens"]
+        stats["completion_tokens"] += call["completion_tokens"]
+        stats["seconds"] += call_seconds(call)
+        stats["cost"] += estimate_cost(call["model"], call["prompt_tokens"], call["completion_tokens"])
+    for model, stats in per_model.items():
+        limit = limits.get(model, FALLBACK_RATE_LIMIT)
+        tokens = stats["prompt_tokens"] + stats["completion_tokens"]
+        stats["rate_floor"] = 60.0 * max(stats["calls"] / limit["rpm"], tokens / limit["tpm"])
+    busy = sum(s["seconds"] for s in per_model.values()) / max(concurrency, 1)
+    longest = max((call_seconds(c) for c in calls), default=0.0)
+    rate_floor = max((s["rate_floor"] for s in per_model.values()), default=0.0)
+    return {
+        "per_model": per_model,
+        "calls": len(calls),
+        "wall_seconds": max(busy, longest, rate_floor),
+        "rate_limited": rate_floor > max(busy, longest),
+        "cost": sum(s["cost"] for s in per_model.values()),
+    }
+
+
+def plan_report(calls: List[Dict], concurrency: int, title: str) -> Dict:
+    plan = project_plan(calls, concurrency)
+    by_kind: Dict[str, int] = {}
+    for call in calls:
+        by_kind[call["kind"]] = by_kind.get(call["kind"], 0) + 1
+    print(f"📋 {title}：{plan['calls']} 次请求，并发 {concurrency}")
+    print(f"   - 按类型：{', '.join(f'{k} {v}' for k, v in sorted(by_kind.items())) or '无'}")
+    for model, stats in sorted(plan["per_model"].items()):
+        print(f"   - {model}: {stats['calls']} 次，prompt {stats['prompt_tokens']} + 输出 {stats['completion_tokens']} tokens，"
+              f"¥{stats['cost']:.4f}，限流下限 {stats['rate_floor']:.0f}s")
+    bound = "（受限流约束）" if plan["rate_limited"] else ""
+    print(f"   - 预计墙钟时间 {format_seconds(plan['wall_seconds'])}{bound}，估算总费用 ¥{plan['cost']:.4f}")
+    return plan
+
+
+def format_seconds(seconds: float) -> str:
+    minutes, secs = divmod(int(math.ceil(seconds)), 60)
+    return f"{minutes}m{secs:02d}s" if minutes else f"{secs}s"
+
+
+def load_structured_lines(path: str) -> List[Dict]:
+    """pdf_to_structured_lines 的输出（与 Neo4j 中 Line 节点字段一致）"""
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def blocks_from_lines(lines: List[Dict]) -> List[Dict]:
+    """按 block_id 组装 block，字段与 get_blocks_with_content 一致，按首行行号排序"""
+    blocks: Dict[str, Dict] = {}
+    for line in sorted(lines, key=lambda l: l["line_number"]):
+        if line.get("block_id") and line.get("block_type") in ("concern", "table", "example"):
+            block = blocks.setdefault(line["block_id"], {
+                "block_id": line["block_id"], "section_id": line.get("parent_section"),
+                "block_type": line["block_type"], "first_line": line["line_number"], "lines": []})
+            block["lines"].append(line["text"])
+    return [dict(b, content="\n".join(b.pop("lines"))) for b in blocks.values()]
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+超长 section 的 map-reduce 切分
+- chunk_section_lines：按子章节 + block 边界把 section 的行切成不超过 token 预算的块（map 输入）
+- reduce_points：合并各块的审核点，按归一化问题去重（任一块判为 required 则保留 required）
+"""
+from typing import Dict, List
+
+from llm_runtime import estimate_tokens
+from review_ids import normalize_question
+
+SECTION_CHUNK_TOKENS = 6000  # 单个 map 请求的原文 token 上限（qwen-max 上下文约 30k，留足输出和 prompt 余量）
+
+
+def _line_section(line: Dict) -> str:
+    path = line.get("section_path") or []
+    return path[-1] if path else (line.get("parent_section") or "")
+
+
+def split_into_units(lines: List[Dict]) -> List[Dict]:
+    """相邻且同属一个子章节、同一 block 的行合并为一个不可拆分单元（除非单元本身超预算）"""
+    units = []
+    for line in lines:
+        section = _line_section(line)
+        block_id = line.get("block_id")
+        if units and units[-1]["section"] == section and units[-1]["block_id"] == block_id:
+            units[-1]["lines"].append(line["text"])
+        else:
+            units.append({"section": section, "block_id": block_id, "lines": [line["text"]]})
+    for unit in units:
+        unit["tokens"] = estimate_tokens("\n".join(unit["lines"]))
+    return units
+
+
+def _split_oversized(unit: Dict, budget: int) -> List[Dict]:
+    """单个 block 超预算时按行切开"""
+    parts, current, tokens = [], [], 0
+    for text in unit["lines"]:
+        t = estimate_tokens(text) + 1
+        if current and tokens + t > budget:
+            parts.append(dict(unit, lines=current, tokens=tokens))
+            current, tokens = [], 0
+        current.append(text)
+        tokens += t
+    if current:
+        parts.append(dict(unit, lines=current, tokens=tokens))
+    return parts
+
+
+def chunk_section_lines(lines: List[Dict], budget: int = SECTION_CHUNK_TOKENS) -> List[Dict]:
+    """返回 [{"sections": [...], "block_ids": [...], "content": str, "tokens": int}]，子章节切换处插入【子章节】标记"""
+    units = []
+    for unit in split_into_units(lines):
+        units.extend(_split_oversized(unit, budget) if unit["tokens"] > budget else [unit])
+
+    chunks, current, tokens = [], [], 0
+    for unit in units:
+        if current and tokens + unit["tokens"] > budget:
+            chunks.append(current)
+            current, tokens = [], 0
+        current.append(unit)
+        tokens += unit["tokens"]
+    if current:
+        chunks.append(current)
+
+    result = []
+    for chunk in chunks:
+        parts, last_section = [], None
+        for unit in chunk:
+            if unit["section"] != last_section:
+                parts.append(f"【{unit['section']}】")
+                last_section = unit["section"]
+            parts.extend(unit["lines"])
+        result.append({
+            "sections": sorted({u["section"] for u in chunk}),
+            "block_ids": sorted({u["block_id"] for u in chunk if u["block_id"]}),
+            "content": "\n".join(parts),
+            "tokens": sum(u["tokens"] for u in chunk),
+        })
+    return result
+
+
+def reduce_points(chunk_points: List[List[Dict]]) -> List[Dict]:
+    """reduce：跨块去重，保持首次出现顺序"""
+    merged: Dict[str, Dict] = {}
+    for points in chunk_points:
+        for p in points:
+            key = normalize_question(p.get("question"))
+            if not key:
+                continue
+            if key not in merged:
+                merged[key] = dict(p)
+            elif p.get("type") == "required":
+                merged[key]["type"] = "required"
+    return list(merged.values())
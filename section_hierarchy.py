@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+自底向上的 section 审核清单生成
+- build_section_tree：由 Line.section_path 构建章节树
+- bottom_up_levels：按深度从叶子到根分层（同层可并发）
+- build_parent_input：父章节只接收子 block / 子章节已有审核点的摘要，不再重发原文
+  每条审核点只在其直接父节点处被摘要一次，整篇文档的 token 量随文档规模线性增长，而非乘以树深
+"""
+from typing import Dict, List, Optional
+
+SECTION_PREFIX = "2.3.P."
+SUMMARY_MAX_POINTS = 12  # 每个子节点最多摘要的审核点条数
+
+
+def build_section_tree(paths: List[List[str]], prefix: str = SECTION_PREFIX) -> Dict[str, Dict]:
+    """返回 {section_id: {"parent": str|None, "depth": int, "children": [section_id]}}"""
+    tree: Dict[str, Dict] = {}
+    for path in paths:
+        path = [p for p in (path or []) if p.startswith(prefix)]
+        for depth, section_id in enumerate(path):
+            if section_id not in tree:
+                tree[section_id] = {"parent": path[depth - 1] if depth else None, "depth": depth, "children": []}
+    for section_id, node in tree.items():
+        parent = node["parent"]
+        if parent in tree:
+            tree[parent]["children"].append(section_id)
+    for node in tree.values():
+        node["children"].sort()
+    return tree
+
+
+def bottom_up_levels(tree: Dict[str, Dict]) -> List[List[str]]:
+    """按深度倒序分层：先叶子，后根"""
+    levels: Dict[int, List[str]] = {}
+    for section_id, node in tree.items():
+        levels.setdefault(node["depth"], []).append(section_id)
+    return [sorted(levels[depth]) for depth in sorted(levels, reverse=True)]
+
+
+def summarize_points(points: List[Dict], limit: int = SUMMARY_MAX_POINTS) -> str:
+    lines = [f"- [{p['type']}] {p['question']}" for p in points[:limit]]
+    if len(points) > limit:
+        lines.append(f"- ……（另有 {len(points) - limit} 条）")
+    return "\n".join(lines)
+
+
+def build_parent_input(section_id: str, tree: Dict[str, Dict], block_ids_by_section: Dict[str, List[str]],
+                       block_points: Dict[str, List[Dict]], section_points: Dict[str, List[Dict]]) -> Optional[str]:
+    """汇总直接子 block 与直接子章节的审核点摘要；没有任何子结果时返回 None"""
+    parts = []
+    for block_id in block_ids_by_section.get(section_id, []):
+        points = block_points.get(block_id)
+        if points:
+            parts.append(f"【内容块 {block_id}】\n{summarize_points(points)}")
+    for child_id in tree[section_id]["children"]:
+        points = section_points.get(child_id)
+        if points:
+            parts.append(f"【子章节 {child_id}】\n{summarize_points(points)}")
+    if not parts:
+        return None
+    return f"以下是章节 {section_id} 下各内容块和子章节已生成的审核点摘要：\n" + "\n".join(parts)
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+逐次 LLM 调用的遥测：模型、block、prompt/输出 token、耗时、重试次数、缓存命中、解析结果
+- record_call 在调用所在线程暂存一条记录；同一线程随后的 record_parse 补上解析结果并写入 JSONL
+  （调用与解析总在同一线程：invoke_llm → salvage；多模型仲裁在各自的 worker 线程里解析）
+- 调用失败（重试耗尽、API 错误）直接以 parse_status="call_error" 写入
+- tags(...) 给当前上下文内的调用打标签（block_id / block_type / run_id 等），跨线程池时用 contextvars.copy_context
+- 运行结束：write_prometheus 写出 Prometheus 文本格式（counter + 延迟 histogram），
+  report 打印按模型、按 block 类型的 p50/p95/p99
+token 数：DashScope 原生接口取 usage；OpenAI 兼容客户端只返回文本，按 estimate_tokens 估算（tokens_estimated=true）
+"""
+import contextlib
+import contextvars
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from llm_runtime import percentile
+
+DEFAULT_METRICS_PREFIX = "llm_metrics"
+LATENCY_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+_tags: contextvars.ContextVar = contextvars.ContextVar("llm_call_tags", default={})
+
+
+class Telemetry:
+    def __init__(self, prefix: str = DEFAULT_METRICS_PREFIX, script: str = "", enabled: bool = True):
+        self.prefix = prefix
+        self.script = script
+        self.enabled = enabled
+        self.run_id: Optional[str] = None
+        self.records: List[Dict] = []
+        self.staged: Dict[int, Dict] = {}
+        self.lock = threading.Lock()
+        self._file = None
+
+    @property
+    def jsonl_path(self) -> Path:
+        return Path(f"{self.prefix}.jsonl")
+
+    @property
+    def prom_path(self) -> Path:
+        return Path(f"{self.prefix}.prom")
+
+    @contextlib.contextmanager
+    def tags(self, **tags) -> Iterator[None]:
+        token = _tags.set(dict(_tags.get(), **tags))
+        try:
+            yield
+        finally:
+            _tags.reset(token)
+
+    def record_call(self, model: str, prompt_tokens: int, completion_tokens: int, latency: float,
+                    retries: int = 0, cache_hit: bool = False, error: Optional[str] = None,
+                    tokens_estimated: bool = True, **fields):
+        if not self.enabled:
+            return
+        tags = _tags.get()
+        record = {
+            "ts": round(time.time(), 3),
+            "script": self.script,
+            "run_id": tags.get("run_id", self.run_id),
+            "model": model,
+            "block_id": tags.get("block_id"),
+            "block_type": tags.get("block_type"),
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "tokens_estimated": tokens_estimated,
+            "latency_seconds": round(latency, 4),
+            "retries": retries,
+            "cache_hit": cache_hit,
+            "parse_status": None,
+            "error": error,
+        }
+        record.update({k: v for k, v in tags.items() if k not in record})
+        record.update(fields)
+        ident = threading.get_ident()
+        with self.lock:
+            previous = self.staged.pop(ident, None)
+            if previous is not None:
+                self._write(previous)  # 上一次调用没有解析（如流式中途失败），不带解析结果写入
+            if error is not None:
+                record["parse_status"] = "call_error"
+                self._write(record)
+            else:
+                self.staged[ident] = record
+
+    def record_parse(self, status: str):
+        """给当前线程最近一次调用补上解析结果（ok / repaired / salvaged / failed）"""
+        if not self.enabled:
+            return
+        with self.lock:
+            record = self.staged.pop(threading.get_ident(), None)
+            if record is not None:
+                record["parse_status"] = status
+                self._write(record)
+
+    def _write(self, record: Dict):
+        # 调用方持有 self.lock
+        self.records.append(record)
+        if self._file is None:
+            self._file = open(self.jsonl_path, "a", encoding="utf-8")
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def flush(self):
+        with self.lock:
+            for record in self.staged.values():
+                self._write(record)
+            self.staged.clear()
+
+    def close(self):
+        """写出暂存记录和 Prometheus 文件，打印汇总"""
+        if not self.enabled:
+            return
+        self.flush()
+        with self.lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        if self.records:
+            self.write_prometheus()
+            self.report()
+
+    # ================== Prometheus 文本格式 ==================
+    def write_prometheus(self):
+        counters: Dict[str, Dict[tuple, float]] = {
+            "llm_calls_total": {}, "llm_call_errors_total": {}, "llm_call_retries_total": {},
+            "llm_cache_hits_total": {}, "llm_prompt_tokens_total": {}, "llm_completion_tokens_total": {},
+        }
+        parse_outcomes: Dict[tuple, int] = {}
+        histograms: Dict[tuple, Dict] = {}
+
+        def inc(name: str, key: tuple, value: float = 1):
+            counters[name][key] = counters[name].get(key, 0) + value
+
+        for r in self.records:
+            key = (r["model"], r["block_type"] or "unknown")
+            inc("llm_calls_total", key)
+            inc("llm_call_retries_total", key, r["retries"])
+            inc("llm_prompt_tokens_total", key, r["prompt_tokens"])
+            inc("llm_completion_tokens_total", key, r["completion_tokens"])
+            if r["error"]:
+                inc("llm_call_errors_total", key)
+            if r["cache_hit"]:
+                inc("llm_cache_hits_total", key)
+                continue
+            outcome_key = key + (r["parse_status"] or "none",)
+            parse_outcomes[outcome_key] = parse_outcomes.get(outcome_key, 0) + 1
+            hist = histograms.setdefault(key, {"buckets": [0] * len(LATENCY_BUCKETS), "sum": 0.0, "count": 0})
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if r["latency_seconds"] <= bound:
+                    hist["buckets"][i] += 1
+            hist["sum"] += r["latency_seconds"]
+            hist["count"] += 1
+
+        def labels(key: tuple, **extra) -> str:
+            pairs = {"model": key[0], "block_type": key[1], **extra}
+            return ",".join(f'{k}="{v}"' for k, v in pairs.items())
+
+        helps = {
+            "llm_calls_total": "LLM 调用次数（含缓存命中）",
+            "llm_call_errors_total": "重试耗尽或 API 错误的调用次数",
+            "llm_call_retries_total": "调用内的重试次数",
+            "llm_cache_hits_total": "缓存命中次数",
+            "llm_prompt_tokens_total": "prompt token 数",
+            "llm_completion_tokens_total": "输出 token 数",
+        }
+        lines = []
+        for name, values in counters.items():
+            lines += [f"# HELP {name} {helps[name]}", f"# TYPE {name} counter"]
+            lines += [f"{name}{{{labels(key)}}} {value:g}" for key, value in sorted(values.items())]
+        lines += ["# HELP llm_parse_outcomes_total 解析结果（缓存命中除外）", "# TYPE llm_parse_outcomes_total counter"]
+        lines += [f"llm_parse_outcomes_total{{{labels(key[:2], status=key[2])}}} {value}"
+                  for key, value in sorted(parse_outcomes.items())]
+        lines += ["# HELP llm_call_latency_seconds 调用耗时（含重试，缓存命中除外）",
+                  "# TYPE llm_call_latency_seconds histogram"]
+        for key, hist in sorted(histograms.items()):
+            for bound, count in zip(LATENCY_BUCKETS, hist["buckets"]):
+                lines.append(f"llm_call_latency_seconds_bucket{{{labels(key, le=f'{bound:g}')}}} {count}")
+            lines.append(f"llm_call_latency_seconds_bucket{{{labels(key, le='+Inf')}}} {hist['count']}")
+            lines.append(f"llm_call_latency_seconds_sum{{{labels(key)}}} {hist['sum']:.4f}")
+            lines.append(f"llm_call_latency_seconds_count{{{labels(key)}}} {hist['count']}")
+        self.prom_path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+    # ================== 运行汇总 ==================
+    def report(self):
+        print(f"📡 LLM 调用遥测：{len(self.records)} 次调用 → {self.jsonl_path}、{self.prom_path}")
+        for title, field in (("按模型", "model"), ("按 block 类型", "block_type")):
+            print(f"   {title}：")
+            groups: Dict[str, List[Dict]] = {}
+            for r in self.records:
+                groups.setdefault(r[field] or "unknown", []).append(r)
+            for name, records in sorted(groups.items()):
+                live = [r["latency_seconds"] for r in records if not r["cache_hit"]]
+                hits = sum(1 for r in records if r["cache_hit"])
+                errors = sum(1 for r in records if r["error"])
+                retries = sum(r["retries"] for r in records)
+                parse_failed = sum(1 for r in records if r["parse_status"] == "failed")
+                tokens = sum(r["prompt_tokens"] + r["completion_tokens"] for r in records)
+                print(f"   - {name}: {len(records)} 次（缓存 {hits}，重试 {retries}，失败 {errors}，解析失败 {parse_failed}），"
+                      f"p50 {percentile(live, 50):.2f}s，p95 {percentile(live, 95):.2f}s，p99 {percentile(live, 99):.2f}s，"
+                      f"{tokens} tokens")
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+"""
+block 生成任务的租约式工作队列（多进程 / 多主机 worker 共享）
+- WorkQueue：抽象接口（enqueue / lease / heartbeat / complete / fail / counts / dead_letters / requeue_dead），
+  可替换为 Redis、数据库等实现
+- SQLiteWorkQueue：本地实现。lease 在 BEGIN IMMEDIATE 事务内取一个排队中或租约已过期的任务，
+  多个进程同时领取也不会重复；同一文件放在共享盘上即可跨主机（需文件锁可靠的文件系统）
+- 租约：每次领取生成新的 lease_token，heartbeat / complete / fail 都以该 token 为条件；
+  worker 领取后须定期续约，进程崩溃、租约过期的任务会被其他 worker 重新领取（旧 token 随即失效）
+- 完成：complete 先按 token 把任务置为 committing（此后不会被重新领取），成功后才执行调用方的写入，
+  写完置为 done；写入中途崩溃的任务在租约过期后重新领取，写入须幂等（先删后写）
+- 重试：失败按指数退避重新排队；累计尝试达到 max_attempts 后进入死信（status=dead），不再领取
+队列名一般用 run_id，一个文件可同时承载多个批次（多份申报资料）。
+"""
+import abc
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+DEFAULT_QUEUE_PATH = Path("work_queue.sqlite3")
+LEASE_SECONDS = 180          # 单个作业的生成（含重试、升档）通常远小于该值
+MAX_ATTEMPTS = 3
+RETRY_BASE_DELAY = 5.0       # 失败后重新排队的退避基数（秒）
+RETRY_MAX_DELAY = 120.0
+
+
+class WorkQueue(abc.ABC):
+    """工作队列接口；任务为 {"queue", "job_id", "payload", "attempts", "lease_token"}"""
+
+    @abc.abstractmethod
+    def enqueue(self, queue: str, jobs: List[Tuple[str, Dict]]) -> int:
+        """重复入队同一 (queue, job_id) 须被忽略；返回新入队的任务数"""
+
+    @abc.abstractmethod
+    def lease(self, worker_id: str, queue: Optional[str] = None,
+              lease_seconds: float = LEASE_SECONDS) -> Optional[Dict]:
+        """领取一个任务并生成新的 lease_token；没有可领取的任务时返回 None"""
+
+    @abc.abstractmethod
+    def heartbeat(self, queue: str, job_id: str, lease_token: str, lease_seconds: float = LEASE_SECONDS) -> bool:
+        """续约；返回 False 表示租约已被收回"""
+
+    @abc.abstractmethod
+    def complete(self, queue: str, job_id: str, lease_token: str,
+                 commit: Optional[Callable[[], None]] = None) -> bool:
+        """租约仍有效时执行 commit（结果写入）并标记完成；租约已失效时不执行 commit，返回 False"""
+
+    @abc.abstractmethod
+    def fail(self, queue: str, job_id: str, lease_token: str, error: str) -> str:
+        """返回任务的新状态：queued / dead，租约已失效时为 lost"""
+
+    @abc.abstractmethod
+    def counts(self, queue: Optional[str] = None) -> Dict[str, int]:
+        """各状态的任务数（queued / leased / committing / done / dead）"""
+
+    @abc.abstractmethod
+    def dead_letters(self, queue: str) -> List[Dict]:
+        """死信任务及最后一次错误"""
+
+    @abc.abstractmethod
+    def requeue_dead(self, queue: str) -> int:
+        """把死信重新排队，返回任务数"""
+
+
+class SQLiteWorkQueue(WorkQueue):
+    def __init__(self, path: Path = DEFAULT_QUEUE_PATH, max_attempts: int = MAX_ATTEMPTS):
+        self.path = Path(path)
+        self.max_attempts = max_attempts
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA busy_timeout=30000")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                queue TEXT NOT NULL,
+                job_id TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                lease_owner TEXT,
+                lease_token TEXT,
+                lease_expires REAL,
+                available_at REAL NOT NULL,
+                last_error TEXT,
+                updated_at REAL NOT NULL,
+                UNIQUE (queue, job_id)
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (queue, status, available_at)")
+
+    def _transaction(self, fn):
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn()
+                self.conn.execute("COMMIT")
+                return result
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def enqueue(self, queue: str, jobs: List[Tuple[str, Dict]]) -> int:
+        """重复入队同一 (queue, job_id) 会被忽略，入队可安全重跑"""
+        now = time.time()
+
+        def insert():
+            before = self.conn.total_changes
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO jobs (queue, job_id, payload, available_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                [(queue, job_id, json.dumps(payload, ensure_ascii=False), now, now) for job_id, payload in jobs])
+            return self.conn.total_changes - before
+
+        return self._transaction(insert)
+
+    def lease(self, worker_id: str, queue: Optional[str] = None,
+              lease_seconds: float = LEASE_SECONDS) -> Optional[Dict]:
+        def take():
+            now = time.time()
+            # 尝试次数已用完、租约又过期的任务（worker 多次崩溃在同一任务上）直接进死信
+            self.conn.execute(
+                "UPDATE jobs SET status = 'dead', last_error = coalesce(last_error, 'lease expired'), updated_at = ? "
+                "WHERE status IN ('leased', 'committing') AND lease_expires < ? AND attempts >= ? "
+                "AND (? IS NULL OR queue = ?)",
+                (now, now, self.max_attempts, queue, queue))
+            # committing 且租约过期：写入中途崩溃，重新领取后重写（写入幂等）
+            row = self.conn.execute(
+                "SELECT seq, queue, job_id, payload, attempts FROM jobs "
+                "WHERE (status = 'queued' OR (status IN ('leased', 'committing') AND lease_expires < ?)) "
+                "AND available_at <= ? AND (? IS NULL OR queue = ?) ORDER BY seq LIMIT 1",
+                (now, now, queue, queue)).fetchone()
+            if row is None:
+                return None
+            seq, job_queue, job_id, payload, attempts = row
+            token = uuid.uuid4().hex
+            self.conn.execute(
+                "UPDATE jobs SET status = 'leased', lease_owner = ?, lease_token = ?, lease_expires = ?, "
+                "attempts = attempts + 1, updated_at = ? WHERE seq = ?",
+                (worker_id, token, now + lease_seconds, now, seq))
+            return {"queue": job_queue, "job_id": job_id, "payload": json.loads(payload), "attempts": attempts + 1,
+                    "lease_token": token}
+
+        return self._transaction(take)
+
+    def heartbeat(self, queue: str, job_id: str, lease_token: str, lease_seconds: float = LEASE_SECONDS) -> bool:
+        """续约；返回 False 表示租约已被收回（过期后被其他 worker 领取）"""
+        now = time.time()
+        with self.lock:
+            cursor = self.conn.execute(
+                "UPDATE jobs SET lease_expires = ?, updated_at = ? "
+                "WHERE queue = ? AND job_id = ? AND status IN ('leased', 'committing') AND lease_token = ?",
+                (now + lease_seconds, now, queue, job_id, lease_token))
+            return cursor.rowcount == 1
+
+    def complete(self, queue: str, job_id: str, lease_token: str,
+                 commit: Optional[Callable[[], None]] = None) -> bool:
+        """leased → committing（token 一致且租约未过期）→ 执行 commit → done。
+        commit 抛异常时任务退回 leased 并向上抛出，由调用方 fail"""
+        def claim():
+            now = time.time()
+            return self.conn.execute(
+                "UPDATE jobs SET status = 'committing', updated_at = ? "
+                "WHERE queue = ? AND job_id = ? AND status = 'leased' AND lease_token = ? AND lease_expires >= ?",
+                (now, queue, job_id, lease_token, now)).rowcount == 1
+
+        if not self._transaction(claim):
+            return False
+        try:
+            if commit is not None:
+                commit()
+        except BaseException:
+            self._transition(queue, job_id, lease_token, "committing", "leased")
+            raise
+        return self._transition(queue, job_id, lease_token, "committing", "done")
+
+    def _transition(self, queue: str, job_id: str, lease_token: str, current: str, status: str) -> bool:
+        now = time.time()
+        release = status == "done"
+        with self.lock:
+            return self.conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ?, "
+                "lease_owner = CASE WHEN ? THEN NULL ELSE lease_owner END, "
+                "lease_token = CASE WHEN ? THEN NULL ELSE lease_token END, "
+                "lease_expires = CASE WHEN ? THEN NULL ELSE lease_expires END "
+                "WHERE queue = ? AND job_id = ? AND status = ? AND lease_token = ?",
+                (status, now, release, release, release, queue, job_id, current, lease_token)).rowcount == 1
+
+    def fail(self, queue: str, job_id: str, lease_token: str, error: str) -> str:
+        """返回任务的新状态：queued（退避后重试）或 dead（死信）"""
+        def mark():
+            now = time.time()
+            row = self.conn.execute(
+                "SELECT attempts FROM jobs WHERE queue = ? AND job_id = ? AND status = 'leased' AND lease_token = ?",
+                (queue, job_id, lease_token)).fetchone()
+            if row is None:
+                return "lost"  # 租约已被收回，由新持有者负责
+            status = "dead" if row[0] >= self.max_attempts else "queued"
+            delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** (row[0] - 1)))
+            self.conn.execute(
+                "UPDATE jobs SET status = ?, lease_owner = NULL, lease_token = NULL, lease_expires = NULL, "
+                "available_at = ?, last_error = ?, updated_at = ? WHERE queue = ? AND job_id = ?",
+                (status, now + delay, error[:1000], now, queue, job_id))
+            return status
+
+        return self._transaction(mark)
+
+    def counts(self, queue: Optional[str] = None) -> Dict[str, int]:
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT status, count(*) FROM jobs WHERE (? IS NULL OR queue = ?) GROUP BY status",
+                (queue, queue)).fetchall()
+        counts = {"queued": 0, "leased": 0, "committing": 0, "done": 0, "dead": 0}
+        counts.update(dict(rows))
+        return counts
+
+    def dead_letters(self, queue: str) -> List[Dict]:
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT job_id, attempts, last_error FROM jobs WHERE queue = ? AND status = 'dead' ORDER BY seq",
+                (queue,)).fetchall()
+        return [{"job_id": job_id, "attempts": attempts, "last_error": error} for job_id, attempts, error in rows]
+
+    def requeue_dead(self, queue: str) -> int:
+        """把死信重新排队（修复问题后手动重放），尝试次数清零"""
+        now = time.time()
+        with self.lock:
+            return self.conn.execute(
+                "UPDATE jobs SET status = 'queued', attempts = 0, available_at = ?, updated_at = ? "
+                "WHERE queue = ? AND status = 'dead'", (now, now, queue)).rowcount
+
+
+class LeaseKeeper:
+    """with 块内后台定期续约；续约失败（租约被收回）时 lost 置为 True"""
+
+    def __init__(self, queue: WorkQueue, job: Dict, lease_seconds: float = LEASE_SECONDS):
+        self.queue = queue
+        self.job = job
+        self.lease_seconds = lease_seconds
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.lease_seconds / 3):
+            if not self.queue.heartbeat(self.job["queue"], self.job["job_id"], self.job["lease_token"],
+                                        self.lease_seconds):
+                self.lost = True
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        return False